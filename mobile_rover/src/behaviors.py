@@ -13,6 +13,7 @@ import time
 
 from cmd_vel import CmdVel
 from custom_logger import get_logger
+from messages import ConeDetectionMessage
 from geometry import normalize_th_pi
 from pub_sub import get_subscriber_cone_detections
 from utils.gps import Pose
@@ -143,19 +144,11 @@ class SearchForCone:
     def __init__(self):
         self.turn_in_place = TurnInPlace(rotation_th=math.radians(350), speed_rpm=4)
         self.cone_detections_subscriber = get_subscriber_cone_detections()
+        self.subscribers = [self.cone_detections_subscriber]
 
     def step(self, current_pose: Pose) -> tuple[CmdVel, BehaviorResult]:
-        detection = self.cone_detections_subscriber.receive_json()
-        """
-        detection = {
-            "x": 0.5295924186706543,
-            "y": 0.42527180910110474,
-            "width": 0.10086383819580078,
-            "height": 0.1837218999862671,
-            "score": 0.9829293489456177,
-            "class": 0,
-        }
-        """
+        # The robot already waited for the detections, along with the pose
+        detection = self.cone_detections_subscriber.recv_msg(block=False)  # type: ConeDetectionMessage
 
         # If we found a cone, stop turning and return success
         if detection is not None:
@@ -176,22 +169,13 @@ class SearchForCone:
 class ApproachCone:
     def __init__(self):
         self.cone_detections_subscriber = get_subscriber_cone_detections()
+        self.subscribers = [self.cone_detections_subscriber]
         self.no_detection_time = None
         self.cone_lost_timeout = 30
         self.cone_lost_jiggle_time = 5
 
     def step(self, current_pose: Pose) -> tuple[CmdVel, BehaviorResult]:
-        detection = self.cone_detections_subscriber.receive_json()
-        """
-        detection = {
-            "x": 0.5295924186706543,
-            "y": 0.42527180910110474,
-            "width": 0.10086383819580078,
-            "height": 0.1837218999862671,
-            "score": 0.9829293489456177,
-            "class": 0,
-        }
-        """
+        detection = self.cone_detections_subscriber.recv_msg(block=False)  # type: ConeDetectionMessage
 
         if detection is None:
             # First time we haven't seen a cone, set the no_detection_time
@@ -228,7 +212,7 @@ class ApproachCone:
         #   ---------------------
         #   Positive error means cone is to the left.
         #   Negative error means cone is to the right.
-        horizontal_error = 0.5 - detection["x"]
+        horizontal_error = 0.5 - detection.x
 
         if horizontal_error > 0:
             cmd_vel = CmdVel(angular_vel=0.1, linear_vel=0.1)
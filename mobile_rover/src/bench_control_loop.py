@@ -0,0 +1,94 @@
+"""
+Compare the control loop's pacing modes by their sensor -> motor command latency.
+
+A thread publishes poses at the GPS rate, timestamped when they are sent, and the robot runs
+NavToPose against them on the null motor backend. Latency is measured from a pose's timestamp to
+the motor command computed from it (MobileRobotMagellan.command_latency).
+
+    sleep: the old fixed-rate loop: step without waiting, then sleep 1 / rate
+    fixed: each step waits for the pose for one period at the most
+    event: a new pose triggers a step, capped at --max-rate, with --rate as the fallback
+"""
+
+import random
+import threading
+import time
+
+import click
+
+import pub_sub
+from behaviors import BehaviorType
+from messages import PoseMessage
+from mobile_robot_magellan import MobileRobotMagellan
+from motors import select_motor_backend
+from pub_sub import TOPIC_CMD_VEL, TOPIC_CONE_DETECTIONS, TOPIC_POSE, get_publisher_pose
+from utils.gps import Pose
+
+
+MODES = ("sleep", "fixed", "event")
+
+
+def publish_poses(publisher, pose_rate, stop_event: threading.Event):
+    # The GPS rate is not synchronized with the control loop, and jitters a little
+    while not stop_event.is_set():
+        publisher.send_msg(PoseMessage(0.0, 0.0, 0.0, timestamp=time.time()))
+        time.sleep(random.uniform(0.8, 1.2) / pose_rate)
+
+
+def run_mode(mode, rate, max_rate, duration):
+    if mode == "sleep":
+        robot = MobileRobotMagellan(period=0)
+    else:
+        robot = MobileRobotMagellan(period=1 / rate, event_driven=mode == "event", min_period=1 / max_rate)
+
+    robot.wait_for_pose()
+    robot.start_behavior(BehaviorType.NAV_TO_POSE, target_pose=Pose(1000.0, 0.0, 0.0), distance_threshold=1.0)
+    robot.pose_subscriber.drain()
+    robot.command_latency.samples.clear()
+
+    steps = 0
+    start_time = time.monotonic()
+    while time.monotonic() - start_time < duration:
+        robot.step()
+        steps += 1
+        if mode == "sleep":
+            time.sleep(1 / rate)
+
+    elapsed = time.monotonic() - start_time
+    robot.close()
+    return robot.command_latency.summary(), steps / elapsed
+
+
+@click.command()
+@click.option("-d", "--duration", default=10.0, help="Seconds per mode")
+@click.option("--pose-rate", default=10.0, help="Pose publish rate (Hz)")
+@click.option("--rate", default=10.0, help="Loop rate, and the event-driven fallback rate (Hz)")
+@click.option("--max-rate", default=50.0, help="Event-driven maximum rate (Hz)")
+def main(duration, pose_rate, rate, max_rate):
+    # Everything runs as threads of this process, on the null motor backend
+    for topic in (TOPIC_POSE, TOPIC_CMD_VEL, TOPIC_CONE_DETECTIONS):
+        pub_sub.pub_sub_transports[topic] = "inproc"
+    select_motor_backend("null")
+
+    publisher = get_publisher_pose()
+    stop_event = threading.Event()
+    publish_thread = threading.Thread(target=publish_poses, args=(publisher, pose_rate, stop_event), daemon=True)
+    publish_thread.start()
+
+    print(f"{'':>6s}  {'command latency ms':>36s}  {'steps/s':>8s}")
+    print(f"{'':>6s}  {'p50':>8s} {'p90':>8s} {'p99':>8s} {'max':>8s}  {'':>8s}")
+    for mode in MODES:
+        latency, step_rate = run_mode(mode, rate, max_rate, duration)
+        print(
+            f"{mode:>6s}  {latency['p50'] * 1e3:>8.1f} {latency['p90'] * 1e3:>8.1f} "
+            f"{latency['p99'] * 1e3:>8.1f} {latency['max'] * 1e3:>8.1f}  {step_rate:>8.1f}"
+        )
+
+    stop_event.set()
+    publish_thread.join()
+    publisher.close()
+    pub_sub.close_subscribers()
+
+
+if __name__ == "__main__":
+    main()
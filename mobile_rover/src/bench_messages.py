@@ -0,0 +1,69 @@
+"""
+Benchmark the binary message encoding against the JSON that pub_sub used to send.
+
+JSON is measured the way pyzmq's send_json / recv_json do it: json.dumps + utf-8 encode,
+and decode + json.loads.
+"""
+
+import json
+import time
+
+import click
+
+from messages import ConeDetectionMessage, GPSMessage, PoseMessage, WheelOdometryMessage, decode_message
+
+
+def sample_messages():
+    return {
+        "gps": GPSMessage(
+            37.57125784995419,
+            -122.30067882311883,
+            4.7,
+            1.2915436464758039,
+            0.2617993877991494,
+            1718000000.123,
+            1718000000.4,
+        ),
+        "pose": PoseMessage(
+            565041.2312345, 4158034.1234567, 5.123456789, timestamp=1718000000.123, covariance=[0.0123456789] * 9
+        ),
+        "pose (no covariance)": PoseMessage(565041.2312345, 4158034.1234567, 5.123456789, timestamp=1718000000.123),
+        "cone detection": ConeDetectionMessage(
+            0.5295924186706543, 0.42527180910110474, 0.10086383819580078, 0.1837218999862671, 0.9829293489456177, 0
+        ),
+        "wheel odometry": WheelOdometryMessage(
+            1718000000.123, 12.345678, -3.456789, 1.2345678, 0.98765, 0.01234, [0.0001234] * 9
+        ),
+    }
+
+
+def time_per_call(fn, count):
+    start_t = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start_t) / count * 1e6
+
+
+@click.command()
+@click.option("-n", "--count", default=50000, help="Number of encodes and decodes per measurement")
+def main(count):
+    print(f"{'':>20s}  {'bytes':>11s}  {'encode us':>15s}  {'decode us':>15s}")
+    print(f"{'':>20s}  {'json':>5s} {'bin':>5s}  {'json':>7s} {'bin':>7s}  {'json':>7s} {'bin':>7s}")
+    for name, message in sample_messages().items():
+        as_dict = message.to_dict()
+        json_bytes = json.dumps(as_dict).encode("utf8")
+        binary = message.encode()
+
+        json_encode = time_per_call(lambda: json.dumps(message.to_dict()).encode("utf8"), count)
+        binary_encode = time_per_call(message.encode, count)
+        json_decode = time_per_call(lambda: json.loads(json_bytes.decode("utf8")), count)
+        binary_decode = time_per_call(lambda: decode_message(binary), count)
+
+        print(
+            f"{name:>20s}  {len(json_bytes):>5d} {len(binary):>5d}  "
+            f"{json_encode:>7.2f} {binary_encode:>7.2f}  {json_decode:>7.2f} {binary_decode:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark the per-update cost of the pose estimator's EKF.
+
+Run it on the Pi to check that the filter fits comfortably in its publish period
+(20 ms at 50 Hz): every period costs one motion update, plus a GPS update whenever
+a fix comes in.
+"""
+
+import math
+import random
+import time
+
+import click
+
+from messages import GPSMessage, WheelOdometryMessage
+from pose_estimator import PoseEKF
+
+
+def make_gps(rng, i):
+    return GPSMessage(
+        latitude=37.7749 + rng.gauss(0, 2e-5) + i * 1e-7,
+        longitude=-122.4194 + rng.gauss(0, 2e-5),
+        gps_accuracy=4.0,
+        heading=math.radians(rng.gauss(0, 10)),
+        heading_accuracy=math.radians(15),
+    )
+
+
+def run_update(name, update, count):
+    start_t = time.perf_counter()
+    for i in range(count):
+        update(i)
+    elapsed = time.perf_counter() - start_t
+    return {"name": name, "us_per_update": elapsed / count * 1e6, "updates_per_sec": count / elapsed}
+
+
+@click.command()
+@click.option("-n", "--count", default=20000, help="Number of updates of each kind")
+@click.option("-r", "--rate", default=50, help="Filter publish rate, to report the share of the period used")
+@click.option("-g", "--gps-rate", default=10, help="GPS fix rate")
+def main(count, rate, gps_rate):
+    rng = random.Random(0)
+    gps_messages = [make_gps(rng, i) for i in range(count)]
+    odometry_messages = [WheelOdometryMessage(i * 0.02, i * 0.01, 0.0, i * 1e-3, 0.5, 0.05) for i in range(count)]
+
+    ekf = PoseEKF()
+    ekf.update_gps(gps_messages[0])
+
+    results = [
+        run_update("predict_odometry", lambda i: ekf.predict_odometry(odometry_messages[i]), count),
+        run_update("predict_cmd_vel", lambda i: ekf.predict_cmd_vel(0.5, 0.05, 1 / rate), count),
+        run_update("update_gps", lambda i: ekf.update_gps(gps_messages[i]), count),
+        run_update("to_message", lambda i: ekf.to_message(i), count),
+    ]
+    for result in results:
+        print(f"{result['name']:>16s}: {result['us_per_update']:>7.1f} us  {result['updates_per_sec']:>9.0f} /s")
+
+    # One period: a motion update and a published pose every time, a GPS update at the GPS rate
+    costs = {result["name"]: result["us_per_update"] for result in results}
+    period_us = costs["predict_odometry"] + costs["to_message"] + costs["update_gps"] * gps_rate / rate
+    print(f"per period at {rate} Hz: {period_us:.1f} us ({period_us / (1e6 / rate) * 100:.2f}% of the period)")
+
+
+if __name__ == "__main__":
+    main()
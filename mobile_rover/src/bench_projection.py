@@ -0,0 +1,91 @@
+"""
+Benchmark the cached local projection against calling utm for every conversion.
+
+Also reports the worst position error vs utm over a square around the origin, for
+the course extent and beyond.
+"""
+
+import time
+
+import click
+import numpy as np
+import utm
+
+from utils.projection import LocalProjection
+
+
+# Survy's backyard, the first waypoint of mission.csv
+ORIGIN = (37.57125784995419, -122.30067882311883)
+
+METERS_PER_DEGREE_LAT = 111_000
+
+
+def time_per_call(fn, count):
+    start_t = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start_t) / count * 1e6
+
+
+def max_error(projection, extent, samples=41):
+    """
+    Worst forward and inverse error (m) over a square of +/- extent metres around the origin.
+    """
+    span = extent / METERS_PER_DEGREE_LAT
+    lats, lons = np.meshgrid(
+        np.linspace(-span, span, samples) + projection.origin_lat,
+        np.linspace(-span, span, samples) / np.cos(np.radians(projection.origin_lat)) + projection.origin_lon,
+    )
+    lats, lons = lats.ravel(), lons.ravel()
+
+    eastings, northings, _, _ = utm.from_latlon(
+        lats, lons, force_zone_number=projection.zone_number, force_zone_letter=projection.zone_letter
+    )
+    xs, ys = projection.to_xy_batch(lats, lons)
+    forward = np.hypot(xs - eastings, ys - northings).max()
+
+    lats2, lons2 = projection.to_latlon_batch(eastings, northings)
+    north_error = (lats2 - lats) * METERS_PER_DEGREE_LAT
+    east_error = (lons2 - lons) * METERS_PER_DEGREE_LAT * np.cos(np.radians(lats))
+    inverse = np.hypot(north_error, east_error).max()
+    return forward, inverse
+
+
+@click.command()
+@click.option("-n", "--count", default=20000, help="Number of conversions per measurement")
+def main(count):
+    projection = LocalProjection(*ORIGIN)
+    rng = np.random.default_rng(0)
+    lats = ORIGIN[0] + rng.uniform(-0.002, 0.002, count)
+    lons = ORIGIN[1] + rng.uniform(-0.002, 0.002, count)
+    xs, ys = projection.to_xy_batch(lats, lons)
+    lat_list, lon_list, x_list, y_list = lats.tolist(), lons.tolist(), xs.tolist(), ys.tolist()
+
+    print(f"Per point, {count} points around {ORIGIN}")
+    results = {
+        "utm.from_latlon": time_per_call(lambda i: utm.from_latlon(lat_list[i], lon_list[i]), count),
+        "to_xy": time_per_call(lambda i: projection.to_xy(lat_list[i], lon_list[i]), count),
+        "utm.to_latlon": time_per_call(lambda i: utm.to_latlon(x_list[i], y_list[i], 10, "S"), count),
+        "to_latlon": time_per_call(lambda i: projection.to_latlon(x_list[i], y_list[i]), count),
+    }
+
+    start_t = time.perf_counter()
+    projection.to_xy_batch(lats, lons)
+    results["to_xy_batch"] = (time.perf_counter() - start_t) / count * 1e6
+    start_t = time.perf_counter()
+    projection.to_latlon_batch(xs, ys)
+    results["to_latlon_batch"] = (time.perf_counter() - start_t) / count * 1e6
+
+    for name, us in results.items():
+        print(f"{name:>16s}: {us:>8.3f} us")
+    print(f"forward speedup: {results['utm.from_latlon'] / results['to_xy']:.1f}x (scalar)")
+    print(f"inverse speedup: {results['utm.to_latlon'] / results['to_latlon']:.1f}x (scalar)")
+
+    print("Worst error vs utm")
+    for extent in (100, 500, 1000, 5000):
+        forward, inverse = max_error(projection, extent)
+        print(f"  +/- {extent:>4d} m: forward {forward * 1e3:.4f} mm, inverse {inverse * 1e3:.4f} mm")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Compare the pub_sub transports (inproc, ipc, tcp) for the GPS and pose topics.
+
+- latency: one-way publish -> receive time of paced messages, publisher and subscriber
+  threads in this process, so both ends read the same clock
+- throughput: messages per second received from a burst of back-to-back sends
+
+Subscribers do not conflate here, so every message is counted. The benchmarks use bench endpoints
+(see get_endpoint), so they can run next to the robot without touching its topics.
+"""
+
+import threading
+import time
+
+import click
+
+from messages import GPSMessage, PoseMessage
+from pub_sub import Publisher, Subscriber, TOPIC_GPS, TOPIC_POSE, TRANSPORTS, get_endpoint
+from utils.stats import SampleStats
+
+
+SAMPLE_MESSAGES = {
+    TOPIC_GPS: GPSMessage(37.57125784995419, -122.30067882311883, 4.7, 1.29, 0.26, 1718000000.123, 1718000000.4),
+    TOPIC_POSE: PoseMessage(565041.23, 4158034.12, 5.12, timestamp=1718000000.123, covariance=[0.01] * 9),
+}
+
+
+def connect(topic, transport):
+    """
+    A publisher and a non-conflating subscriber on the bench endpoint of a topic, with the subscription
+    gone through and nothing queued.
+    """
+    endpoint = get_endpoint(topic, transport, bench=True)
+    publisher = Publisher(endpoint)
+    subscriber = Subscriber(endpoint, timeout=1000, conflate=False)
+
+    # Slow joiner: publish until the subscription has gone through
+    message = SAMPLE_MESSAGES[topic]
+    while True:
+        publisher.send_msg(message)
+        if subscriber.socket.poll(10):
+            break
+    while subscriber.socket.poll(50):
+        subscriber.socket.recv()
+
+    return publisher, subscriber
+
+
+def run_latency(publisher, subscriber, message, count, interval):
+    latency = SampleStats(maxlen=count)
+    send_times = [0.0] * count
+
+    def receive():
+        for i in range(count):
+            data = subscriber.socket.recv()
+            latency.add(time.perf_counter() - send_times[int.from_bytes(data[-4:], "big")])
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    payload = message.encode()
+    for i in range(count):
+        send_times[i] = time.perf_counter()
+        publisher.socket.send(payload + i.to_bytes(4, "big"))
+        time.sleep(interval)
+    receiver.join()
+
+    return latency
+
+
+def run_throughput(publisher, subscriber, message, count):
+    """
+    Messages per second delivered, and the share of the burst that was delivered. PUB sockets
+    drop messages rather than block when a subscriber falls behind by more than the high water mark.
+    """
+    payload = message.encode()
+    received = 0
+    last_receive_t = None
+
+    def receive():
+        nonlocal received, last_receive_t
+        while received < count and subscriber.socket.poll(500):
+            subscriber.recv_msg()
+            received += 1
+            last_receive_t = time.perf_counter()
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    start_t = time.perf_counter()
+    for i in range(count):
+        publisher.socket.send(payload)
+    receiver.join()
+
+    if last_receive_t is None:
+        return 0.0, 0.0
+    return received / (last_receive_t - start_t), received / count
+
+
+@click.command()
+@click.option("-n", "--count", default=2000, help="Messages per latency measurement")
+@click.option("-t", "--throughput-count", default=50000, help="Messages per throughput measurement")
+@click.option("-i", "--interval-ms", default=1.0, help="Time between latency messages")
+def main(count, throughput_count, interval_ms):
+    print(f"{'':>14s}  {'latency us':>30s}  {'throughput':>20s}")
+    print(f"{'':>14s}  {'p50':>7s} {'p90':>7s} {'p99':>7s} {'max':>6s}  {'msg/s':>10s} {'delivered':>9s}")
+    for topic in (TOPIC_GPS, TOPIC_POSE):
+        for transport in TRANSPORTS:
+            publisher, subscriber = connect(topic, transport)
+            message = SAMPLE_MESSAGES[topic]
+
+            latency = run_latency(publisher, subscriber, message, count, interval_ms / 1000).summary()
+            throughput, delivered = run_throughput(publisher, subscriber, message, throughput_count)
+            print(
+                f"{topic + ' ' + transport:>14s}  {latency['p50'] * 1e6:>7.1f} {latency['p90'] * 1e6:>7.1f} "
+                f"{latency['p99'] * 1e6:>7.1f} {latency['max'] * 1e6:>6.0f}  {throughput:>10.0f} {delivered:>9.0%}"
+            )
+
+            subscriber.close()
+            publisher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Find the message rate the data logger keeps up with, and the CPU it uses to do so.
+
+A publisher process sends a mix of GPS, pose, wheel odometry and velocity command messages at increasing
+rates over ipc for a few seconds each. The recorder under test runs in this process:
+
+- recorder: data_logger.Recorder, one loop, compressed chunks written in batches
+- json: the previous logger, one thread per topic, each message decoded, converted to JSON and flushed
+
+For each rate: the share of the messages recorded (PUB sockets drop messages when the subscriber falls
+behind by more than the high water mark) and the recorder's CPU time as a share of one core. The topics
+are published on bench endpoints (see get_endpoint), away from the robot's.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import click
+
+from data_logger import Recorder
+from message_log import RECORDING_FILENAME
+from messages import CmdVelMessage, GPSMessage, PoseMessage, WheelOdometryMessage
+from pub_sub import Publisher, Subscriber, TOPIC_CMD_VEL, TOPIC_GPS, TOPIC_POSE, TOPIC_WHEEL_ODOMETRY, get_endpoint
+
+
+SAMPLE_MESSAGES = {
+    TOPIC_GPS: GPSMessage(37.57125784995419, -122.30067882311883, 4.7, 1.29, 0.26, 1718000000.123, 1718000000.4),
+    TOPIC_POSE: PoseMessage(565041.23, 4158034.12, 5.12, timestamp=1718000000.123, covariance=[0.01] * 9),
+    TOPIC_WHEEL_ODOMETRY: WheelOdometryMessage(1718000000.123, 1.2, 3.4, 0.5, 0.3, 0.1, covariance=[0.01] * 9),
+    TOPIC_CMD_VEL: CmdVelMessage(1718000000.123, 0.5, 0.1),
+}
+
+# Time given to the subscribers to connect before publishing (s)
+JOIN_TIME = 0.5
+
+
+def publish(rate, duration, sent_queue):
+    """
+    Publish the sample messages, round robin across the topics, at `rate` messages per second in total.
+    """
+    publishers = [(Publisher(get_endpoint(topic, bench=True)), message.encode()) for topic, message in SAMPLE_MESSAGES.items()]
+    time.sleep(JOIN_TIME)
+
+    sent = 0
+    start_t = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - start_t
+        if elapsed >= duration:
+            break
+        # Catch up with the schedule, in bursts of at most 1 ms worth of messages
+        while sent < elapsed * rate:
+            publisher, payload = publishers[sent % len(publishers)]
+            publisher.socket.send(payload)
+            sent += 1
+        time.sleep(0.001)
+
+    sent_queue.put(sent)
+    time.sleep(0.2)
+    for publisher, _ in publishers:
+        publisher.close()
+
+
+def run_recorder(directory, stop_event, result):
+    recorder = Recorder(SAMPLE_MESSAGES, os.path.join(directory, RECORDING_FILENAME), bench=True)
+    result["ready"].set()
+    start_cpu = time.thread_time()
+    recorder.run(stop_event)
+    result["cpu"] += time.thread_time() - start_cpu
+    result["recorded"] += sum(recorder.counts.values())
+    recorder.close()
+
+
+def run_json_logger(directory, stop_event, result):
+    def log_topic(topic):
+        subscriber = Subscriber(get_endpoint(topic, bench=True), timeout=100, conflate=False)
+        ready.release()
+        start_cpu = time.thread_time()
+        recorded = 0
+        with open(os.path.join(directory, f"{topic}.data"), "a") as file:
+            while not stop_event.is_set():
+                message = subscriber.recv_msg()
+                if message is None:
+                    continue
+                file.write(json.dumps(message.to_dict()) + "\n")
+                file.flush()
+                recorded += 1
+        with lock:
+            result["cpu"] += time.thread_time() - start_cpu
+            result["recorded"] += recorded
+        subscriber.close()
+
+    lock = threading.Lock()
+    ready = threading.Semaphore(0)
+    threads = [threading.Thread(target=log_topic, args=(topic,)) for topic in SAMPLE_MESSAGES]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        ready.acquire()
+    result["ready"].set()
+    for thread in threads:
+        thread.join()
+
+
+LOGGERS = {"recorder": run_recorder, "json": run_json_logger}
+
+
+def run(logger_name, rate, duration):
+    directory = tempfile.mkdtemp(prefix="bench_recorder_")
+    stop_event = threading.Event()
+    result = {"ready": threading.Event(), "cpu": 0.0, "recorded": 0}
+    thread = threading.Thread(target=LOGGERS[logger_name], args=(directory, stop_event, result))
+    thread.start()
+    result["ready"].wait()
+    start_t = time.monotonic()
+
+    context = multiprocessing.get_context("spawn")
+    sent_queue = context.Queue()
+    publisher = context.Process(target=publish, args=(rate, duration, sent_queue))
+    publisher.start()
+    sent = sent_queue.get()
+    publisher.join()
+
+    # Let the recorder catch up with what is queued, then stop it
+    time.sleep(0.5)
+    stop_event.set()
+    thread.join()
+    elapsed = time.monotonic() - start_t
+    shutil.rmtree(directory)
+
+    return {
+        "sent": sent,
+        "recorded": result["recorded"],
+        "delivered": result["recorded"] / sent if sent else 0.0,
+        "cpu": result["cpu"] / elapsed,
+    }
+
+
+@click.command()
+@click.option(
+    "-r", "--rates", default="100,1000,5000,10000,20000,50000", help="Comma separated total message rates (msg/s)"
+)
+@click.option("-d", "--duration", default=3.0, help="Seconds of publishing per rate")
+@click.option("-l", "--logger", "logger_names", multiple=True, default=list(LOGGERS), help="Loggers to compare")
+def main(rates, duration, logger_names):
+    print(f"{'logger':>10s}  {'rate':>8s}  {'sent':>8s}  {'recorded':>8s}  {'delivered':>9s}  {'cpu':>6s}")
+    for logger_name in logger_names:
+        for rate in (int(rate) for rate in rates.split(",")):
+            result = run(logger_name, rate, duration)
+            print(
+                f"{logger_name:>10s}  {rate:>8d}  {result['sent']:>8d}  {result['recorded']:>8d}  "
+                f"{result['delivered'] * 100:>8.1f}%  {result['cpu'] * 100:>5.1f}%"
+            )
+
+
+if __name__ == "__main__":
+    main()
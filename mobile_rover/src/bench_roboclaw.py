@@ -0,0 +1,382 @@
+"""
+Benchmark the Roboclaw packet serial driver without hardware.
+
+Compares the current driver against the previous byte-at-a-time implementation
+(bit-by-bit CRC, one port.write/port.read per byte). The serial port is replaced
+by an in-memory port, so the numbers are pure host-side cost.
+
+The left/right update section uses a port that takes as long as the bytes would on
+the wire, to compare sequential and pipelined updates of both controllers. In both modes
+the left/right skew is measured the same way: from when each controller's packet finished
+arriving, on the simulated wire (or the emulator's).
+"""
+
+import bisect
+import struct
+import time
+
+import click
+
+from motor_driver import MotorDriver
+from roboclaw import Roboclaw, crc16
+from utils.stats import SampleStats
+
+
+# start bit + 8 data bits + stop bit
+BITS_PER_BYTE = 10
+
+# address + command + 2 x int32 + CRC16
+SPEED_M1M2_PACKET_BYTES = 12
+
+
+class AckingPort:
+    """
+    In-memory serial port that counts write calls and acks every read.
+    """
+
+    def __init__(self):
+        self.write_calls = 0
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.write_calls += 1
+        self.bytes_written += len(data)
+        return len(data)
+
+    def read(self, size=1):
+        return b"\xff" * size
+
+    def flushInput(self):
+        pass
+
+
+class ReplyingPort(AckingPort):
+    """
+    In-memory serial port that answers every read request with the same canned reply.
+    """
+
+    def __init__(self, reply):
+        super().__init__()
+        self.reply = reply
+        self.position = 0
+        self.read_calls = 0
+
+    def read(self, size=1):
+        self.read_calls += 1
+        data = self.reply[self.position : self.position + size]
+        self.position = (self.position + size) % len(self.reply)
+        return data
+
+
+class WirePort(AckingPort):
+    """
+    Acks every packet, taking as long as the bytes would take on the serial link.
+
+    turnaround models the controller's reply delay plus the host's UART read latency.
+    Only SpeedM1M2 packets are written: packet_times has when each controller's packets
+    finished arriving.
+    """
+
+    def __init__(self, baud, turnaround):
+        super().__init__()
+        self.byte_time = BITS_PER_BYTE / baud
+        self.turnaround = turnaround
+        self.packet_times = {}  # type: dict[int, list[float]]
+
+    def write(self, data):
+        start_t = time.perf_counter()
+        for offset in range(0, len(data), SPEED_M1M2_PACKET_BYTES):
+            arrival_t = start_t + (offset + SPEED_M1M2_PACKET_BYTES) * self.byte_time
+            self.packet_times.setdefault(data[offset], []).append(arrival_t)
+        time.sleep(len(data) * self.byte_time)
+        return super().write(data)
+
+    def read(self, size=1):
+        # Earlier acks of a pipelined batch arrive while later packets are still going out,
+        # so only the last ack byte adds to the wait.
+        time.sleep(self.turnaround + self.byte_time)
+        return b"\xff" * size
+
+
+class LegacyRoboclaw(Roboclaw):
+    """
+    The driver as it was before packets were built with struct and a CRC table.
+    """
+
+    def crc_update(self, data):
+        self._crc = self._crc ^ (data << 8)
+        for bit in range(0, 8):
+            if (self._crc & 0x8000) == 0x8000:
+                self._crc = (self._crc << 1) ^ 0x1021
+            else:
+                self._crc = self._crc << 1
+
+    def _sendcommand(self, address, command):
+        self.crc_clear()
+        self.crc_update(address)
+        self._port.write(address.to_bytes(1, "big"))
+        self.crc_update(command)
+        self._port.write(command.to_bytes(1, "big"))
+
+    def _writebyte(self, val):
+        self.crc_update(val & 0xFF)
+        self._port.write(val.to_bytes(1, "big"))
+
+    def _writelong(self, val):
+        self._writebyte((val >> 24) & 0xFF)
+        self._writebyte((val >> 16) & 0xFF)
+        self._writebyte((val >> 8) & 0xFF)
+        self._writebyte(val & 0xFF)
+
+    def _writechecksum(self):
+        crc = self._crc & 0xFFFF
+        self._writebyte((crc >> 8) & 0xFF)
+        self._writebyte(crc & 0xFF)
+        return len(self._port.read(1)) == 1
+
+    def _readbyte(self):
+        data = self._port.read(1)
+        if len(data):
+            val = ord(data)
+            self.crc_update(val)
+            return (1, val)
+        return (0, 0)
+
+    def _readlong(self):
+        val1 = self._readbyte()
+        if val1[0]:
+            val2 = self._readbyte()
+            if val2[0]:
+                val3 = self._readbyte()
+                if val3[0]:
+                    val4 = self._readbyte()
+                    if val4[0]:
+                        return (1, val1[1] << 24 | val2[1] << 16 | val3[1] << 8 | val4[1])
+        return (0, 0)
+
+    def _readslong(self):
+        val = self._readlong()
+        if val[0]:
+            if val[1] & 0x80000000:
+                return (val[0], val[1] - 0x100000000)
+            return (val[0], val[1])
+        return (0, 0)
+
+    def _read4_1(self, address, cmd):
+        trys = self._trystimeout
+        while 1:
+            self._port.flushInput()
+            self._sendcommand(address, cmd)
+            val1 = self._readslong()
+            if val1[0]:
+                val2 = self._readbyte()
+                if val2[0]:
+                    crc = self._readchecksumword()
+                    if crc[0]:
+                        if self._crc & 0xFFFF != crc[1] & 0xFFFF:
+                            return (0, 0)
+                        return (1, val1[1], val2[1])
+            trys -= 1
+            if trys == 0:
+                break
+        return (0, 0)
+
+    def _writeS4S4(self, address, cmd, val1, val2):
+        trys = self._trystimeout
+        while trys:
+            self._sendcommand(address, cmd)
+            self._writelong(val1)
+            self._writelong(val2)
+            if self._writechecksum():
+                return True
+            trys = trys - 1
+        return False
+
+
+def left_right_skew(right_times, left_times) -> SampleStats:
+    """
+    For each packet the left controller received, the time since the right one last received one.
+    """
+    right_times = sorted(right_times)
+    skew = SampleStats()
+    for left_t in left_times:
+        i = bisect.bisect_right(right_times, left_t)
+        if i:
+            skew.add(left_t - right_times[i - 1])
+    return skew
+
+
+def run_speed_commands(roboclaw, count):
+    port = AckingPort()
+    roboclaw._port = port
+
+    start_t = time.perf_counter()
+    for i in range(count):
+        roboclaw.SpeedM1M2(0x80, i % 3000, -(i % 3000))
+    elapsed = time.perf_counter() - start_t
+
+    return {
+        "commands_per_sec": count / elapsed,
+        "us_per_command": elapsed / count * 1e6,
+        "writes_per_command": port.write_calls / count,
+        "bytes_per_command": port.bytes_written / count,
+    }
+
+
+def run_encoder_reads(roboclaw, count):
+    # ReadEncM1 reply: signed 32 bit count, status byte, CRC over request + data
+    request = bytes((0x80, Roboclaw.Cmd.GETM1ENC))
+    data = struct.pack(">lB", -123456, 0)
+    port = ReplyingPort(data + crc16(request + data).to_bytes(2, "big"))
+    roboclaw._port = port
+
+    start_t = time.perf_counter()
+    for i in range(count):
+        roboclaw.ReadEncM1(0x80)
+    elapsed = time.perf_counter() - start_t
+
+    return {
+        "reads_per_sec": count / elapsed,
+        "us_per_read": elapsed / count * 1e6,
+        "read_calls_per_read": port.read_calls / count,
+        "bytes_per_read": len(request) + len(port.reply),
+    }
+
+
+def run_left_right_updates(pipelined, count, baud, turnaround):
+    roboclaw = Roboclaw("bench", baud)
+    port = roboclaw._port = WirePort(baud, turnaround)
+    driver = MotorDriver(roboclaw, address_right=0x81, address_left=0x80, pipelined=pipelined)
+
+    # Drive the write path directly, without the driver thread, so each cycle is timed on its own
+    for i in range(count):
+        driver._write(i % 3000, -(i % 3000))
+
+    return {
+        "cycle_latency": driver.cycle_latency.summary(),
+        "command_skew": left_right_skew(port.packet_times[0x81], port.packet_times[0x80]).summary(),
+    }
+
+
+def run_emulated_link(count, baud, byte_loss, crc_corruption, read_timeout):
+    from roboclaw_emulator import RoboclawEmulator
+
+    emulator = RoboclawEmulator(
+        addresses=(0x80, 0x81), baud=baud, byte_loss=byte_loss, crc_corruption=crc_corruption, seed=0
+    )
+    roboclaw = Roboclaw(emulator.start(), baud, read_timeout=read_timeout)
+    roboclaw.Open()
+
+    results = {}
+    for name, pipelined in (("sequential", False), ("pipelined", True)):
+        driver = MotorDriver(roboclaw, address_right=0x81, address_left=0x80, pipelined=pipelined)
+        for packet_times in emulator.packet_times.values():
+            packet_times.clear()
+        start_t = time.perf_counter()
+        for i in range(count):
+            driver._write(i % 3000, -(i % 3000))
+        elapsed = time.perf_counter() - start_t
+        # The emulator may still be handling the last packets
+        time.sleep(0.1)
+        skew = left_right_skew(emulator.packet_times[0x81], emulator.packet_times[0x80])
+        results[name] = {"updates_per_sec": count / elapsed, **driver.stats(), "command_skew": skew.summary()}
+
+    start_t = time.perf_counter()
+    reads_ok = 0
+    for i in range(count):
+        reads_ok += roboclaw.ReadEncM1(0x80)[0]
+        reads_ok += roboclaw.ReadEncM1(0x81)[0]
+    elapsed = time.perf_counter() - start_t
+    results["encoder reads"] = {"reads_per_sec": 2 * count / elapsed, "reads_failed": 2 * count - reads_ok}
+    results["link"] = {
+        "retries": roboclaw.retry_count,
+        "timeouts": roboclaw.timeout_count,
+        "crc_errors": roboclaw.crc_error_count,
+    }
+
+    roboclaw._port.close()
+    emulator.stop()
+    return results, emulator.stats()
+
+
+@click.command()
+@click.option("-n", "--count", default=20000, help="Number of commands and reads to run")
+@click.option("-b", "--baud", default=38400, help="Baud rate used to estimate time on the wire")
+@click.option("-t", "--turnaround-ms", default=1.0, help="Controller reply + host read latency per ack")
+@click.option("--emulator", is_flag=True, default=False, help="Also run against the pty Roboclaw emulator")
+@click.option("--byte-loss", default=0.0, help="Emulator: probability of losing each byte")
+@click.option("--crc-corruption", default=0.0, help="Emulator: probability of corrupting each packet's CRC")
+@click.option("--read-timeout", default=0.05, help="Emulator: serial read timeout, i.e. cost of a lost reply")
+def main(count, baud, turnaround_ms, emulator, byte_loss, crc_corruption, read_timeout):
+    print("SpeedM1M2")
+    results = {
+        "before": run_speed_commands(LegacyRoboclaw("bench", baud), count),
+        "after": run_speed_commands(Roboclaw("bench", baud), count),
+    }
+
+    for name, result in results.items():
+        # Packet plus the 1 byte ack
+        wire_ms = (result["bytes_per_command"] + 1) * BITS_PER_BYTE / baud * 1e3
+        print(
+            f"{name:>6s}: {result['commands_per_sec']:>9.0f} cmd/s  "
+            f"{result['us_per_command']:>6.1f} us/cmd  "
+            f"{result['writes_per_command']:>4.1f} writes/cmd  "
+            f"wire time {wire_ms:.2f} ms/cmd @ {baud} baud"
+        )
+
+    speedup = results["after"]["commands_per_sec"] / results["before"]["commands_per_sec"]
+    print(f"speedup: {speedup:.1f}x")
+
+    print("ReadEncM1")
+    results = {
+        "before": run_encoder_reads(LegacyRoboclaw("bench", baud), count),
+        "after": run_encoder_reads(Roboclaw("bench", baud), count),
+    }
+
+    for name, result in results.items():
+        wire_ms = result["bytes_per_read"] * BITS_PER_BYTE / baud * 1e3
+        print(
+            f"{name:>6s}: {result['reads_per_sec']:>9.0f} reads/s  "
+            f"{result['us_per_read']:>6.1f} us/read  "
+            f"{result['read_calls_per_read']:>4.1f} port reads/read  "
+            f"wire time {wire_ms:.2f} ms/read @ {baud} baud"
+        )
+
+    speedup = results["after"]["reads_per_sec"] / results["before"]["reads_per_sec"]
+    print(f"speedup: {speedup:.1f}x")
+
+    print(f"Left + right update, simulated link with {turnaround_ms} ms turnaround")
+    cycles = max(1, count // 100)
+    for name, pipelined in (("sequential", False), ("pipelined", True)):
+        result = run_left_right_updates(pipelined, cycles, baud, turnaround_ms / 1e3)
+        latency = result["cycle_latency"]
+        skew = result["command_skew"]
+        print(
+            f"{name:>10s}: cycle p50 {latency['p50'] * 1e3:.2f} ms  p99 {latency['p99'] * 1e3:.2f} ms  "
+            f"left/right skew p50 {skew['p50'] * 1e3:.2f} ms  max {skew['max'] * 1e3:.2f} ms"
+        )
+
+    if emulator:
+        print(f"Emulated link: {baud} baud, byte loss {byte_loss}, CRC corruption {crc_corruption}")
+        cycles = max(1, count // 100)
+        results, emulator_stats = run_emulated_link(cycles, baud, byte_loss, crc_corruption, read_timeout)
+        for name in ("sequential", "pipelined"):
+            result = results[name]
+            latency = result["cycle_latency"]
+            skew = result["command_skew"]
+            print(
+                f"{name:>10s}: {result['updates_per_sec']:>6.1f} updates/s  "
+                f"cycle p50 {latency['p50'] * 1e3:.2f} ms  p99 {latency['p99'] * 1e3:.2f} ms  "
+                f"left/right skew p50 {skew['p50'] * 1e3:.2f} ms  "
+                f"failed {result['commands_failed']}/{result['commands_sent']}"
+            )
+        reads = results["encoder reads"]
+        print(f"     reads: {reads['reads_per_sec']:>6.1f} reads/s  failed {reads['reads_failed']}")
+        link = results["link"]
+        print(f"    driver: retries {link['retries']}  timeouts {link['timeouts']}  crc errors {link['crc_errors']}")
+        print(f"  emulator: {emulator_stats}")
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,300 @@
+"""
+Benchmark the control stack's per-message and per-step functions, and keep the results as JSON.
+
+    python bench_suite.py -o bench_results/<commit>.json
+    python bench_suite.py --compare bench_results/<previous commit>.json
+
+Every result is also normalized by a reference workload, a fixed pure Python loop timed on the same
+machine. Normalized costs are comparable across machines, so:
+
+- --compare flags regressions against a baseline run, even one from another machine
+- --emulate pi_results.json scales this machine's results to the machine that produced pi_results.json:
+  run the suite once on the Pi, then estimate Pi timings from a laptop
+
+Benchmarks whose dependencies are missing (e.g. sensor_server needs fastapi and uvicorn) are skipped.
+"""
+
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import click
+
+from utils.stats import percentile
+
+
+# Survy's backyard, the first waypoint of mission.csv
+ORIGIN = (37.57125784995419, -122.30067882311883)
+
+SENSOR_FRAME = {
+    "locationTimestamp_since1970": "1718000000.123",
+    "locationLongitude": "-122.30067882311883",
+    "locationLatitude": "37.57125784995419",
+    "locationHorizontalAccuracy": "4.7",
+    "locationTrueHeading": "74.0",
+    "locationHeadingAccuracy": "15.0",
+    "batteryLevel": "0.8",
+}
+
+
+def reference_workload():
+    # Integer and float arithmetic, calls and a dict: the mix of the control stack's hot paths
+    total = 0.0
+    counts = {}
+    for i in range(1000):
+        total += math.sqrt(i) * 0.5
+        counts[i & 15] = counts.get(i & 15, 0) + 1
+    return total
+
+
+def bench_gps_from_sensor_frame():
+    from sensor_server import gps_from_sensor_frame
+
+    return lambda: gps_from_sensor_frame(SENSOR_FRAME)
+
+
+def bench_gps_to_pose():
+    from messages import GPSMessage
+    from pose_estimator import gps_to_pose
+    from utils.projection import set_projection_origin
+
+    set_projection_origin(*ORIGIN)
+    gps = GPSMessage(ORIGIN[0] + 1e-4, ORIGIN[1] - 1e-4, 4.7, 1.29, 0.26, 1718000000.123)
+    return lambda: gps_to_pose(gps)
+
+
+def bench_pose_dist():
+    from utils.gps import Pose
+
+    a, b = Pose(0.0, 0.0, 0.0), Pose(3.0, 4.0, 1.0)
+    return lambda: a.dist(b)
+
+
+def bench_pose_angle():
+    from utils.gps import Pose
+
+    a, b = Pose(0.0, 0.0, 0.0), Pose(3.0, 4.0, 1.0)
+    return lambda: a.angle(b)
+
+
+def bench_pose_update():
+    from cmd_vel import CmdVel
+    from utils.gps import Pose
+
+    pose = Pose(0.0, 0.0, 0.0)
+    cmd_vel = CmdVel(linear_vel=0.5, angular_vel=0.1)
+    return lambda: pose.update(cmd_vel, 0.1)
+
+
+def bench_nav_to_pose_step():
+    from behaviors import NavToPose
+    from utils.gps import Pose
+
+    behavior = NavToPose(Pose(100.0, 50.0, 0.0), distance_threshold=1.0)
+    pose = Pose(0.0, 0.0, 0.3)
+    return lambda: behavior.step(pose)
+
+
+def bench_turn_in_place_step():
+    from behaviors import TurnInPlace
+    from utils.gps import Pose
+
+    behavior = TurnInPlace(rotation_th=math.radians(350), speed_rpm=4)
+    pose = Pose(0.0, 0.0, 0.0)
+    behavior.step(pose)
+    pose.th = 1.0
+    return lambda: behavior.step(pose)
+
+
+def bench_crc_update():
+    from roboclaw import Roboclaw
+
+    roboclaw = Roboclaw("/dev/null", 38400)
+    packet = bytes(range(12))
+
+    def run():
+        roboclaw.crc_clear()
+        for byte in packet:
+            roboclaw.crc_update(byte)
+
+    return run
+
+
+def bench_build_frame():
+    from roboclaw import Roboclaw, build_frame
+
+    return lambda: build_frame(0x80, Roboclaw.Cmd.MIXEDSPEED, "ll", 1200, -1200)
+
+
+def bench_mission_load():
+    from mission import Mission
+
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mission.csv")
+    return lambda: Mission().load_from_file(filename)
+
+
+def bench_pub_sub_round_trip(transport):
+    def setup():
+        from bench_pub_sub import SAMPLE_MESSAGES, connect
+        from pub_sub import TOPIC_POSE
+
+        publisher, subscriber = connect(TOPIC_POSE, transport)
+        message = SAMPLE_MESSAGES[TOPIC_POSE]
+
+        def run():
+            publisher.send_msg(message)
+            subscriber.recv_msg()
+
+        run.close = lambda: (subscriber.close(), publisher.close())
+        return run
+
+    return setup
+
+
+BENCHMARKS = {
+    "gps_from_sensor_frame": bench_gps_from_sensor_frame,
+    "gps_to_pose": bench_gps_to_pose,
+    "pose.dist": bench_pose_dist,
+    "pose.angle": bench_pose_angle,
+    "pose.update": bench_pose_update,
+    "nav_to_pose.step": bench_nav_to_pose_step,
+    "turn_in_place.step": bench_turn_in_place_step,
+    "roboclaw.crc_update (12 bytes)": bench_crc_update,
+    "roboclaw.build_frame": bench_build_frame,
+    "mission.load_from_file": bench_mission_load,
+    "pub_sub round trip inproc": bench_pub_sub_round_trip("inproc"),
+    "pub_sub round trip ipc": bench_pub_sub_round_trip("ipc"),
+}
+
+
+def measure(fn, repeats, min_time):
+    """
+    Median and best time per call (us), over `repeats` runs of enough calls to last `min_time` each.
+    """
+    # Calibrate the number of calls per run
+    number = 1
+    while True:
+        start_t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start_t
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    times = []
+    for _ in range(repeats):
+        start_t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start_t) / number * 1e6)
+
+    times.sort()
+    return {"median_us": percentile(times, 50), "best_us": times[0], "calls": number * repeats}
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL)
+        return commit.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, repeats, min_time):
+    reference = measure(reference_workload, repeats, min_time)["median_us"]
+    results = {}
+    for name in names:
+        try:
+            fn = BENCHMARKS[name]()
+        except ImportError as e:
+            results[name] = {"skipped": str(e)}
+            continue
+
+        random.seed(0)
+        result = measure(fn, repeats, min_time)
+        result["normalized"] = result["median_us"] / reference
+        results[name] = result
+        if hasattr(fn, "close"):
+            fn.close()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "python": sys.version.split()[0],
+        "reference_us": reference,
+        "results": results,
+    }
+
+
+@click.command()
+@click.option("-o", "--output", default=None, help="Write the results to this JSON file")
+@click.option("-k", "--filter", "name_filter", default=None, help="Only run the benchmarks whose name contains this")
+@click.option("-r", "--repeats", default=7, help="Runs per benchmark")
+@click.option("-t", "--min-time", default=0.05, help="Minimum duration of one run (s)")
+@click.option("-c", "--compare", default=None, help="Baseline results JSON to compare against")
+@click.option("--threshold", default=0.15, help="Normalized slowdown vs the baseline that counts as a regression")
+@click.option("-e", "--emulate", default=None, help="Results JSON from a slower machine (the Pi) to scale to")
+def main(output, name_filter, repeats, min_time, compare, threshold, emulate):
+    names = [name for name in BENCHMARKS if name_filter is None or name_filter in name]
+    report = run_suite(names, repeats, min_time)
+
+    baseline = None
+    if compare is not None:
+        with open(compare) as f:
+            baseline = json.load(f)
+
+    target_reference = None
+    if emulate is not None:
+        with open(emulate) as f:
+            target_reference = json.load(f)["reference_us"]
+        report["emulated_reference_us"] = target_reference
+
+    print(f"reference workload: {report['reference_us']:.1f} us ({report['machine']}, Python {report['python']})")
+    header = f"{'':>32s}  {'median us':>10s}  {'best us':>10s}  {'normalized':>10s}"
+    if target_reference is not None:
+        header += f"  {'emulated us':>11s}"
+    if baseline is not None:
+        header += f"  {'vs baseline':>11s}"
+    print(header)
+
+    regressions = []
+    for name, result in report["results"].items():
+        if "skipped" in result:
+            print(f"{name:>32s}  skipped: {result['skipped']}")
+            continue
+
+        line = f"{name:>32s}  {result['median_us']:>10.3f}  {result['best_us']:>10.3f}  {result['normalized']:>10.5f}"
+        if target_reference is not None:
+            result["emulated_us"] = result["normalized"] * target_reference
+            line += f"  {result['emulated_us']:>11.3f}"
+        if baseline is not None:
+            baseline_result = baseline["results"].get(name, {})
+            if "normalized" in baseline_result:
+                ratio = result["normalized"] / baseline_result["normalized"]
+                line += f"  {ratio:>10.2f}x"
+                if ratio > 1 + threshold:
+                    regressions.append(name)
+                    line += "  REGRESSION"
+        print(line)
+
+    if output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {output}")
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
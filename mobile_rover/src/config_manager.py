@@ -23,6 +23,25 @@ client_machine = "iphone-15-pro"
 # The Server API is running on port 8000
 sensor_service_port = 8000
 
+# Motors: "roboclaw" on the robot, "sim" for the Roboclaw emulator, "null" to drive nothing.
+# Runners can pick a different one with motors.select_motor_backend().
+motor_backend = "roboclaw"
+motor_serial_port = "/dev/ttyAMA0"
+motor_serial_baud = 38400
+
+# pub_sub transport: "ipc" between processes on this host, "inproc" between threads of one process,
+# "tcp" across hosts (subscribers connect to pub_sub_host). Single topics can be overridden by name.
+pub_sub_transport = "ipc"
+pub_sub_transports = {}  # e.g. {"gps": "tcp"}
+pub_sub_host = "localhost"
+pub_sub_ipc_directory = "/tmp/robo_magellan"
+
+# Wheel odometry: encoder counts are read from both controllers at this rate (Hz)
+encoder_poll_rate = 50
+
+# Time the stages of the control loop (see profiling.py). Runners can also turn it on with --profile.
+profiling_enabled = False
+
 
 def get_sensor_service_address():
     if ENV_TYPE == Environment.DEV:
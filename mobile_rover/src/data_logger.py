@@ -1,29 +1,113 @@
+"""
+Record the published topics to logs/<date>/recording.mlog (see message_log.py).
+
+One loop polls every topic and stamps each message with its receive time and topic id. The messages are
+written as received, in batches, rather than decoded, converted to JSON and flushed one by one.
+`python bench_recorder.py` measures the message rate it keeps up with, and its CPU use.
+"""
+
 import datetime
 import os
 import threading
 import time
 
 import click
+import zmq
+
+from custom_logger import get_logger
+from message_log import RECORDING_FILENAME, MessageLogWriter
+from pub_sub import (
+    Subscriber,
+    TOPIC_CMD_VEL,
+    TOPIC_CONE_DETECTIONS,
+    TOPIC_GPS,
+    TOPIC_IDS,
+    TOPIC_POSE,
+    TOPIC_WHEEL_ODOMETRY,
+    get_endpoint,
+)
+
+
+logger = get_logger("data_logger")
+
+# Messages read from one topic before moving on to the next, so a busy topic cannot starve the others
+MAX_READS_PER_TOPIC = 1000
+
+
+class Recorder:
+    def __init__(
+        self, topics, filename, batch_bytes=64 * 1024, batch_interval=1.0, fsync_interval=5.0, bench=False
+    ):
+        """
+        bench: record the topics' bench endpoints (see get_endpoint) instead of the live ones.
+        """
+        # Subscribers of its own, which keep every message, rather than the shared conflating ones
+        self.subscribers = [Subscriber(get_endpoint(topic, bench=bench), conflate=False) for topic in topics]
+        self.topics = {subscriber.socket: subscriber.endpoint.topic for subscriber in self.subscribers}
+        self.poller = zmq.Poller()
+        for subscriber in self.subscribers:
+            self.poller.register(subscriber.socket, zmq.POLLIN)
 
-from pub_sub import get_subscriber_gps, get_subscriber_pose, Subscriber
+        self.writer = MessageLogWriter(filename, batch_bytes, batch_interval, fsync_interval)
+        self.counts = {subscriber.endpoint.topic: 0 for subscriber in self.subscribers}
 
+    def poll(self, timeout=0.1) -> int:
+        """
+        Wait up to `timeout` (s), or until the current batch is due, and record whatever has arrived.
+        Returns the number of messages recorded.
+        """
+        time_to_flush = self.writer.time_to_flush()
+        if time_to_flush is not None:
+            timeout = min(timeout, time_to_flush)
 
-def logger_thread(
-    subscriber_name: str,
-    subscriber: Subscriber,
-    log_directory: str,
-    stop_event: threading.Event,
-):
-    log_filename = os.path.join(log_directory, f"{subscriber_name}.data")
-    subscriber.write_to_log(log_filename, stop_event)
+        recorded = 0
+        for socket, _ in self.poller.poll(timeout * 1000):
+            recorded += self.read(socket)
+
+        self.writer.maybe_flush()
+        return recorded
+
+    def read(self, socket) -> int:
+        topic = self.topics[socket]
+        topic_id = TOPIC_IDS[topic]
+        write = self.writer.write
+        count = 0
+        while count < MAX_READS_PER_TOPIC:
+            try:
+                data = socket.recv(zmq.NOBLOCK)
+            except zmq.error.Again:
+                break
+            write(time.time(), topic_id, data)
+            count += 1
+        self.counts[topic] += count
+        return count
+
+    def run(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            self.poll()
+
+    def close(self):
+        for subscriber in self.subscribers:
+            self.poller.unregister(subscriber.socket)
+            subscriber.close()
+        self.writer.close()
+
+    def stats(self) -> dict:
+        return {**self.writer.stats(), "topics": dict(self.counts)}
 
 
 @click.command()
 @click.option("--gps", is_flag=True, default=False, help="Record published gps data")
 @click.option("--pose", is_flag=True, default=False, help="Record published pose data")
-@click.option("-a", "--all_data", is_flag=True, default=True, help="Record published pose data")
-def main(gps, pose, all_data):
-    if gps or pose:
+@click.option("--odom", is_flag=True, default=False, help="Record published wheel odometry data")
+@click.option("--cones", is_flag=True, default=False, help="Record published cone detections")
+@click.option("--cmd-vel", is_flag=True, default=False, help="Record published velocity commands")
+@click.option("-a", "--all_data", is_flag=True, default=True, help="Record every topic")
+@click.option("--batch-size", default=64, help="Write the recording in batches of this many KiB")
+@click.option("--batch-interval", default=1.0, help="Write the current batch after this many seconds")
+@click.option("--fsync-interval", default=5.0, help="Sync the recording to disk every this many seconds")
+def main(gps, pose, odom, cones, cmd_vel, all_data, batch_size, batch_interval, fsync_interval):
+    if gps or pose or odom or cones or cmd_vel:
         all_data = False
 
     # Create a directory with the current timestamp to save all the data in
@@ -31,40 +115,28 @@ def main(gps, pose, all_data):
     log_directory = os.path.join("logs", directory_name)
     os.makedirs(log_directory, exist_ok=True)
 
-    # List of subscribers to monitor
-    subscribers = []
-    if gps or all_data:
-        subscribers.append(("gps", get_subscriber_gps()))
-    if pose or all_data:
-        subscribers.append(("pose", get_subscriber_pose()))
-
-    subscriber_threads = []
-    stop_event = threading.Event()
-
-    for subscriber_name, subscriber in subscribers:
-        thread = threading.Thread(
-            target=logger_thread,
-            args=(
-                subscriber_name,
-                subscriber,
-                log_directory,
-                stop_event,
-            ),
-        )
-        thread.start()
-        subscriber_threads.append(thread)
-
-    # Keep the main thread alive
+    # Topics to record
+    selected = {
+        TOPIC_GPS: gps,
+        TOPIC_POSE: pose,
+        TOPIC_WHEEL_ODOMETRY: odom,
+        TOPIC_CONE_DETECTIONS: cones,
+        TOPIC_CMD_VEL: cmd_vel,
+    }
+    topics = [topic for topic, record in selected.items() if record or all_data]
+
+    filename = os.path.join(log_directory, RECORDING_FILENAME)
+    recorder = Recorder(topics, filename, batch_size * 1024, batch_interval, fsync_interval)
+    logger.info(f"Recording {', '.join(topics)} to {filename}")
+
     try:
         while True:
-            time.sleep(0.1)
+            recorder.poll()
     except KeyboardInterrupt:
         print("\nShutting down...")
-        stop_event.set()
-
-    # Wait for all threads to complete (this will run indefinitely in this case)
-    for thread in subscriber_threads:
-        thread.join()
+    finally:
+        recorder.close()
+        logger.info(f"Recorded {recorder.stats()}")
 
 
 if __name__ == "__main__":
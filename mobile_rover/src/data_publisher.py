@@ -1,19 +1,140 @@
-import os
+"""
+Replay a recorded run (see message_log.py) on the topics it was recorded from.
+
+The messages of every topic are merged by receive time and published with the gaps they were received
+with, scaled by the speed (2 = twice as fast; 0 = as fast as possible). Each message is scheduled against
+the replay's start time rather than the previous message, so sleep overshoot does not accumulate.
+
+By default each message is moved to the present: its timestamps and trace are shifted by the time between
+its recorded receive time and its publish time, so the stack sees data as fresh as it was on the run (and
+trace latencies as they were). --original-times publishes the recorded bytes unchanged.
+
+    python data_publisher.py -d logs/run_1                      # every topic, in real time
+    python data_publisher.py -d logs/run_1 -t gps -t cone_detections -s 4 --start 60 --end 120 --loop
+"""
+
+import threading
+import time
 
 import click
 
-from pub_sub import get_publisher_gps
+from custom_logger import get_logger
+from message_log import MessageLogReader, open_log_directory
+from messages import decode_message
+from pub_sub import TOPIC_IDS, Publisher, get_endpoint
+from utils.stats import SampleStats
+
+
+logger = get_logger("data_publisher")
+
+# Time given to the subscribers to connect before publishing (s)
+JOIN_TIME = 1.0
+
+
+class LogReplayer:
+    def __init__(
+        self, reader: MessageLogReader, topics=None, speed=1.0, start=0.0, end=None, loop=False, shift_times=True
+    ):
+        """
+        start, end: offsets (s) from the beginning of the recording. Defaults to the whole recording.
+        shift_times: move the messages' timestamps and traces to the time they are published.
+        """
+        self.reader = reader
+        self.topics = reader.topics if topics is None else [topic for topic in topics if topic in reader.topics]
+        self.speed = speed
+        self.loop = loop
+        self.shift_times = shift_times
+        self.start_time = reader.start_time + start if reader.start_time is not None else None
+        self.end_time = reader.start_time + end if reader.start_time is not None and end is not None else None
+
+        self.publishers = {}  # type: dict[str, Publisher]
+        self.published = {topic: 0 for topic in self.topics}
+        # How late each message was published (s), against its scaled receive time
+        self.lateness = SampleStats()
+
+    def connect(self, join_time=JOIN_TIME):
+        for topic in self.topics:
+            self.publishers[topic] = Publisher(get_endpoint(topic))
+        # Slow joiner: give the subscribers time to connect, or the first messages are dropped
+        time.sleep(join_time)
+
+    def send(self, topic, data: bytes):
+        # Already encoded: published without encoding it again
+        self.publishers[topic].socket.send(data)
+
+    def play_once(self, stop_event: threading.Event = None) -> int:
+        """
+        Publish the selected part of the recording once. Returns the number of messages published.
+        """
+        records = self.reader.records(self.topics, self.start_time, self.end_time)
+        first_received = None
+        replay_start_t = None
+        count = 0
+
+        for received, topic, data in records:
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            if self.speed > 0:
+                if first_received is None:
+                    first_received = received
+                    replay_start_t = time.monotonic()
+                due_t = replay_start_t + (received - first_received) / self.speed
+                delay = due_t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.lateness.add(-delay)
+
+            if self.shift_times:
+                data = decode_message(data).shift_times(time.time() - received).encode()
+            self.send(topic, data)
+            self.published[topic] += 1
+            count += 1
+
+        return count
+
+    def run(self, stop_event: threading.Event = None) -> int:
+        total = 0
+        while True:
+            count = self.play_once(stop_event)
+            total += count
+            if not self.loop or count == 0 or (stop_event is not None and stop_event.is_set()):
+                return total
+            logger.info(f"Looping after {count} messages")
+
+    def close(self):
+        for publisher in self.publishers.values():
+            publisher.close()
 
 
 @click.command()
 @click.option("-d", "--log-directory", required=True, help="Path to directory to load log files from")
-@click.option("-r", "--rate", default=10, help="Rate at which to publish data")
-def main(log_directory, rate):
-    subscriber_name = "gps"
-    log_filename = os.path.join(log_directory, f"{subscriber_name}.data")
+@click.option(
+    "-t", "--topic", "topics", multiple=True, type=click.Choice(list(TOPIC_IDS)), help="Topics to replay (all)"
+)
+@click.option("-s", "--speed", default=1.0, help="Playback speed multiplier, 0 to publish as fast as possible")
+@click.option("--start", default=0.0, help="Start this many seconds into the recording")
+@click.option("--end", default=None, type=float, help="Stop this many seconds into the recording")
+@click.option("--loop", is_flag=True, default=False, help="Start over at the end")
+@click.option(
+    "--original-times", is_flag=True, default=False, help="Keep the recorded timestamps instead of shifting them to now"
+)
+def main(log_directory, topics, speed, start, end, loop, original_times):
+    # Logs with only .data files are converted to a recording first
+    reader = open_log_directory(log_directory)
+    replayer = LogReplayer(reader, topics or None, speed, start, end, loop, shift_times=not original_times)
+    logger.info(f"Replaying {', '.join(replayer.topics)} from {reader.filename} at {speed or 'max'}x")
 
-    gps_publisher = get_publisher_gps()
-    gps_publisher.read_from_logs(filename=log_filename, rate=rate)
+    replayer.connect()
+    try:
+        replayer.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replayer.close()
+        reader.close()
+        logger.info(f"Published {replayer.published}, late by {replayer.lateness}")
 
 
 if __name__ == "__main__":
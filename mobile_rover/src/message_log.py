@@ -0,0 +1,431 @@
+"""
+Recordings of pub_sub messages, in an indexed, compressed, chunked file (recording.mlog).
+
+Every message is a record:
+    receive time (double) | topic id (uint8) | length (uint32) | the message, as sent on the wire
+Messages are stored as received (see messages.py), so recording costs no decoding or JSON.
+
+The records of each topic are grouped in chunks, compressed with zlib. The file is:
+    header | chunk | chunk | ... | index | trailer
+where each chunk has a header with its topic, record count, sizes and time span, and the index lists
+every chunk's offset, topic and time span. A reader loads the index alone, then decompresses only the
+chunks of the topics and the time window it asks for. If the run ended without writing the index (a crash),
+the reader rebuilds it from the chunk headers, skipping the payloads.
+
+MessageLogWriter writes a topic's chunk when it holds `batch_bytes` of records, and every chunk when the
+oldest one is `batch_interval` old. It fsyncs every `fsync_interval` seconds. A crash loses at most the
+unwritten chunks.
+
+Logs from before recordings, logs/<date>/<topic>.data (JSON lines), are converted by import_data_files(),
+or by `python message_log.py logs/<date>`, which also prints what a recording holds.
+"""
+
+import bisect
+import glob
+import heapq
+import itertools
+import json
+import os
+import struct
+import time
+import zlib
+
+import click
+
+from custom_logger import get_logger
+from messages import (
+    CmdVelMessage,
+    ConeDetectionMessage,
+    GPSMessage,
+    Message,
+    PoseMessage,
+    WheelOdometryMessage,
+    decode_message,
+)
+from pub_sub import TOPIC_CMD_VEL, TOPIC_CONE_DETECTIONS, TOPIC_GPS, TOPIC_IDS, TOPIC_POSE, TOPIC_WHEEL_ODOMETRY
+
+
+logger = get_logger("message_log")
+
+RECORDING_FILENAME = "recording.mlog"
+
+MAGIC = b"RMLG"
+VERSION = 1
+INDEX_MAGIC = b"RIDX"
+
+HEADER = struct.Struct(">4sB")
+RECORD = struct.Struct(">dBI")
+# topic id, compression, record count, uncompressed size, compressed size, start time, end time
+CHUNK = struct.Struct(">BBIIIdd")
+# offset, topic id, record count, start time, end time
+INDEX_ENTRY = struct.Struct(">QBIdd")
+# index offset, entry count, magic
+TRAILER = struct.Struct(">QI4s")
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+TOPICS_BY_ID = {topic_id: topic for topic, topic_id in TOPIC_IDS.items()}
+
+TOPIC_MESSAGE_TYPES = {
+    TOPIC_GPS: GPSMessage,
+    TOPIC_POSE: PoseMessage,
+    TOPIC_CONE_DETECTIONS: ConeDetectionMessage,
+    TOPIC_WHEEL_ODOMETRY: WheelOdometryMessage,
+    TOPIC_CMD_VEL: CmdVelMessage,
+}
+
+
+class ChunkInfo:
+    def __init__(self, offset, topic_id, count, start_time, end_time):
+        self.offset = offset
+        self.topic_id = topic_id
+        self.count = count
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class _Batch:
+    def __init__(self, topic_id):
+        self.topic_id = topic_id
+        self.data = bytearray()
+        self.count = 0
+        self.start_time = None
+        self.end_time = None
+        self.created_time = time.monotonic()
+
+
+class MessageLogWriter:
+    def __init__(self, filename, batch_bytes=64 * 1024, batch_interval=1.0, fsync_interval=5.0, compression_level=1):
+        self.filename = filename
+        self.batch_bytes = batch_bytes
+        self.batch_interval = batch_interval
+        self.fsync_interval = fsync_interval
+        self.compression_level = compression_level
+
+        self.file = open(filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.offset = HEADER.size
+        self.batches = {}  # type: dict[int, _Batch]
+        self.chunks = []  # type: list[ChunkInfo]
+        self.last_fsync_time = time.monotonic()
+
+        self.records_written = 0
+        self.bytes_received = 0
+        self.writes = 0
+        self.fsyncs = 0
+
+    def write(self, received, topic_id, data: bytes):
+        batch = self.batches.get(topic_id)
+        if batch is None:
+            batch = self.batches[topic_id] = _Batch(topic_id)
+            batch.start_time = received
+        batch.data += RECORD.pack(received, topic_id, len(data))
+        batch.data += data
+        batch.count += 1
+        batch.end_time = received
+        self.records_written += 1
+        self.bytes_received += len(data)
+
+        if len(batch.data) >= self.batch_bytes:
+            del self.batches[topic_id]
+            self._write_chunk(batch)
+            self._end_write()
+
+    def write_message(self, received, topic, message: Message):
+        self.write(received, TOPIC_IDS[topic], message.encode())
+
+    def time_to_flush(self):
+        """
+        Seconds until the oldest chunk is due, None if there is none.
+        """
+        if not self.batches:
+            return None
+        oldest = min(batch.created_time for batch in self.batches.values())
+        return max(oldest + self.batch_interval - time.monotonic(), 0.0)
+
+    def maybe_flush(self):
+        time_to_flush = self.time_to_flush()
+        if time_to_flush is not None and time_to_flush <= 0:
+            self.flush()
+
+    def flush(self, fsync=False):
+        batches = sorted(self.batches.values(), key=lambda batch: batch.start_time)
+        self.batches = {}
+        for batch in batches:
+            self._write_chunk(batch)
+        self._end_write(fsync)
+
+    def _write_chunk(self, batch: _Batch):
+        payload = bytes(batch.data)
+        compression = COMPRESSION_NONE
+        if self.compression_level > 0:
+            compressed = zlib.compress(payload, self.compression_level)
+            if len(compressed) < len(payload):
+                payload, compression = compressed, COMPRESSION_ZLIB
+
+        self.file.write(
+            CHUNK.pack(
+                batch.topic_id,
+                compression,
+                batch.count,
+                len(batch.data),
+                len(payload),
+                batch.start_time,
+                batch.end_time,
+            )
+        )
+        self.file.write(payload)
+        self.chunks.append(ChunkInfo(self.offset, batch.topic_id, batch.count, batch.start_time, batch.end_time))
+        self.offset += CHUNK.size + len(payload)
+
+    def _end_write(self, fsync=False):
+        self.file.flush()
+        self.writes += 1
+        if fsync or time.monotonic() - self.last_fsync_time >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.fsyncs += 1
+            self.last_fsync_time = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+        index = bytearray()
+        for chunk in self.chunks:
+            index += INDEX_ENTRY.pack(chunk.offset, chunk.topic_id, chunk.count, chunk.start_time, chunk.end_time)
+        self.file.write(index)
+        self.file.write(TRAILER.pack(self.offset, len(self.chunks), INDEX_MAGIC))
+        self._end_write(fsync=True)
+        self.file.close()
+
+    def stats(self) -> dict:
+        return {
+            "records": self.records_written,
+            "bytes_received": self.bytes_received,
+            "bytes_written": self.offset,
+            "chunks": len(self.chunks),
+            "writes": self.writes,
+            "fsyncs": self.fsyncs,
+        }
+
+
+class MessageLogReader:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        self.file_size = os.fstat(self.file.fileno()).st_size
+
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"{filename} is not a recording")
+        version = HEADER.unpack(header)[1]
+        if version != VERSION:
+            raise ValueError(f"{filename}: unsupported recording version {version}")
+
+        chunks = self._read_index()
+        self.indexed = chunks is not None
+        if chunks is None:
+            chunks = self._scan_chunks()
+
+        self.chunks = {}  # type: dict[str, list[ChunkInfo]]
+        for chunk in chunks:
+            self.chunks.setdefault(TOPICS_BY_ID.get(chunk.topic_id, str(chunk.topic_id)), []).append(chunk)
+        for topic_chunks in self.chunks.values():
+            topic_chunks.sort(key=lambda chunk: chunk.start_time)
+        # End times, for bisecting to the first chunk of a time window
+        self._end_times = {
+            topic: list(itertools.accumulate((chunk.end_time for chunk in topic_chunks), max))
+            for topic, topic_chunks in self.chunks.items()
+        }
+
+    def _read_index(self):
+        if self.file_size < HEADER.size + TRAILER.size:
+            return None
+        self.file.seek(self.file_size - TRAILER.size)
+        index_offset, count, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != INDEX_MAGIC or index_offset + count * INDEX_ENTRY.size != self.file_size - TRAILER.size:
+            return None
+
+        self.file.seek(index_offset)
+        index = self.file.read(count * INDEX_ENTRY.size)
+        return [ChunkInfo(*entry) for entry in INDEX_ENTRY.iter_unpack(index)]
+
+    def _scan_chunks(self):
+        chunks = []
+        offset = HEADER.size
+        while offset + CHUNK.size <= self.file_size:
+            self.file.seek(offset)
+            topic_id, _, count, _, compressed_size, start_time, end_time = CHUNK.unpack(self.file.read(CHUNK.size))
+            if offset + CHUNK.size + compressed_size > self.file_size:
+                break
+            chunks.append(ChunkInfo(offset, topic_id, count, start_time, end_time))
+            offset += CHUNK.size + compressed_size
+        return chunks
+
+    @property
+    def topics(self):
+        return list(self.chunks)
+
+    @property
+    def start_time(self):
+        return min((chunks[0].start_time for chunks in self.chunks.values()), default=None)
+
+    @property
+    def end_time(self):
+        return max((end_times[-1] for end_times in self._end_times.values()), default=None)
+
+    def count(self, topic=None) -> int:
+        topics = self.chunks if topic is None else [topic]
+        return sum(chunk.count for topic in topics for chunk in self.chunks.get(topic, ()))
+
+    def _read_chunk(self, chunk: ChunkInfo) -> bytes:
+        self.file.seek(chunk.offset)
+        _, compression, _, _, compressed_size, _, _ = CHUNK.unpack(self.file.read(CHUNK.size))
+        payload = self.file.read(compressed_size)
+        if compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+        return payload
+
+    def _topic_records(self, topic, start=None, end=None):
+        topic_chunks = self.chunks.get(topic, [])
+        first = 0 if start is None else bisect.bisect_left(self._end_times[topic], start)
+        for chunk in topic_chunks[first:]:
+            if end is not None and chunk.start_time > end:
+                break
+            payload = self._read_chunk(chunk)
+            offset = 0
+            for _ in range(chunk.count):
+                received, _, length = RECORD.unpack_from(payload, offset)
+                offset += RECORD.size
+                if (start is None or received >= start) and (end is None or received <= end):
+                    yield received, topic, payload[offset : offset + length]
+                offset += length
+
+    def records(self, topics=None, start=None, end=None):
+        """
+        Yield (receive time, topic, message bytes) in receive time order, for the given topics (all by default)
+        between the `start` and `end` receive times (the whole recording by default).
+        Only the chunks of those topics that overlap the window are read.
+        """
+        topics = self.topics if topics is None else [topic for topic in topics if topic in self.chunks]
+        if len(topics) == 1:
+            return self._topic_records(topics[0], start, end)
+        return heapq.merge(*(self._topic_records(topic, start, end) for topic in topics), key=lambda record: record[0])
+
+    def messages(self, topics=None, start=None, end=None):
+        """
+        records(), decoded: yield (receive time, topic, message).
+        """
+        for received, topic, data in self.records(topics, start, end):
+            yield received, topic, decode_message(data)
+
+    def seek(self, timestamp, topics=None):
+        """
+        The messages from `timestamp` on.
+        """
+        return self.messages(topics, start=timestamp)
+
+    def close(self):
+        self.file.close()
+
+
+def read_messages(filename, topics=None, start=None, end=None):
+    """
+    Yield (receive time, topic, message) for the messages of a recording.
+    """
+    reader = MessageLogReader(filename)
+    try:
+        yield from reader.messages(topics, start, end)
+    finally:
+        reader.close()
+
+
+def import_data_files(log_directory, filename=None) -> int:
+    """
+    Convert the <topic>.data (JSON lines) logs of a directory to a recording. The receive time of each
+    message is the time its data was received (GPS), or else its timestamp. Returns the number of messages.
+
+    Baseline logs have untimestamped topics (pose.data lines are only x, y, th). Their loggers ran alongside
+    the GPS logger, so the messages of such a file are spread evenly over the run's timeline (the span of the
+    timestamped messages), and an untimestamped message within a timestamped file takes the time of the
+    message before it. Without any timestamped message, untimestamped files are skipped.
+    """
+    if filename is None:
+        filename = os.path.join(log_directory, RECORDING_FILENAME)
+
+    # {topic: [(receive time or None, message)]}
+    topics = {}
+    for data_filename in sorted(glob.glob(os.path.join(log_directory, "*.data"))):
+        topic = os.path.splitext(os.path.basename(data_filename))[0]
+        message_type = TOPIC_MESSAGE_TYPES.get(topic)
+        if message_type is None:
+            continue
+
+        with open(data_filename) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                received = data.get("timestampReceivedData") or data.get("timestamp") or None
+                topics.setdefault(topic, []).append((received, message_type.from_dict(data)))
+
+    times = [received for records in topics.values() for received, _ in records if received is not None]
+    messages = []
+    for topic, records in topics.items():
+        if all(received is None for received, _ in records):
+            if not times:
+                logger.warning(f"Skipping {len(records)} {topic} messages: no timestamped topic to time them by")
+                continue
+            # Evenly over the timeline
+            step = (max(times) - min(times)) / max(len(records) - 1, 1)
+            messages.extend((min(times) + i * step, topic, message) for i, (_, message) in enumerate(records))
+            logger.warning(f"{topic} messages have no timestamp: spread over the run's timeline")
+            continue
+
+        # Untimestamped messages take the previous time (or the first one, at the start of the file)
+        previous = next(received for received, _ in records if received is not None)
+        for received, message in records:
+            previous = previous if received is None else received
+            messages.append((previous, topic, message))
+
+    # Sort by time, keeping the order of each file for equal times
+    messages.sort(key=lambda message: message[0])
+    writer = MessageLogWriter(filename, fsync_interval=float("inf"))
+    for received, topic, message in messages:
+        writer.write_message(received, topic, message)
+    writer.close()
+    return len(messages)
+
+
+def open_log_directory(log_directory) -> MessageLogReader:
+    """
+    The recording of a log directory, imported from its .data files the first time if it only has those.
+    """
+    filename = os.path.join(log_directory, RECORDING_FILENAME)
+    if not os.path.exists(filename) and glob.glob(os.path.join(log_directory, "*.data")):
+        import_data_files(log_directory, filename)
+    return MessageLogReader(filename)
+
+
+@click.command()
+@click.argument("path")
+def main(path):
+    """
+    Print the topics, message counts and time span of a recording (or of a log directory's recording,
+    converted from its .data files if needed).
+    """
+    reader = open_log_directory(path) if os.path.isdir(path) else MessageLogReader(path)
+    if reader.start_time is None:
+        print(f"{reader.filename}: empty")
+        return
+
+    print(f"{reader.filename}: {reader.end_time - reader.start_time:.1f} s, {reader.count()} messages")
+    if not reader.indexed:
+        print("No index (the recording was not closed): rebuilt from the chunk headers")
+    for topic, chunks in reader.chunks.items():
+        print(f"{topic:>16s}  {reader.count(topic):>8d} messages  {len(chunks):>5d} chunks")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Typed messages for the pub_sub topics, with a compact binary encoding.
+
+Every message is a fixed struct layout behind a 2 byte header, followed by its trace:
+    schema version (uint8) | message type (uint8) | fields | hop count (uint8) | (hop id (uint8), time (double))...
+all big endian.
+
+- Publisher.send_msg() / Subscriber.recv_msg() send and return these objects
+- Missing optional values (a timestamp, a covariance) are sent as NaN and come back as None
+- to_dict() / from_dict() convert to and from the JSON dicts used by the logs
+- Changing a layout means bumping SCHEMA_VERSION: decoding a message of another version raises ValueError
+- The trace is the time at which each stage of the pipeline handled the data, see tracing.py.
+  It is carried over the wire, but not in the JSON dicts
+"""
+
+import math
+import struct
+import time
+
+
+SCHEMA_VERSION = 2
+
+HEADER = struct.Struct(">BB")
+TRACE_COUNT = struct.Struct(">B")
+TRACE_HOP = struct.Struct(">Bd")
+MAX_TRACE_HOPS = 255
+
+NAN_COVARIANCE = [math.nan] * 9
+
+
+class Message:
+    TYPE_ID = None  # type: int
+    FIELDS = ()  # attribute names, in layout order
+    FORMAT = ""  # struct format of the fields, without the header
+    OPTIONAL = ()  # fields that may be None
+    TIME_FIELDS = ()  # fields holding a time.time() timestamp
+
+    _struct = None  # type: struct.Struct
+
+    trace = ()  # ((hop id, time), ...), oldest first
+
+    @classmethod
+    def _get_struct(cls) -> struct.Struct:
+        if cls._struct is None:
+            cls._struct = struct.Struct(">BB" + cls.FORMAT)
+        return cls._struct
+
+    def _values(self):
+        values = []
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is None:
+                value = math.nan
+            values.append(value)
+        return values
+
+    def encode(self) -> bytes:
+        trace = self.trace[-MAX_TRACE_HOPS:]
+        data = self._get_struct().pack(SCHEMA_VERSION, self.TYPE_ID, *self._values()) + TRACE_COUNT.pack(len(trace))
+        if trace:
+            data += b"".join(TRACE_HOP.pack(hop, timestamp) for hop, timestamp in trace)
+        return data
+
+    def add_hop(self, hop, timestamp=None):
+        """
+        Append a stage to the trace, at `timestamp` or now. Returns the message.
+        """
+        self.trace = self.trace + ((hop, time.time() if timestamp is None else timestamp),)
+        return self
+
+    def shift_times(self, offset):
+        """
+        Move the timestamps and the trace by `offset` (s), e.g. to replay a recording at the current time.
+        Returns the message.
+        """
+        for name in self.TIME_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, value + offset)
+        self.trace = tuple((hop, timestamp + offset) for hop, timestamp in self.trace)
+        return self
+
+    @classmethod
+    def _from_values(cls, values):
+        message = cls.__new__(cls)
+        fields = dict(zip(cls.FIELDS, values))
+        for name in cls.OPTIONAL:
+            if fields[name] != fields[name]:  # NaN
+                fields[name] = None
+        message.__dict__.update(fields)
+        return message
+
+    @classmethod
+    def decode(cls, data: bytes):
+        version, type_id = HEADER.unpack_from(data)
+        if version != SCHEMA_VERSION or type_id != cls.TYPE_ID:
+            raise ValueError(f"Expected {cls.__name__} v{SCHEMA_VERSION}, got type {type_id} v{version}")
+        layout = cls._get_struct()
+        try:
+            values = layout.unpack_from(data)
+            (count,) = TRACE_COUNT.unpack_from(data, layout.size)
+            offset = layout.size + TRACE_COUNT.size
+            if len(data) != offset + count * TRACE_HOP.size:
+                raise struct.error(f"{len(data)} bytes for a trace of {count} hops")
+            trace = tuple(TRACE_HOP.unpack_from(data, offset + i * TRACE_HOP.size) for i in range(count))
+        except struct.error as e:
+            raise ValueError(f"Bad {cls.__name__}: {e}")
+
+        message = cls._from_values(values[2:])
+        if trace:
+            message.trace = trace
+        return message
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict() and self.trace == other.trace
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+class CovarianceMessage(Message):
+    """
+    A message whose last 9 fields are a row major 3x3 covariance, exposed as a list or None.
+    """
+
+    def _values(self):
+        values = super()._values()
+        return values + (self.covariance if self.covariance is not None else NAN_COVARIANCE)
+
+    @classmethod
+    def _from_values(cls, values):
+        message = super()._from_values(values[:-9])
+        covariance = values[-9:]
+        message.covariance = None if covariance[0] != covariance[0] else list(covariance)
+        return message
+
+
+class GPSMessage(Message):
+    """
+    A phone GPS fix. Angles in radians, heading is a compass heading (0 = North, clockwise).
+    """
+
+    TYPE_ID = 1
+    FIELDS = (
+        "timestamp",
+        "timestamp_received",
+        "latitude",
+        "longitude",
+        "gps_accuracy",
+        "heading",
+        "heading_accuracy",
+    )
+    FORMAT = "ddddfff"
+    OPTIONAL = ("timestamp", "timestamp_received")
+    TIME_FIELDS = ("timestamp", "timestamp_received")
+
+    def __init__(
+        self,
+        latitude,
+        longitude,
+        gps_accuracy=-1.0,
+        heading=0.0,
+        heading_accuracy=-1.0,
+        timestamp=None,
+        timestamp_received=None,
+    ):
+        self.timestamp = timestamp  # phone fix time
+        self.timestamp_received = timestamp_received  # sensor server receipt time
+        self.latitude = latitude
+        self.longitude = longitude
+        self.gps_accuracy = gps_accuracy  # m, negative when invalid
+        self.heading = heading
+        self.heading_accuracy = heading_accuracy  # negative when invalid
+
+    def to_dict(self) -> dict:
+        data = {
+            "timestamp": self.timestamp,
+            "longitude": self.longitude,
+            "latitude": self.latitude,
+            "gpsAccuracy": self.gps_accuracy,
+            "heading": self.heading,
+            "headingAccuracy": self.heading_accuracy,
+        }
+        if self.timestamp_received is not None:
+            data["timestampReceivedData"] = self.timestamp_received
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return GPSMessage(
+            latitude=data["latitude"],
+            longitude=data["longitude"],
+            gps_accuracy=data.get("gpsAccuracy", -1.0),
+            heading=data.get("heading", 0.0),
+            heading_accuracy=data.get("headingAccuracy", -1.0),
+            timestamp=data.get("timestamp"),
+            timestamp_received=data.get("timestampReceivedData"),
+        )
+
+
+class PoseMessage(CovarianceMessage):
+    """
+    A robot pose in the UTM frame, valid at `timestamp`.
+    """
+
+    TYPE_ID = 2
+    FIELDS = ("timestamp", "x", "y", "th")
+    FORMAT = "dddd9f"
+    OPTIONAL = ("timestamp",)
+    TIME_FIELDS = ("timestamp",)
+
+    def __init__(self, x, y, th, timestamp=None, covariance=None):
+        self.timestamp = timestamp
+        self.x = x
+        self.y = y
+        self.th = th
+        self.covariance = covariance
+
+    def to_dict(self) -> dict:
+        data = {"x": self.x, "y": self.y, "th": self.th, "timestamp": self.timestamp}
+        if self.covariance is not None:
+            data["covariance"] = self.covariance
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return PoseMessage(data["x"], data["y"], data["th"], data.get("timestamp"), data.get("covariance"))
+
+
+class ConeDetectionMessage(Message):
+    """
+    The largest cone in the camera image. Coordinates are normalized to the image size.
+    """
+
+    TYPE_ID = 3
+    FIELDS = ("x", "y", "width", "height", "score", "class_id")
+    FORMAT = "fffffH"
+
+    def __init__(self, x=0.5, y=0.5, width=0.0, height=0.0, score=0.0, class_id=0):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.score = score
+        self.class_id = class_id
+
+    def to_dict(self) -> dict:
+        return {
+            "x": self.x,
+            "y": self.y,
+            "width": self.width,
+            "height": self.height,
+            "score": self.score,
+            "class": self.class_id,
+        }
+
+    @staticmethod
+    def from_dict(data):
+        return ConeDetectionMessage(
+            x=data.get("x", 0.5),
+            y=data.get("y", 0.5),
+            width=data.get("width", 0.0),
+            height=data.get("height", 0.0),
+            score=data.get("score", 0.0),
+            class_id=int(data.get("class", 0)),
+        )
+
+
+class WheelOdometryMessage(CovarianceMessage):
+    """
+    Integrated wheel odometry, in the odometry frame.
+    """
+
+    TYPE_ID = 4
+    FIELDS = ("timestamp", "x", "y", "th", "linear_vel", "angular_vel")
+    FORMAT = "ddddff9f"
+    TIME_FIELDS = ("timestamp",)
+
+    def __init__(self, timestamp, x, y, th, linear_vel=0.0, angular_vel=0.0, covariance=None):
+        self.timestamp = timestamp
+        self.x = x
+        self.y = y
+        self.th = th
+        self.linear_vel = linear_vel
+        self.angular_vel = angular_vel
+        self.covariance = covariance
+
+    def to_dict(self) -> dict:
+        data = {
+            "timestamp": self.timestamp,
+            "x": self.x,
+            "y": self.y,
+            "th": self.th,
+            "linear_vel": self.linear_vel,
+            "angular_vel": self.angular_vel,
+        }
+        if self.covariance is not None:
+            data["covariance"] = self.covariance
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return WheelOdometryMessage(
+            data["timestamp"],
+            data["x"],
+            data["y"],
+            data["th"],
+            data.get("linear_vel", 0.0),
+            data.get("angular_vel", 0.0),
+            data.get("covariance"),
+        )
+
+
+class CmdVelMessage(Message):
+    """
+    The velocities commanded by the control loop.
+    """
+
+    TYPE_ID = 5
+    FIELDS = ("timestamp", "linear_vel", "angular_vel")
+    FORMAT = "dff"
+    TIME_FIELDS = ("timestamp",)
+
+    def __init__(self, timestamp, linear_vel, angular_vel):
+        self.timestamp = timestamp
+        self.linear_vel = linear_vel
+        self.angular_vel = angular_vel
+
+    def to_dict(self) -> dict:
+        return {"timestamp": self.timestamp, "linear_vel": self.linear_vel, "angular_vel": self.angular_vel}
+
+    @staticmethod
+    def from_dict(data):
+        return CmdVelMessage(data["timestamp"], data["linear_vel"], data["angular_vel"])
+
+
+MESSAGE_TYPES = {
+    message_type.TYPE_ID: message_type
+    for message_type in (GPSMessage, PoseMessage, ConeDetectionMessage, WheelOdometryMessage, CmdVelMessage)
+}
+
+
+def decode_message(data: bytes) -> Message:
+    """
+    Decode a message of any type, from its header.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(f"Message too short: {len(data)} bytes")
+    message_type = MESSAGE_TYPES.get(data[1])
+    if message_type is None:
+        raise ValueError(f"Unknown message type {data[1]}")
+    return message_type.decode(data)
@@ -1,5 +1,6 @@
 from custom_logger import get_logger
 from utils.gps import GPSWaypoint
+from utils.projection import set_projection_origin
 
 
 logger = get_logger("mission")
@@ -24,6 +25,10 @@ class Mission:
                 self.waypoints.append(waypoint)
 
         logger.info(f"Loaded {len(self.waypoints)} waypoints from '{filename}'")
+
+        # Convert every GPS coordinate of the mission with one projection, centred on the course
+        if self.waypoints:
+            set_projection_origin(self.waypoints[0].gps.lat, self.waypoints[0].gps.lon)
         for i, waypoint in enumerate(self.waypoints):
             if waypoint.is_route:
                 logger.info(f"Waypoint {i}: 📍 {waypoint.gps.lat}, {waypoint.gps.lon}")
@@ -3,22 +3,60 @@ import time
 
 from behaviors import BehaviorResult, BehaviorType, NavToPose, SearchForCone, NoopBehavior
 from custom_logger import get_logger
+from geometry import normalize_th_2pi
+from messages import CmdVelMessage, PoseMessage
 from mobile_robot_base import MobileRobotBase
-from motors import set_motor_speeds, stop_motors
-from pub_sub import get_subscriber_pose
-from utils.gps import GPSPose, Pose
+from motors import cmd_vel_to_wheel_speeds, set_motor_speeds
+from pose_prediction import CmdVelHistory, MAX_PREDICTION
+from profiling import get_profiler
+from pub_sub import MultiSubscriber, get_publisher_cmd_vel, get_subscriber_cone_detections, get_subscriber_pose
+from tracing import HOP_BEHAVIOR_STEP, HOP_MOTOR_SETPOINT, TraceRecorder, format_trace
+from utils.gps import Pose
+from utils.projection import get_projection
+from utils.rate_scheduler import RateScheduler
+from utils.stats import SampleStats
 
 
 logger = get_logger("mobile_robot_magellan")
 
 
 class MobileRobotMagellan(MobileRobotBase):
-    def __init__(self):
+    def __init__(self, period=0.1, event_driven=False, min_period=0.02, scheduler: RateScheduler = None):
+        """
+        period: the longest a step waits for the pose and the behavior's topics (s)
+        event_driven: step as soon as any of the topics has a new message, instead of waiting for all of them.
+            `period` is then the fallback when nothing arrives, and `min_period` caps the step rate.
+        scheduler: the fixed-rate loop's scheduler. Steps wait for their topics until its next deadline at the most.
+        """
+        self.period = period
+        self.scheduler = scheduler
+        self.event_driven = event_driven
+        self.min_period = min_period
+        self.last_step_time = None
         self.pose = None
+        self.pose_time = None  # when self.pose was valid, if the pose estimator said so
         self.behavior = None
 
         self.path = []  # type: list[Pose]
         self.pose_subscriber = get_subscriber_pose()
+        self.receiver = MultiSubscriber([self.pose_subscriber])
+
+        # Connect to the cone detections now, so the cone behaviors get a warm subscriber
+        get_subscriber_cone_detections()
+
+        # The pose estimator's filter uses the commanded velocities as a motion model
+        self.cmd_vel_publisher = get_publisher_cmd_vel()
+
+        # Poses are predicted forward to the time of the step with the recent commands
+        self.cmd_vel_history = CmdVelHistory()
+        self.pose_age = SampleStats()  # pose valid time (GPS fix time) -> step that uses it
+        self.command_latency = SampleStats()  # pose valid time -> motor command computed from that pose
+
+        # Latency of each hop from the phone fix to the motor command, carried by the pose message
+        self.pose_trace = ()
+        self.trace_recorder = TraceRecorder()
+
+        self.profiler = get_profiler("mobile_robot_magellan")
 
     def wait_for_pose(self, timeout=10):
         start_time = time.time()
@@ -26,9 +64,9 @@ class MobileRobotMagellan(MobileRobotBase):
         while time.time() - start_time < timeout:
             logger.info("Waiting for pose...")
 
-            pose_dict = self.pose_subscriber.receive_json()  # Ex: {"x": 0, "y": 0, "th": 0}
-            if pose_dict is not None:
-                self.pose = Pose(**pose_dict)
+            pose_msg = self.pose_subscriber.recv_msg()
+            if pose_msg is not None:
+                self.set_pose(pose_msg)
                 logger.info(f"Got pose: {self.pose}")
                 return
             else:
@@ -51,42 +89,97 @@ class MobileRobotMagellan(MobileRobotBase):
         else:
             raise ValueError(f"Invalid behavior type: {behavior_type}")
 
+        # Wait on the pose and whatever the behavior reads, with one deadline per step
+        self.receiver.close()
+        self.receiver = MultiSubscriber([self.pose_subscriber] + getattr(self.behavior, "subscribers", []))
+
     def step(self) -> BehaviorResult:
-        pose_dict = self.pose_subscriber.receive_json()
-        if pose_dict is not None:
-            self.pose = Pose(**pose_dict)
+        profiler = self.profiler
+        t = profiler.start()
+
+        if self.event_driven:
+            # Cap the rate. Messages arriving meanwhile stay queued, and only the newest is kept.
+            if self.last_step_time is not None:
+                delay = self.last_step_time + self.min_period - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self.receiver.wait(self.period, wait_for_all=False)
+        else:
+            # Returns once every topic has a message, or after one period at the most
+            self.receiver.wait(self.scheduler.remaining() if self.scheduler is not None else self.period)
+        self.last_step_time = time.monotonic()
+        t = profiler.lap("wait", t)
+
+        pose_msg = self.pose_subscriber.recv_msg(block=False)
+        if pose_msg is not None:
+            self.set_pose(pose_msg)
         else:
             logger.info("Using stale pose")
+            profiler.count("stale_pose")
+        t = profiler.lap("receive", t)
 
-        cmd_vel, behavior_result = self.behavior.step(self.pose)
-        linear_vel = cmd_vel.linear_vel
-        angular_vel = cmd_vel.angular_vel
+        # Steer on where the robot is now, not where it was when the GPS fix was taken
+        now = time.time()
+        predicted_pose = self.pose
+        if self.pose_time is not None:
+            self.pose_age.add(now - self.pose_time)
+            predicted_pose = self.cmd_vel_history.predict(self.pose, max(self.pose_time, now - MAX_PREDICTION), now)
+        t = profiler.lap("predict", t)
 
-        # convert linear and angular velocities to left and right wheel speeds
-        left_speed = linear_vel - angular_vel * 0.5
-        right_speed = linear_vel + angular_vel * 0.5
-
-        m = 5
-        left_speed = left_speed / m
-        right_speed = right_speed / m
+        cmd_vel, behavior_result = self.behavior.step(predicted_pose)
+        self.cmd_vel_history.add(now, cmd_vel)
+        t = profiler.lap("behavior", t)
 
+        # convert linear and angular velocities to left and right wheel speeds
+        left_speed, right_speed = cmd_vel_to_wheel_speeds(cmd_vel)
+        t = profiler.lap("wheel_speeds", t)
         set_motor_speeds(left_speed, right_speed)
+        setpoint_time = time.time()
+        t = profiler.lap("motors", t)
+        if pose_msg is not None and pose_msg.timestamp is not None:
+            self.command_latency.add(setpoint_time - pose_msg.timestamp)
+
+        cmd_vel_msg = CmdVelMessage(now, cmd_vel.linear_vel, cmd_vel.angular_vel)
+        cmd_vel_msg.trace = self.pose_trace
+        cmd_vel_msg.add_hop(HOP_BEHAVIOR_STEP, now).add_hop(HOP_MOTOR_SETPOINT, setpoint_time)
+        if self.trace_recorder.record(cmd_vel_msg.trace):
+            logger.warning(f"Stale data: {format_trace(cmd_vel_msg.trace)}")
+        self.cmd_vel_publisher.send_msg(cmd_vel_msg)
+        t = profiler.lap("publish", t)
 
         # Keep track of the path
-        self.path.append(self.pose.copy())
+        self.path.append(predicted_pose.copy())
+        profiler.lap("path", t)
+        profiler.count("steps")
 
         return behavior_result
 
+    def set_pose(self, pose_msg: PoseMessage):
+        self.pose = Pose(pose_msg.x, pose_msg.y, pose_msg.th)
+        self.pose_time = pose_msg.timestamp
+        self.pose_trace = pose_msg.trace
+
+    def stats(self) -> dict:
+        return {
+            "pose_age": self.pose_age.summary(),
+            "command_latency": self.command_latency.summary(),
+            "trace": self.trace_recorder.summary(),
+        }
+
+    def close(self):
+        self.receiver.close()
+        self.cmd_vel_publisher.close()
+
     def visualize_path(self, output_file="path.html"):
         import folium
         from branca.colormap import LinearColormap
 
-        # Convert Poses to GPS Poses.
-        path_gps = [GPSPose(pose) for pose in self.path]
+        # Convert the path to GPS coordinates in one go
+        lats, lons = get_projection().to_latlon_batch([pose.x for pose in self.path], [pose.y for pose in self.path])
 
         # Calculate the center of the map
-        center_lat = sum(gp.lat for gp in path_gps) / len(path_gps)
-        center_lon = sum(gp.lon for gp in path_gps) / len(path_gps)
+        center_lat = lats.mean()
+        center_lon = lons.mean()
 
         # Create a map centered on the average coordinates
         m = folium.Map(
@@ -106,8 +199,8 @@ class MobileRobotMagellan(MobileRobotBase):
         colormap = LinearColormap(colors=["red", "yellow", "green", "blue", "red"], vmin=0, vmax=360)
 
         # Prepare data for PolyLine
-        points = [(gp.lat, gp.lon) for gp in path_gps]
-        headings = [math.degrees(gp.th) for gp in path_gps]
+        points = list(zip(lats.tolist(), lons.tolist()))
+        headings = [math.degrees(normalize_th_2pi(pose.th)) for pose in self.path]
 
         # Add colored line segments to the map
         for i in range(len(points) - 1):
@@ -2,8 +2,12 @@ import math
 
 from behaviors import BehaviorResult, BehaviorType, NavToPose, SearchForCone
 from custom_logger import get_logger
+from geometry import normalize_th_2pi
 from mobile_robot_base import MobileRobotBase
-from utils.gps import GPSPose, Pose
+from motors import cmd_vel_to_wheel_speeds, set_motor_speeds
+from profiling import get_profiler
+from utils.gps import Pose
+from utils.projection import get_projection
 
 
 logger = get_logger("mobile_robot_sim")
@@ -15,6 +19,7 @@ class MobileRobotSim(MobileRobotBase):
         self.sim_dt = sim_dt
         self.behavior = None
         self.path = []  # type: list[Pose]
+        self.profiler = get_profiler("mobile_robot_sim")
 
     def start_behavior(self, behavior_type, **kwargs):
         if behavior_type == BehaviorType.NAV_TO_POSE:
@@ -32,11 +37,25 @@ class MobileRobotSim(MobileRobotBase):
             raise ValueError(f"Invalid behavior type: {behavior_type}")
 
     def step(self) -> BehaviorResult:
+        profiler = self.profiler
+        t = profiler.start()
+
         cmd_vel, behavior_result = self.behavior.step(self.pose)
+        t = profiler.lap("behavior", t)
+
+        # Send the wheel speeds through the same motor pipeline as the real robot
+        left_speed, right_speed = cmd_vel_to_wheel_speeds(cmd_vel)
+        t = profiler.lap("wheel_speeds", t)
+        set_motor_speeds(left_speed, right_speed)
+        t = profiler.lap("motors", t)
+
         self.pose.update(cmd_vel, self.sim_dt)
+        t = profiler.lap("simulate", t)
 
         # Keep track of the path
         self.path.append(self.pose.copy())
+        profiler.lap("path", t)
+        profiler.count("steps")
 
         return behavior_result
 
@@ -44,12 +63,12 @@ class MobileRobotSim(MobileRobotBase):
         import folium
         from branca.colormap import LinearColormap
 
-        # Convert Poses to GPS Poses.
-        path_gps = [GPSPose(pose) for pose in self.path]
+        # Convert the path to GPS coordinates in one go
+        lats, lons = get_projection().to_latlon_batch([pose.x for pose in self.path], [pose.y for pose in self.path])
 
         # Calculate the center of the map
-        center_lat = sum(gp.lat for gp in path_gps) / len(path_gps)
-        center_lon = sum(gp.lon for gp in path_gps) / len(path_gps)
+        center_lat = lats.mean()
+        center_lon = lons.mean()
 
         # Create a map centered on the average coordinates
         m = folium.Map(
@@ -69,8 +88,8 @@ class MobileRobotSim(MobileRobotBase):
         colormap = LinearColormap(colors=["red", "yellow", "green", "blue", "red"], vmin=0, vmax=360)
 
         # Prepare data for PolyLine
-        points = [(gp.lat, gp.lon) for gp in path_gps]
-        headings = [math.degrees(gp.th) for gp in path_gps]
+        points = list(zip(lats.tolist(), lons.tolist()))
+        headings = [math.degrees(normalize_th_2pi(pose.th)) for pose in self.path]
 
         # Add colored line segments to the map
         for i in range(len(points) - 1):
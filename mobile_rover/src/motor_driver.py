@@ -0,0 +1,222 @@
+"""
+A MotorDriver that owns the Roboclaw serial port on its own thread.
+
+- Callers hand over speed setpoints with set_speeds(), which never blocks on the serial link
+- Only the newest setpoint is kept. The thread pushes it to both controllers at a fixed rate,
+  and right away when a new setpoint comes in
+- Both controllers share one serial link. By default their packets are pipelined: written
+  back-to-back with the acks collected together, so an update costs about one round trip
+- Optionally, the thread also polls both controllers' encoder counts between writes. The newest
+  sample is available through read_encoders() / wait_for_encoders()
+- Latency, retry and CRC counters are available through stats()
+"""
+
+import threading
+import time
+
+from custom_logger import get_logger
+from roboclaw import Roboclaw
+from utils.stats import SampleStats
+
+
+logger = get_logger("motor_driver")
+
+
+class MotorDriver:
+    def __init__(self, roboclaw: Roboclaw, address_right, address_left, rate=50, pipelined=True, encoder_rate=None):
+        """
+        encoder_rate: poll the encoders at this rate. None disables polling.
+        """
+        self.roboclaw = roboclaw
+        self.address_right = address_right
+        self.address_left = address_left
+        self.period = 1 / rate
+        self.pipelined = pipelined
+        self.encoder_period = 1 / encoder_rate if encoder_rate else None
+
+        # Newest setpoint, in quadrature pulses per second: (right, left)
+        self._setpoint = (0, 0)
+        self._setpoint_time = None
+        self._setpoint_seq = 0
+        self._written_seq = 0
+
+        # Newest encoder sample: (timestamp, right_ticks, left_ticks), each side averaged over M1 and M2
+        self._encoders = None
+        self._encoder_seq = 0
+
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        # Telemetry
+        self.command_latency = SampleStats()  # one SpeedM1M2 (or pipelined batch) round trip
+        self.cycle_latency = SampleStats()  # all controllers updated
+        self.setpoint_age = SampleStats()  # set_speeds() -> start of the write
+        self.commands_sent = 0
+        self.commands_failed = 0
+        self.setpoints_coalesced = 0
+        self.encoder_latency = SampleStats()  # both controllers' encoders read
+        self.encoder_reads_failed = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="motor_driver", daemon=True)
+        self._thread.start()
+        logger.info(f"Motor driver started at {1 / self.period:.0f} Hz")
+
+    def set_speeds(self, right_qpps, left_qpps):
+        with self._condition:
+            if self._setpoint_seq > self._written_seq:
+                self.setpoints_coalesced += 1
+            self._setpoint = (int(right_qpps), int(left_qpps))
+            self._setpoint_time = time.perf_counter()
+            self._setpoint_seq += 1
+            self._condition.notify()
+
+    def flush(self, timeout=0.5) -> bool:
+        """
+        Wait until the newest setpoint has been written to the controllers.
+        """
+        with self._condition:
+            seq = self._setpoint_seq
+            return self._condition.wait_for(lambda: self._written_seq >= seq or not self._running, timeout)
+
+    def read_encoders(self):
+        """
+        Newest encoder sample as (timestamp, right_ticks, left_ticks), or None before the first one.
+        """
+        with self._condition:
+            return self._encoders
+
+    def wait_for_encoders(self, seq=0, timeout=None):
+        """
+        Wait for an encoder sample newer than `seq`. Returns (seq, sample), or (seq, None) on timeout.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._encoder_seq > seq or not self._running, timeout):
+                return seq, None
+            if self._encoder_seq <= seq:
+                return seq, None
+            return self._encoder_seq, self._encoders
+
+    def stop(self, timeout=0.5):
+        """
+        Command zero speed, wait for it to go out and stop the thread.
+        """
+        self.set_speeds(0, 0)
+        self.flush(timeout)
+
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "commands_sent": self.commands_sent,
+            "commands_failed": self.commands_failed,
+            "setpoints_coalesced": self.setpoints_coalesced,
+            "retries": self.roboclaw.retry_count,
+            "timeouts": self.roboclaw.timeout_count,
+            "crc_errors": self.roboclaw.crc_error_count,
+            "command_latency": self.command_latency.summary(),
+            "cycle_latency": self.cycle_latency.summary(),
+            "setpoint_age": self.setpoint_age.summary(),
+            "encoder_latency": self.encoder_latency.summary(),
+            "encoder_reads_failed": self.encoder_reads_failed,
+        }
+
+    def _run(self):
+        next_time = time.perf_counter()
+        next_encoder_time = next_time if self.encoder_period else float("inf")
+        while True:
+            with self._condition:
+                # Sleep until the next periodic refresh or encoder poll, or until a new setpoint arrives
+                self._condition.wait_for(
+                    lambda: not self._running or self._setpoint_seq > self._written_seq,
+                    max(0.0, min(next_time, next_encoder_time) - time.perf_counter()),
+                )
+                if not self._running:
+                    break
+                setpoint = self._setpoint
+                setpoint_time = self._setpoint_time
+                seq = self._setpoint_seq
+
+            # Setpoints go first, encoder polls fill the gaps between them
+            if seq > self._written_seq or time.perf_counter() >= next_time:
+                if setpoint_time is not None and seq > self._written_seq:
+                    self.setpoint_age.add(time.perf_counter() - setpoint_time)
+
+                self._write(*setpoint)
+
+                with self._condition:
+                    self._written_seq = seq
+                    self._condition.notify_all()
+
+                next_time = time.perf_counter() + self.period
+
+            if time.perf_counter() >= next_encoder_time:
+                self._read_encoders()
+                next_encoder_time = max(next_encoder_time + self.encoder_period, time.perf_counter())
+
+    def _read_encoders(self):
+        start_t = time.perf_counter()
+        wall_start_t = time.time()
+        try:
+            right = self.roboclaw.ReadEncoders(self.address_right)
+            left = self.roboclaw.ReadEncoders(self.address_left)
+        except Exception as e:
+            logger.error(f"ReadEncoders raised {e!r}")
+            right = left = (0, 0, 0)
+        duration = time.perf_counter() - start_t
+        self.encoder_latency.add(duration)
+
+        if not right[0] or not left[0]:
+            self.encoder_reads_failed += 1
+            return
+
+        # Stamp the sample halfway through the two reads
+        sample = (wall_start_t + duration / 2, (right[1] + right[2]) / 2, (left[1] + left[2]) / 2)
+        with self._condition:
+            self._encoders = sample
+            self._encoder_seq += 1
+            self._condition.notify_all()
+
+    def _write(self, right_qpps, left_qpps):
+        start_t = time.perf_counter()
+        if self.pipelined:
+            self._write_pipelined(right_qpps, left_qpps)
+        else:
+            self._write_sequential(right_qpps, left_qpps)
+        self.cycle_latency.add(time.perf_counter() - start_t)
+
+    def _write_pipelined(self, right_qpps, left_qpps):
+        commands = [(self.address_right, right_qpps, right_qpps), (self.address_left, left_qpps, left_qpps)]
+        command_start_t = time.perf_counter()
+        try:
+            ok = self.roboclaw.SpeedM1M2Batch(commands)
+        except Exception as e:
+            logger.error(f"SpeedM1M2Batch raised {e!r}")
+            ok = False
+        self.command_latency.add(time.perf_counter() - command_start_t)
+        self.commands_sent += len(commands)
+        if not ok:
+            self.commands_failed += len(commands)
+
+    def _write_sequential(self, right_qpps, left_qpps):
+        for address, qpps in ((self.address_right, right_qpps), (self.address_left, left_qpps)):
+            command_start_t = time.perf_counter()
+            try:
+                ok = self.roboclaw.SpeedM1M2(address, qpps, qpps)
+            except Exception as e:
+                logger.error(f"SpeedM1M2 to {address:#x} raised {e!r}")
+                ok = False
+
+            self.command_latency.add(time.perf_counter() - command_start_t)
+            self.commands_sent += 1
+            if not ok:
+                self.commands_failed += 1
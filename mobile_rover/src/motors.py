@@ -1,8 +1,26 @@
+"""
+Motor backends.
+
+- The control stack drives the motors through set_motor_speeds() / stop_motors()
+- The backend is picked at startup with select_motor_backend() and created on first use,
+  so importing this module never touches hardware
+- Backends:
+    roboclaw: the Roboclaw controllers on the robot's serial port
+    sim: the same driver and motor pipeline, talking to the Roboclaw emulator on a pseudo-terminal
+    null: accepts setpoints and drives nothing
+"""
+
+from abc import ABC, abstractmethod
+import threading
+
+from cmd_vel import CmdVel
+from config_manager import encoder_poll_rate, motor_backend, motor_serial_baud, motor_serial_port
+from custom_logger import get_logger
+from motor_driver import MotorDriver
 from roboclaw import Roboclaw
 
-# Initialize Roboclaw
-roboclaw = Roboclaw("/dev/ttyAMA0", 38400)
-roboclaw.Open()
+
+logger = get_logger("motors")
 
 # Roboclaw addresses
 ADDRESS_LEFT = 0x80
@@ -11,11 +29,189 @@ ADDRESS_RIGHT = 0x81
 # Max speed (adjust as needed)
 MAX_SPEED = 3000
 
+# Drive geometry. A wheel speed of 1 m/s is commanded as MAX_SPEED / SPEED_SCALE quadrature pulses per second.
+TRACK_WIDTH = 1.0  # m
+SPEED_SCALE = 5  # m/s
+TICKS_PER_METER = MAX_SPEED / SPEED_SCALE
+
+
+class MotorBackend(ABC):
+    @abstractmethod
+    def set_speeds(self, right_qpps, left_qpps):
+        """
+        Hand over a new setpoint. Must not block on I/O.
+        """
+        pass
+
+    @abstractmethod
+    def stop(self):
+        """
+        Command zero speed and wait for it to be applied.
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def read_encoders(self):
+        """
+        Newest encoder sample as (timestamp, right_ticks, left_ticks), or None if there is none.
+        """
+        return None
+
+    def wait_for_encoders(self, seq=0, timeout=None):
+        """
+        Wait for an encoder sample newer than `seq`. Returns (seq, sample), or (seq, None) on timeout.
+        """
+        return seq, None
+
+    def stats(self) -> dict:
+        return {}
+
+
+class RoboclawMotorBackend(MotorBackend):
+    def __init__(
+        self, comport=motor_serial_port, baud=motor_serial_baud, encoder_rate=encoder_poll_rate, **roboclaw_kwargs
+    ):
+        self.roboclaw = Roboclaw(comport, baud, **roboclaw_kwargs)
+        if not self.roboclaw.Open():
+            raise IOError(f"Could not open Roboclaw serial port {comport}")
+
+        # The motor driver thread owns the serial port. Setpoints are handed over without blocking.
+        self.motor_driver = MotorDriver(
+            self.roboclaw, address_right=ADDRESS_RIGHT, address_left=ADDRESS_LEFT, encoder_rate=encoder_rate
+        )
+        self.motor_driver.start()
+
+    def set_speeds(self, right_qpps, left_qpps):
+        self.motor_driver.set_speeds(right_qpps, left_qpps)
+
+    def stop(self):
+        self.motor_driver.set_speeds(0, 0)
+        self.motor_driver.flush()
+
+    def close(self):
+        self.motor_driver.stop()
+        self.roboclaw._port.close()
+
+    def read_encoders(self):
+        return self.motor_driver.read_encoders()
+
+    def wait_for_encoders(self, seq=0, timeout=None):
+        return self.motor_driver.wait_for_encoders(seq, timeout)
+
+    def stats(self) -> dict:
+        return self.motor_driver.stats()
+
+
+class SimMotorBackend(RoboclawMotorBackend):
+    def __init__(self, baud=None, encoder_rate=encoder_poll_rate):
+        from roboclaw_emulator import RoboclawEmulator
+
+        self.emulator = RoboclawEmulator(addresses=(ADDRESS_LEFT, ADDRESS_RIGHT), baud=baud)
+        super().__init__(self.emulator.start(), baud or motor_serial_baud, encoder_rate=encoder_rate, read_timeout=0.05)
+
+    def close(self):
+        super().close()
+        self.emulator.stop()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "emulator": self.emulator.stats()}
+
+
+class NullMotorBackend(MotorBackend):
+    def __init__(self, encoder_rate=None):
+        # No encoders to poll: encoder_rate is accepted like the other backends, and ignored
+        self.setpoint = (0, 0)
+        self.setpoint_count = 0
+
+    def set_speeds(self, right_qpps, left_qpps):
+        self.setpoint = (int(right_qpps), int(left_qpps))
+        self.setpoint_count += 1
+
+    def stop(self):
+        self.set_speeds(0, 0)
+
+    def stats(self) -> dict:
+        return {"setpoint_count": self.setpoint_count}
+
+
+MOTOR_BACKENDS = {
+    "roboclaw": RoboclawMotorBackend,
+    "sim": SimMotorBackend,
+    "null": NullMotorBackend,
+}
+
+_backend_name = motor_backend
+_backend_kwargs = {}
+_backend = None  # type: MotorBackend
+_backend_lock = threading.Lock()
+
+
+def select_motor_backend(name, **kwargs):
+    """
+    Pick the backend to create on first use. Closes the current one if it was already created.
+    """
+    global _backend_name, _backend_kwargs
+
+    if name not in MOTOR_BACKENDS:
+        raise ValueError(f"Invalid motor backend: {name}. Must be one of {list(MOTOR_BACKENDS)}.")
+
+    close_motors()
+    with _backend_lock:
+        _backend_name = name
+        _backend_kwargs = kwargs
+
+
+def get_motor_backend() -> MotorBackend:
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            logger.info(f"Starting '{_backend_name}' motor backend")
+            _backend = MOTOR_BACKENDS[_backend_name](**_backend_kwargs)
+        return _backend
+
+
+def motors_started() -> bool:
+    """
+    Whether the backend was created, i.e. something has used the motors.
+    """
+    return _backend is not None
+
+
+def close_motors():
+    global _backend
+
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
+
+def cmd_vel_to_wheel_speeds(cmd_vel: CmdVel):
+    """
+    Convert linear and angular velocities to normalized left and right wheel speeds.
+    """
+    left_speed = cmd_vel.linear_vel - cmd_vel.angular_vel * TRACK_WIDTH / 2
+    right_speed = cmd_vel.linear_vel + cmd_vel.angular_vel * TRACK_WIDTH / 2
+
+    left_speed = left_speed / SPEED_SCALE
+    right_speed = right_speed / SPEED_SCALE
+
+    return left_speed, right_speed
+
 
 def set_motor_speeds(right_speed, left_speed):
-    roboclaw.SpeedM1M2(ADDRESS_RIGHT, int(right_speed * MAX_SPEED), int(right_speed * MAX_SPEED))
-    roboclaw.SpeedM1M2(ADDRESS_LEFT, int(left_speed * MAX_SPEED), int(left_speed * MAX_SPEED))
+    get_motor_backend().set_speeds(int(right_speed * MAX_SPEED), int(left_speed * MAX_SPEED))
 
 
 def stop_motors():
-    set_motor_speeds(0, 0)
+    # Unlike set_motor_speeds, wait for the stop command to be applied
+    get_motor_backend().stop()
+
+
+def get_motor_stats():
+    if _backend is None:
+        return {}
+    return _backend.stats()
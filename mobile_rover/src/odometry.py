@@ -0,0 +1,199 @@
+"""
+Wheel odometry from the Roboclaw encoders.
+
+- The motor driver thread polls both controllers' encoder counts (see MotorDriver.encoder_rate).
+  It owns the serial port, so odometry runs in the process that drives the motors
+- WheelOdometry integrates differential drive kinematics and propagates a pose covariance
+- OdometryPublisher publishes every new sample on the wheel odometry topic
+
+Messages are WheelOdometryMessage: timestamp, x, y, th, linear and angular velocity, and the
+row major 3x3 covariance over x, y, th.
+
+The pose is in the odometry frame: it starts at (0, 0, 0) and drifts. It is smooth between GPS fixes,
+not absolute.
+"""
+
+import math
+import threading
+import time
+
+import click
+import numpy as np
+
+from custom_logger import get_logger
+from geometry import normalize_th_2pi
+from messages import WheelOdometryMessage
+from motors import MotorBackend, TICKS_PER_METER, TRACK_WIDTH, get_motor_backend, select_motor_backend
+from pub_sub import Publisher, get_publisher_wheel_odometry
+
+
+logger = get_logger("odometry")
+
+# Variance added per metre travelled by each wheel (m^2 / m). Skid steering slips a lot in turns.
+WHEEL_VARIANCE_PER_METER = 0.05**2
+
+
+def tick_delta(current, previous):
+    """
+    Difference of two int32 encoder counts, across a wrap around.
+    """
+    return (current - previous + 2**31) % 2**32 - 2**31
+
+
+class WheelOdometry:
+    def __init__(self, track_width=TRACK_WIDTH, ticks_per_meter=TICKS_PER_METER):
+        self.track_width = track_width
+        self.ticks_per_meter = ticks_per_meter
+
+        self.x = 0.0
+        self.y = 0.0
+        self.th = 0.0
+        self.linear_vel = 0.0
+        self.angular_vel = 0.0
+        self.covariance = np.zeros((3, 3))
+
+        self.timestamp = None
+        self._last_ticks = None
+
+    def update(self, timestamp, left_ticks, right_ticks):
+        """
+        Integrate one encoder sample. The first sample only sets the reference counts.
+        """
+        if self._last_ticks is None:
+            self._last_ticks = (left_ticks, right_ticks)
+            self.timestamp = timestamp
+            return
+
+        d_left = tick_delta(left_ticks, self._last_ticks[0]) / self.ticks_per_meter
+        d_right = tick_delta(right_ticks, self._last_ticks[1]) / self.ticks_per_meter
+        dt = timestamp - self.timestamp
+        self._last_ticks = (left_ticks, right_ticks)
+        self.timestamp = timestamp
+
+        d_center = (d_left + d_right) / 2
+        d_th = (d_right - d_left) / self.track_width
+
+        # Midpoint integration
+        th_mid = self.th + d_th / 2
+        cos_th, sin_th = math.cos(th_mid), math.sin(th_mid)
+
+        # Jacobians of the motion w.r.t. the pose and w.r.t. the wheel travel (d_left, d_right)
+        F_pose = np.array(
+            [
+                [1.0, 0.0, -d_center * sin_th],
+                [0.0, 1.0, d_center * cos_th],
+                [0.0, 0.0, 1.0],
+            ]
+        )
+        half_d_sin = d_center * sin_th / (2 * self.track_width)
+        half_d_cos = d_center * cos_th / (2 * self.track_width)
+        F_wheels = np.array(
+            [
+                [cos_th / 2 + half_d_sin, cos_th / 2 - half_d_sin],
+                [sin_th / 2 - half_d_cos, sin_th / 2 + half_d_cos],
+                [-1 / self.track_width, 1 / self.track_width],
+            ]
+        )
+        Q = np.diag([WHEEL_VARIANCE_PER_METER * abs(d_left), WHEEL_VARIANCE_PER_METER * abs(d_right)])
+        self.covariance = F_pose @ self.covariance @ F_pose.T + F_wheels @ Q @ F_wheels.T
+
+        self.x += d_center * cos_th
+        self.y += d_center * sin_th
+        self.th = normalize_th_2pi(self.th + d_th)
+
+        if dt > 0:
+            self.linear_vel = d_center / dt
+            self.angular_vel = d_th / dt
+
+    def to_message(self) -> WheelOdometryMessage:
+        return WheelOdometryMessage(
+            self.timestamp,
+            self.x,
+            self.y,
+            self.th,
+            self.linear_vel,
+            self.angular_vel,
+            self.covariance.flatten().tolist(),
+        )
+
+
+class OdometryPublisher:
+    """
+    Integrates every new encoder sample from a motor backend and publishes it, on its own thread.
+    """
+
+    def __init__(self, motor_backend: MotorBackend, publisher: Publisher, odometry: WheelOdometry = None):
+        self.motor_backend = motor_backend
+        self.publisher = publisher
+        self.odometry = odometry or WheelOdometry()
+        self.messages_published = 0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="odometry", daemon=True)
+        self._thread.start()
+        logger.info("Odometry publisher started")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        seq = 0
+        while not self._stop_event.is_set():
+            seq, sample = self.motor_backend.wait_for_encoders(seq, timeout=0.1)
+            if sample is not None:
+                self.publish_sample(sample)
+
+    def publish_sample(self, sample):
+        """
+        Integrate one encoder sample from the motor backend and publish the odometry.
+        """
+        # The control stack calls set_motor_speeds(left, right), so the controller at
+        # ADDRESS_RIGHT drives the robot's left side and ADDRESS_LEFT its right side.
+        timestamp, address_right_ticks, address_left_ticks = sample
+        first = self.odometry.timestamp is None
+        self.odometry.update(timestamp, left_ticks=address_right_ticks, right_ticks=address_left_ticks)
+        if first:
+            return
+
+        self.publisher.send_msg(self.odometry.to_message())
+        self.messages_published += 1
+
+
+def start_odometry_publisher() -> OdometryPublisher:
+    odometry_publisher = OdometryPublisher(get_motor_backend(), get_publisher_wheel_odometry())
+    odometry_publisher.start()
+    return odometry_publisher
+
+
+@click.command()
+@click.option("-b", "--backend", default="sim", help="Motor backend to read encoders from (roboclaw, sim)")
+def main(backend):
+    """
+    Publish wheel odometry on its own. Only for bench testing: on the robot, the process that
+    drives the motors owns the serial port and runs the odometry publisher itself.
+    """
+    select_motor_backend(backend)
+    odometry_publisher = start_odometry_publisher()
+
+    try:
+        while True:
+            time.sleep(1)
+            odometry = odometry_publisher.odometry
+            logger.info(
+                f"x: {odometry.x:.3f}, y: {odometry.y:.3f}, th: {math.degrees(odometry.th):.1f}, "
+                f"messages: {odometry_publisher.messages_published}"
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        odometry_publisher.stop()
+
+
+if __name__ == "__main__":
+    main()
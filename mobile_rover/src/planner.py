@@ -2,14 +2,14 @@ import math
 
 from scipy.spatial import distance
 import click
-import utm
 
 from pub_sub import get_subscriber_pose
 from motors import set_motor_speeds, stop_motors
+from utils.projection import get_projection
 
 
 def gps_to_xy(gps):
-    easting, northing, _, _ = utm.from_latlon(gps["latitude"], gps["longitude"])
+    easting, northing = get_projection(gps["latitude"], gps["longitude"]).to_xy(gps["latitude"], gps["longitude"])
     return {"x": easting, "y": northing, "th": None}
 
 
@@ -65,13 +65,14 @@ def main(goal_num):
         print("------")
 
         # Get current pose
-        current_pose = pose_subscriber.receive_json()
+        pose_msg = pose_subscriber.recv_msg()
 
         # Move till pose is initialized
-        if current_pose["th"] is None:
+        if pose_msg is None:
             print("Waiting for pose...")
             set_motor_speeds(0.25, 0.25)
             continue
+        current_pose = pose_msg.to_dict()
 
         # Check if we have reached the goal
         dist_to_goal = distace_between_poses(current_pose, goal_pose)
@@ -1,35 +1,349 @@
+"""
+Turns GPS fixes into robot poses.
+
+- Default: every GPS message is converted with gps_to_pose and republished as is
+- --filter: an EKF fuses GPS position and heading, weighted by gpsAccuracy and headingAccuracy, with
+  wheel odometry and/or the commanded CmdVel as the motion model. The filtered pose is published at a
+  fixed rate (50 Hz by default) regardless of how often the phone posts
+
+Every published pose carries "timestamp", the time at which it was valid: the GPS fix time without
+the filter, the publish time with it. The filter applies each fix against its own past state at the
+fix time, so a fix that took a few hundred ms to arrive does not drag the pose backwards.
+Consumers predict the pose forward from "timestamp" (see pose_prediction.py).
+"""
+
+from collections import deque
 import math
+import time
 
+import click
+import numpy as np
 from scipy.spatial import distance
-import utm
 
-from pub_sub import get_subscriber_gps
+from custom_logger import get_logger
+from geometry import normalize_th_2pi, normalize_th_pi
+from messages import GPSMessage, PoseMessage, WheelOdometryMessage
+from pub_sub import get_subscriber_cmd_vel, get_subscriber_gps, get_subscriber_wheel_odometry
 from pub_sub import get_publisher_pose
+from tracing import HOP_POSE_PUBLISH
+from utils.projection import get_projection
+from utils.rate_scheduler import RateScheduler
+from utils.stats import SampleStats
+
+
+logger = get_logger("pose_estimator")
+
+# Motion noise
+VARIANCE_PER_METER = 0.1**2  # m^2 of position variance added per metre travelled
+HEADING_VARIANCE_PER_METER = math.radians(5) ** 2  # rad^2 per metre travelled
+HEADING_VARIANCE_PER_RADIAN = math.radians(5) ** 2  # rad^2 per radian turned
+CMD_VEL_VARIANCE_SCALE = 4  # commanded velocities are a worse motion model than the encoders
+STATIONARY_VARIANCE_PER_SECOND = 0.01**2  # keeps the filter from becoming overconfident while stopped
+
+# Fallback measurement noise when the phone does not report a usable accuracy
+DEFAULT_GPS_ACCURACY = 5.0  # m
+DEFAULT_HEADING_ACCURACY = math.radians(20)
+
+# Motion model inputs older than this are ignored (s)
+MOTION_TIMEOUT = 0.5
 
+# How far back the filter remembers its states, to apply late GPS fixes (s)
+HISTORY_DURATION = 2.0
 
-def gps_to_pose(gps):
-    easting, northing, _, _ = utm.from_latlon(gps["latitude"], gps["longitude"])
-    gps_heading = gps["heading"]
+H_POSITION = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+H_POSE = np.eye(3)
+
+
+def gps_to_pose(gps: GPSMessage) -> PoseMessage:
+    # The first fix becomes the projection origin
+    easting, northing = get_projection(gps.latitude, gps.longitude).to_xy(gps.latitude, gps.longitude)
+    gps_heading = gps.heading
     heading = math.pi / 2 - gps_heading
     heading = (heading + 2 * math.pi) % (2 * math.pi)
-    return {"x": easting, "y": northing, "th": heading}
 
+    # The pose is valid at the time of the fix, and is the same data as far as tracing goes
+    pose = PoseMessage(easting, northing, heading, timestamp=gps.timestamp)
+    pose.trace = gps.trace
+    return pose
 
-def main():
-    print("Starting pose estimator")
+
+class PoseEKF:
+    """
+    Extended Kalman filter over the planar pose [x, y, th].
+    """
+
+    def __init__(self, history_duration=HISTORY_DURATION):
+        self.state = None  # type: np.ndarray
+        self.covariance = None  # type: np.ndarray
+
+        # (timestamp, state) of past states, oldest first
+        self.history_duration = history_duration
+        self.history = deque()
+
+        self._last_odometry = None
+        self.gps_updates = 0
+        self.heading_updates = 0
+        self.trace = ()  # of the newest fix applied
+
+    @property
+    def initialized(self):
+        return self.state is not None
+
+    def reset(self, x, y, th, position_variance, heading_variance):
+        self.state = np.array([x, y, normalize_th_2pi(th)])
+        self.covariance = np.diag([position_variance, position_variance, heading_variance])
+        self.history.clear()
+
+    def record(self, timestamp):
+        """
+        Remember the current state as valid at `timestamp`.
+        """
+        if not self.initialized:
+            return
+        self.history.append((timestamp, self.state.copy()))
+        while self.history and self.history[0][0] < timestamp - self.history_duration:
+            self.history.popleft()
+
+    def state_at(self, timestamp):
+        """
+        Newest recorded state at or before `timestamp`. The current state if unknown or in the future.
+        """
+        if timestamp is None or not self.history or timestamp >= self.history[-1][0]:
+            return self.state
+        for recorded_time, state in reversed(self.history):
+            if recorded_time <= timestamp:
+                return state
+        return self.history[0][1]
+
+    def _move(self, forward, lateral, d_th, motion_variance):
+        """
+        Move by (forward, lateral) in the robot frame, then turn by d_th.
+        """
+        th = self.state[2]
+        cos_th, sin_th = math.cos(th), math.sin(th)
+        self.state[0] += forward * cos_th - lateral * sin_th
+        self.state[1] += forward * sin_th + lateral * cos_th
+        self.state[2] = normalize_th_2pi(th + d_th)
+
+        F = np.array(
+            [
+                [1.0, 0.0, -forward * sin_th - lateral * cos_th],
+                [0.0, 1.0, forward * cos_th - lateral * sin_th],
+                [0.0, 0.0, 1.0],
+            ]
+        )
+        self.covariance = F @ self.covariance @ F.T + np.diag(motion_variance)
+
+    @staticmethod
+    def _motion_variance(dist, d_th, dt, scale=1.0):
+        position_variance = scale * VARIANCE_PER_METER * dist + STATIONARY_VARIANCE_PER_SECOND * dt
+        heading_variance = scale * (HEADING_VARIANCE_PER_METER * dist + HEADING_VARIANCE_PER_RADIAN * abs(d_th))
+        return [position_variance, position_variance, heading_variance]
+
+    def predict_cmd_vel(self, linear_vel, angular_vel, dt):
+        if not self.initialized or dt <= 0:
+            return
+        dist = linear_vel * dt
+        d_th = angular_vel * dt
+        # Midpoint heading for the translation
+        forward, lateral = dist * math.cos(d_th / 2), dist * math.sin(d_th / 2)
+        self._move(forward, lateral, d_th, self._motion_variance(abs(dist), d_th, dt, CMD_VEL_VARIANCE_SCALE))
+
+    def predict_odometry(self, odometry: WheelOdometryMessage):
+        """
+        Apply the motion between two wheel odometry messages. The odometry frame drifts, so only the
+        relative motion is used.
+        """
+        last, self._last_odometry = self._last_odometry, odometry
+        if last is None or not self.initialized:
+            return
+
+        dx = odometry.x - last.x
+        dy = odometry.y - last.y
+        cos_th, sin_th = math.cos(last.th), math.sin(last.th)
+        forward = dx * cos_th + dy * sin_th
+        lateral = -dx * sin_th + dy * cos_th
+        d_th = normalize_th_pi(odometry.th - last.th)
+        dt = max(0.0, odometry.timestamp - last.timestamp)
+
+        self._move(forward, lateral, d_th, self._motion_variance(math.hypot(dx, dy), d_th, dt))
+
+    def update_gps(self, gps: GPSMessage):
+        pose = gps_to_pose(gps)
+        self.trace = gps.trace
+        gps_accuracy = gps.gps_accuracy
+        heading_accuracy = gps.heading_accuracy
+
+        # The phone reports a negative accuracy when the value is invalid
+        position_variance = (gps_accuracy if gps_accuracy > 0 else DEFAULT_GPS_ACCURACY) ** 2
+        heading_variance = (heading_accuracy if heading_accuracy > 0 else DEFAULT_HEADING_ACCURACY) ** 2
+
+        if not self.initialized:
+            self.reset(pose.x, pose.y, pose.th, position_variance, heading_variance)
+            return
+
+        # Compare the fix with where the filter thought the robot was when the fix was taken,
+        # and apply the correction to the current state
+        past_state = self.state_at(gps.timestamp)
+
+        position_residual = [pose.x - past_state[0], pose.y - past_state[1]]
+        self.gps_updates += 1
+
+        if heading_accuracy > 0:
+            heading_residual = normalize_th_pi(pose.th - past_state[2])
+            R = np.diag([position_variance, position_variance, heading_variance])
+            self._update(H_POSE, np.array(position_residual + [heading_residual]), R)
+            self.heading_updates += 1
+        else:
+            R = np.diag([position_variance, position_variance])
+            self._update(H_POSITION, np.array(position_residual), R)
+
+    def _update(self, H, residual, R):
+        S = H @ self.covariance @ H.T + R
+        K = self.covariance @ H.T @ np.linalg.inv(S)
+        self.state = self.state + K @ residual
+        self.state[2] = normalize_th_2pi(self.state[2])
+        self.covariance = (np.eye(3) - K @ H) @ self.covariance
+
+    def to_message(self, timestamp) -> PoseMessage:
+        x, y, th = self.state.tolist()
+        pose = PoseMessage(x, y, th, timestamp=timestamp, covariance=self.covariance.flatten().tolist())
+        pose.trace = self.trace
+        return pose
+
+
+class GPSDelays:
+    """
+    How old GPS fixes are by the time they get here.
+    """
+
+    def __init__(self):
+        self.upload_delay = SampleStats()  # phone fix -> sensor server receipt
+        self.fix_age = SampleStats()  # phone fix -> pose estimator
+
+    def add(self, gps: GPSMessage, now):
+        if gps.timestamp is None:
+            return
+        self.fix_age.add(now - gps.timestamp)
+        if gps.timestamp_received is not None:
+            self.upload_delay.add(gps.timestamp_received - gps.timestamp)
+
+    def __str__(self) -> str:
+        return f"upload delay: {self.upload_delay}, fix age: {self.fix_age}"
+
+
+def run_passthrough():
     gps_subscriber = get_subscriber_gps()
     pose_publisher = get_publisher_pose()
+    gps_delays = GPSDelays()
 
     while True:
         # Get current pose from GPS
-        gps_json = gps_subscriber.receive_json()
-        if gps_json is None:
+        gps = gps_subscriber.recv_msg()
+        if gps is None:
             continue
-        current_pose = gps_to_pose(gps_json)
+        gps_delays.add(gps, time.time())
+        current_pose = gps_to_pose(gps)
+
+        pose_publisher.send_msg(current_pose.add_hop(HOP_POSE_PUBLISH))
+        th_deg = math.degrees(current_pose.th)
+        print(f"x: {current_pose.x}, y: {current_pose.y}, th: {th_deg}")
+        if gps_delays.fix_age.count % 100 == 1:
+            logger.info(f"GPS {gps_delays}")
+
+
+class PoseFilterNode:
+    """
+    The filter's subscribers, EKF and publisher. step() runs one fixed-rate iteration without blocking,
+    so the loop can be paced by a thread (run_filter) or by a coroutine (robot_runtime.py).
+    """
+
+    def __init__(self, rate, motion_model):
+        self.gps_subscriber = get_subscriber_gps()
+        self.odometry_subscriber = get_subscriber_wheel_odometry() if motion_model in ("odom", "both") else None
+        self.cmd_vel_subscriber = get_subscriber_cmd_vel() if motion_model in ("cmd_vel", "both") else None
+        self.pose_publisher = get_publisher_pose()
+        self.period = 1 / rate
 
-        pose_publisher.send_json(current_pose)
-        th_deg = math.degrees(current_pose["th"])
-        print(f"x: {current_pose['x']}, y: {current_pose['y']}, th: {th_deg}")
+        self.ekf = PoseEKF()
+        self.gps_delays = GPSDelays()
+        self.cmd_vel = None
+        self.last_odometry_time = -math.inf
+        self.last_log_time = time.monotonic()
+
+    def step(self):
+        ekf = self.ekf
+        now = time.monotonic()
+
+        # Motion first, then the measurements
+        if self.odometry_subscriber is not None:
+            odometry = self.odometry_subscriber.recv_msg(block=False)
+            if odometry is not None:
+                ekf.predict_odometry(odometry)
+                self.last_odometry_time = now
+
+        if self.cmd_vel_subscriber is not None:
+            cmd_vel_msg = self.cmd_vel_subscriber.recv_msg(block=False)
+            if cmd_vel_msg is not None:
+                self.cmd_vel = (now, cmd_vel_msg.linear_vel, cmd_vel_msg.angular_vel)
+            # Only dead reckon on commands while the encoders are silent
+            cmd_vel = self.cmd_vel
+            if (
+                cmd_vel is not None
+                and now - cmd_vel[0] < MOTION_TIMEOUT
+                and now - self.last_odometry_time > MOTION_TIMEOUT
+            ):
+                ekf.predict_cmd_vel(cmd_vel[1], cmd_vel[2], self.period)
+
+        gps = self.gps_subscriber.recv_msg(block=False)
+        if gps is not None:
+            self.gps_delays.add(gps, time.time())
+            ekf.update_gps(gps)
+
+        if ekf.initialized:
+            timestamp = time.time()
+            ekf.record(timestamp)
+            self.pose_publisher.send_msg(ekf.to_message(timestamp).add_hop(HOP_POSE_PUBLISH, timestamp))
+
+            if now - self.last_log_time > 1:
+                self.last_log_time = now
+                x, y, th = ekf.state
+                logger.info(f"x: {x:.2f}, y: {y:.2f}, th: {math.degrees(th):.1f}, gps updates: {ekf.gps_updates}")
+                logger.info(f"GPS {self.gps_delays}")
+
+    def close(self):
+        self.pose_publisher.close()
+
+
+def run_filter(rate, motion_model):
+    node = PoseFilterNode(rate, motion_model)
+    scheduler = RateScheduler(rate, name="pose_estimator")
+    last_log_time = time.monotonic()
+
+    while True:
+        node.step()
+        if time.monotonic() - last_log_time > 1:
+            last_log_time = time.monotonic()
+            logger.info(f"{scheduler}")
+        scheduler.sleep()
+
+
+@click.command()
+@click.option("-f", "--filter", "use_filter", is_flag=True, default=False, help="Fuse GPS with a motion model")
+@click.option("-r", "--rate", default=50, help="Rate at which to publish the filtered pose")
+@click.option(
+    "-m",
+    "--motion-model",
+    type=click.Choice(["odom", "cmd_vel", "both"]),
+    default="both",
+    help="Motion model for the filter. 'both' uses odometry, and commanded velocities when the encoders are silent",
+)
+def main(use_filter, rate, motion_model):
+    print("Starting pose estimator")
+    if use_filter:
+        run_filter(rate, motion_model)
+    else:
+        run_passthrough()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+"""
+Forward prediction of stale poses.
+
+A pose computed from a GPS fix describes where the robot was when the phone took the fix,
+a few hundred ms before the control loop gets to use it. CmdVelHistory remembers the recently
+commanded velocities and replays them over that gap, so behaviors steer on where the robot is now.
+"""
+
+from collections import deque
+
+from cmd_vel import CmdVel
+from utils.gps import Pose
+
+
+# Never predict further ahead than this (s). Older poses are predicted over the last MAX_PREDICTION only.
+MAX_PREDICTION = 1.0
+
+
+class CmdVelHistory:
+    def __init__(self, max_age=MAX_PREDICTION * 2):
+        self.max_age = max_age
+        self.commands = deque()  # (timestamp, CmdVel), oldest first
+
+    def add(self, timestamp, cmd_vel: CmdVel):
+        self.commands.append((timestamp, cmd_vel))
+
+        # Keep the newest command older than max_age: it is still in effect at the start of the window
+        while len(self.commands) > 1 and self.commands[1][0] <= timestamp - self.max_age:
+            self.commands.popleft()
+
+    def predict(self, pose: Pose, from_time, to_time) -> Pose:
+        """
+        Move a copy of `pose`, valid at from_time, by the commands in effect until to_time.
+        """
+        predicted = pose.copy()
+        if predicted.th is None or not self.commands:
+            return predicted
+
+        commands = list(self.commands)
+        for i, (start_time, cmd_vel) in enumerate(commands):
+            end_time = commands[i + 1][0] if i + 1 < len(commands) else to_time
+            dt = min(end_time, to_time) - max(start_time, from_time)
+            if dt > 0:
+                predicted.update(cmd_vel, dt)
+
+        return predicted
@@ -0,0 +1,147 @@
+"""
+Where the control loop's time goes, stage by stage.
+
+A Profiler times the stages of a loop and counts events. It is off unless profiling is enabled
+(profiling_enabled in config_manager.py, or enable_profiling()), and then costs a method call and an
+attribute check per stage:
+
+    profiler = get_profiler("mobile_robot_magellan")
+
+    t = profiler.start()
+    receive_pose()
+    t = profiler.lap("receive", t)
+    run_behavior()
+    t = profiler.lap("behavior", t)
+    profiler.count("stale_pose")
+
+Summaries (count, mean, p50, p90, p99, max per stage) are available from profiles(), at the end of a run,
+or published periodically as JSON on the stats topic by a ProfileReporter. `python profiling.py` prints them.
+"""
+
+import json
+import time
+
+import click
+
+from config_manager import profiling_enabled
+from custom_logger import get_logger
+from pub_sub import Publisher, get_subscriber_stats
+from utils.stats import SampleStats
+
+
+logger = get_logger("profiling")
+
+_enabled = profiling_enabled
+_profilers = {}  # type: dict[str, Profiler]
+
+
+class Profiler:
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}  # type: dict[str, SampleStats]
+        self.counters = {}  # type: dict[str, int]
+
+    def start(self):
+        """
+        The start time of the first stage, or None when profiling is off.
+        """
+        if not _enabled:
+            return None
+        return time.perf_counter()
+
+    def lap(self, stage, start):
+        """
+        Record the stage that began at `start`. Returns the start of the next stage.
+        """
+        if start is None:
+            return None
+        now = time.perf_counter()
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = SampleStats()
+        stats.add(now - start)
+        return now
+
+    def count(self, counter, n=1):
+        if _enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def summary(self) -> dict:
+        return {
+            "stages": {stage: stats.summary() for stage, stats in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def log_summary(self):
+        for stage, stats in self.stages.items():
+            summary = stats.summary()
+            logger.info(
+                f"{self.name}.{stage}: count {summary['count']}, mean {summary['mean'] * 1e3:.3f} ms, "
+                f"p50 {summary['p50'] * 1e3:.3f} ms, p99 {summary['p99'] * 1e3:.3f} ms, "
+                f"max {summary['max'] * 1e3:.3f} ms"
+            )
+        if self.counters:
+            logger.info(f"{self.name} counters: {self.counters}")
+
+
+def get_profiler(name) -> Profiler:
+    profiler = _profilers.get(name)
+    if profiler is None:
+        profiler = _profilers[name] = Profiler(name)
+    return profiler
+
+
+def enable_profiling(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def profiling_is_enabled() -> bool:
+    return _enabled
+
+
+def profiles() -> dict:
+    return {name: profiler.summary() for name, profiler in _profilers.items()}
+
+
+def log_profiles():
+    for profiler in _profilers.values():
+        profiler.log_summary()
+
+
+class ProfileReporter:
+    """
+    Publishes every profile on the stats topic, at most every `interval` seconds.
+    """
+
+    def __init__(self, publisher: Publisher, interval=5.0):
+        self.publisher = publisher
+        self.interval = interval
+        self.last_report_time = time.monotonic()
+
+    def maybe_publish(self):
+        if not _enabled:
+            return
+        now = time.monotonic()
+        if now - self.last_report_time >= self.interval:
+            self.last_report_time = now
+            self.publisher.send_json({"timestamp": time.time(), "profiles": profiles()})
+
+
+@click.command()
+def main():
+    """
+    Print the profiles published on the stats topic.
+    """
+    subscriber = get_subscriber_stats()
+    try:
+        while True:
+            report = subscriber.receive_json()
+            if report is not None:
+                print(json.dumps(report, indent=2))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
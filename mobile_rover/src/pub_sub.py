@@ -1,65 +1,203 @@
-import json
+"""
+ZMQ publishers and subscribers for the robot's topics.
+
+Every topic has an endpoint, picked by transport (see pub_sub_transport in config_manager.py):
+    ipc: a unix socket, for processes on the same host (the default: everything runs on the Pi)
+    inproc: for components running as threads of one process
+    tcp: for processes on different hosts
+
+All sockets of a process share one ZMQ context. Subscribers handed out by get_subscriber() are
+long-lived: one connected socket per topic for the whole process, so a behavior that needs a
+topic starts without reconnecting (and without missing the first messages to the slow joiner).
+A subscriber socket must only be used by one thread at a time.
+
+Binding an ipc endpoint that is already bound succeeds (libzmq unlinks and rebinds the path), so each ipc
+publisher holds a lock on <path>.lock, and a second publisher on a topic fails like on tcp (EADDRINUSE).
+"""
+
+import errno
+import fcntl
+import os
 import threading
 import time
 import zmq
+import zmq.asyncio
 
+from config_manager import pub_sub_host, pub_sub_ipc_directory, pub_sub_transport, pub_sub_transports
 from custom_logger import get_logger
+from messages import decode_message, Message
 
 
 logger = get_logger(__name__)
 
+TRANSPORTS = ("tcp", "ipc", "inproc")
+
+
+class Endpoint:
+    def __init__(self, topic, transport, bind_address, connect_address):
+        self.topic = topic
+        self.transport = transport
+        self.bind_address = bind_address
+        self.connect_address = connect_address
+
+    def __str__(self) -> str:
+        return f"Endpoint({self.topic}, {self.connect_address})"
+
+
+def get_endpoint(topic, transport=None, bench=False) -> Endpoint:
+    """
+    The endpoint of a topic. The transport defaults to the configured one for the topic.
+
+    bench: an endpoint of the topic's own, away from the live one (another ipc directory, another tcp port),
+    so a benchmark run next to the robot neither takes over nor collides with its topics.
+    """
+    if transport is None:
+        transport = pub_sub_transports.get(topic, pub_sub_transport)
+
+    if transport == "tcp":
+        port = TOPIC_PORTS[topic] + (BENCH_PORT_OFFSET if bench else 0)
+        return Endpoint(topic, transport, f"tcp://*:{port}", f"tcp://{pub_sub_host}:{port}")
+    elif transport == "ipc":
+        directory = os.path.join(pub_sub_ipc_directory, "bench") if bench else pub_sub_ipc_directory
+        address = f"ipc://{os.path.join(directory, topic)}"
+        return Endpoint(topic, transport, address, address)
+    elif transport == "inproc":
+        address = f"inproc://bench/{topic}" if bench else f"inproc://{topic}"
+        return Endpoint(topic, transport, address, address)
+    else:
+        raise ValueError(f"Invalid transport: {transport}. Must be one of {TRANSPORTS}.")
+
+
+def get_context() -> zmq.Context:
+    """
+    The process-wide context. inproc sockets only see each other within one context.
+    """
+    return zmq.Context.instance()
+
+
+def lock_ipc_endpoint(endpoint: Endpoint):
+    """
+    Lock an ipc endpoint for a publisher, until the returned file is closed. Raises EADDRINUSE if another
+    publisher, in this or any process, holds it. The lock goes away with its process, so a crash leaves none.
+    """
+    path = endpoint.bind_address[len("ipc://") :]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_file = open(f"{path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise zmq.ZMQError(errno.EADDRINUSE, f"{endpoint.bind_address} already has a publisher")
+    return lock_file
+
 
 class Publisher:
-    def __init__(self, port):
-        self.address = f"tcp://*:{port}"
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.address = endpoint.bind_address
+        self.lock_file = lock_ipc_endpoint(endpoint) if endpoint.transport == "ipc" else None
 
-        self.context = zmq.Context()
+        self.context = get_context()
         self.socket = self.context.socket(zmq.PUB)
-        self.socket.bind(self.address)
+        try:
+            self.socket.bind(self.address)
+        except zmq.ZMQError:
+            self.socket.close()
+            if self.lock_file is not None:
+                self.lock_file.close()
+            raise
 
         logger.info(f"Publisher started. Address: {self.address}")
 
     def send_json(self, message):
         self.socket.send_json(message)
 
-    def read_from_logs(self, filename, rate=10):
-        time.sleep(1)
-        with open(filename, "r") as f:
-            for line in f:
-                gps_json = json.loads(line)
-                self.send_json(gps_json)
-                print(gps_json)
-                time.sleep(1 / rate)
+    def send_msg(self, message: Message):
+        self.socket.send(message.encode(), copy=False)
 
     def close(self):
         self.socket.close()
-        self.context.term()
+        if self.lock_file is not None:
+            self.lock_file.close()
 
         logger.info(f"Publisher closed. Address: {self.address}")
 
 
 class Subscriber:
-    def __init__(self, port, timeout=-1):
-        self.context = zmq.Context()
+    def __init__(self, endpoint: Endpoint, timeout=-1, conflate=True):
+        """
+        conflate: keep only the newest message. Turn it off to receive every message.
+        """
+        self.endpoint = endpoint
+        self.context = get_context()
         self.socket = self.context.socket(zmq.SUB)
 
         # Set options
-        self.socket.setsockopt(zmq.CONFLATE, 1)  # set CONFLATE for "last message only" mode.
+        if conflate:
+            self.socket.setsockopt(zmq.CONFLATE, 1)  # set CONFLATE for "last message only" mode.
         self.socket.setsockopt_string(zmq.SUBSCRIBE, "")
         if timeout > 0:
             self.socket.setsockopt(zmq.RCVTIMEO, timeout)
 
         # Connect
-        self.socket.connect(f"tcp://localhost:{port}")
+        self.socket.connect(endpoint.connect_address)
 
         self.none_received_count = 0
+        # Messages that could not be decoded (malformed, truncated, another schema version): dropped
+        self.decode_errors = 0
+
+    def receive_json(self, block=True):
+        """
+        block=False returns the newest message if there is one, without waiting for the timeout.
+        """
+        try:
+            data = self.socket.recv_json(flags=0 if block else zmq.NOBLOCK)
+        except zmq.error.Again:
+            data = None
+
+        if block:
+            self._count_none_received(data)
+        return data
 
-    def receive_json(self):
+    def recv_msg(self, block=True):
+        """
+        The next message, decoded to its Message type. None on timeout, or right away when block=False.
+        A message that cannot be decoded is logged, counted in decode_errors and dropped: None too.
+        """
         try:
-            data = self.socket.recv_json()
+            data = self.socket.recv(flags=0 if block else zmq.NOBLOCK, copy=True)
         except zmq.error.Again:
             data = None
 
+        if data is None:
+            message = None
+        else:
+            try:
+                message = decode_message(data)
+            except ValueError as e:
+                self.decode_errors += 1
+                # The first ten, then every 100th, so a bad publisher does not flood the log
+                if self.decode_errors <= 10 or self.decode_errors % 100 == 0:
+                    logger.warning(f"{self.endpoint}: dropped a bad message ({self.decode_errors} so far): {e}")
+                return None
+
+        if block:
+            self._count_none_received(message)
+        return message
+
+    def drain(self) -> int:
+        """
+        Discard messages that are already queued. Returns how many were dropped.
+        """
+        dropped = 0
+        while True:
+            try:
+                self.socket.recv(flags=zmq.NOBLOCK)
+            except zmq.error.Again:
+                return dropped
+            dropped += 1
+
+    def _count_none_received(self, data):
         if data is None:
             self.none_received_count += 1
             if self.none_received_count > 10:
@@ -67,50 +205,185 @@ class Subscriber:
         else:
             self.none_received_count = 0
 
-        return data
+    def stats(self) -> dict:
+        return {"none_received": self.none_received_count, "decode_errors": self.decode_errors}
 
-    def write_to_log(self, filename, stop_event: threading.Event):
-        logger.info(f"Writing data to {filename}")
-
-        with open(filename, "a") as file:
-            while not stop_event.is_set():
-                # Wait for data
-                data = self.receive_json()
-                if data is None:
-                    continue
+    def close(self):
+        self.socket.close()
 
-                # Write data to file
-                json_string = json.dumps(data)
-                file.write(json_string + "\n")
-                file.flush()
 
+class MultiSubscriber:
+    """
+    Waits on several subscribers at once, with one overall deadline, instead of one timeout per topic.
+
+    Messages are left queued on the ready subscribers: each one's owner reads them with recv_msg(block=False).
+    """
+
+    def __init__(self, subscribers):
+        self.subscribers = list(subscribers)  # type: list[Subscriber]
+        self.poller = zmq.Poller()
+        for subscriber in self.subscribers:
+            self.poller.register(subscriber.socket, zmq.POLLIN)
+
+    def wait(self, timeout, wait_for_all=True) -> set:
+        """
+        Wait until every subscriber has a message (or any one, if not wait_for_all), or `timeout` (s) has passed.
+        Returns the ready subscribers.
+        """
+        deadline = time.monotonic() + timeout
+        ready = set()
+        while True:
+            remaining = deadline - time.monotonic()
+            events = dict(self.poller.poll(max(remaining, 0) * 1000))
+            ready.update(subscriber for subscriber in self.subscribers if subscriber.socket in events)
+            if len(ready) == len(self.subscribers) or (ready and not wait_for_all) or remaining <= 0:
+                return ready
+
+    async def wait_async(self, timeout, wait_for_all=True) -> set:
+        """
+        wait(), without blocking the event loop.
+        """
+        poller = zmq.asyncio.Poller()
+        for subscriber in self.subscribers:
+            poller.register(subscriber.socket, zmq.POLLIN)
+
+        deadline = time.monotonic() + timeout
+        ready = set()
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                events = dict(await poller.poll(max(remaining, 0) * 1000))
+            except zmq.error.Again:
+                # The asyncio poller raises on timeout
+                events = {}
+            ready.update(subscriber for subscriber in self.subscribers if subscriber.socket in events)
+            if len(ready) == len(self.subscribers) or (ready and not wait_for_all) or remaining <= 0:
+                return ready
+
+    def receive(self, timeout, wait_for_all=True) -> dict:
+        """
+        Wait like wait(), then read the ready subscribers. Returns {topic: message} for the topics that arrived.
+        """
+        messages = {}
+        for subscriber in self.wait(timeout, wait_for_all):
+            message = subscriber.recv_msg(block=False)
+            if message is not None:
+                messages[subscriber.endpoint.topic] = message
+        return messages
 
-PORT_GPS = 5050
-PORT_POSE = 5060
-PORT_CONE_DETECTIONS = 5070
+    def close(self):
+        for subscriber in self.subscribers:
+            self.poller.unregister(subscriber.socket)
+
+
+_subscribers = {}  # type: dict[tuple, Subscriber]
+_subscribers_lock = threading.Lock()
+
+
+def get_subscriber(topic, timeout=-1, drain=False) -> Subscriber:
+    """
+    The process's long-lived subscriber for `topic`, created and connected on first use.
+
+    drain: discard messages published before this call, e.g. detections seen by a previous behavior.
+    """
+    key = (topic, timeout)
+    with _subscribers_lock:
+        subscriber = _subscribers.get(key)
+        if subscriber is None:
+            subscriber = Subscriber(get_endpoint(topic), timeout=timeout)
+            _subscribers[key] = subscriber
+
+    if drain:
+        subscriber.drain()
+    subscriber.none_received_count = 0
+    return subscriber
+
+
+def close_subscribers():
+    with _subscribers_lock:
+        for subscriber in _subscribers.values():
+            subscriber.close()
+        _subscribers.clear()
+
+
+TOPIC_GPS = "gps"
+TOPIC_POSE = "pose"
+TOPIC_CONE_DETECTIONS = "cone_detections"
+TOPIC_WHEEL_ODOMETRY = "wheel_odometry"
+TOPIC_CMD_VEL = "cmd_vel"
+TOPIC_STATS = "stats"
+
+# TCP ports
+TOPIC_PORTS = {
+    TOPIC_GPS: 5050,
+    TOPIC_POSE: 5060,
+    TOPIC_CONE_DETECTIONS: 5070,
+    TOPIC_WHEEL_ODOMETRY: 5080,
+    TOPIC_CMD_VEL: 5090,
+    TOPIC_STATS: 5100,
+}
+
+# Benchmark endpoints use the topic's port plus this
+BENCH_PORT_OFFSET = 1000
+
+# Topic ids in recordings (see message_log.py). Never reuse an id.
+TOPIC_IDS = {
+    TOPIC_GPS: 1,
+    TOPIC_POSE: 2,
+    TOPIC_CONE_DETECTIONS: 3,
+    TOPIC_WHEEL_ODOMETRY: 4,
+    TOPIC_CMD_VEL: 5,
+}
 
 
 def get_publisher_gps():
-    return Publisher(port=PORT_GPS)
+    return Publisher(get_endpoint(TOPIC_GPS))
 
 
 def get_subscriber_gps():
     # GPS data should be published at at least 10Hz
-    return Subscriber(port=PORT_GPS, timeout=100)
+    return get_subscriber(TOPIC_GPS, timeout=100)
 
 
 def get_publisher_pose():
-    return Publisher(port=PORT_POSE)
+    return Publisher(get_endpoint(TOPIC_POSE))
 
 
 def get_subscriber_pose():
     # GPS data should be published at at least 10Hz
-    return Subscriber(port=PORT_POSE, timeout=100)
+    return get_subscriber(TOPIC_POSE, timeout=100)
 
 
 def get_publisher_cone_detections():
-    return Publisher(port=PORT_CONE_DETECTIONS)
+    return Publisher(get_endpoint(TOPIC_CONE_DETECTIONS))
 
 
 def get_subscriber_cone_detections():
-    return Subscriber(port=PORT_CONE_DETECTIONS, timeout=1)
+    # Behaviors only act on detections seen after they started
+    return get_subscriber(TOPIC_CONE_DETECTIONS, timeout=1, drain=True)
+
+
+def get_publisher_wheel_odometry():
+    return Publisher(get_endpoint(TOPIC_WHEEL_ODOMETRY))
+
+
+def get_subscriber_wheel_odometry():
+    # Wheel odometry is published at the encoder poll rate (50Hz)
+    return get_subscriber(TOPIC_WHEEL_ODOMETRY, timeout=100)
+
+
+def get_publisher_cmd_vel():
+    return Publisher(get_endpoint(TOPIC_CMD_VEL))
+
+
+def get_subscriber_cmd_vel():
+    return get_subscriber(TOPIC_CMD_VEL, timeout=100)
+
+
+def get_publisher_stats():
+    # JSON reports (see profiling.py), not typed messages
+    return Publisher(get_endpoint(TOPIC_STATS))
+
+
+def get_subscriber_stats():
+    return get_subscriber(TOPIC_STATS, timeout=1000)
@@ -0,0 +1,390 @@
+"""
+Rerun a recorded field test through the real control stack, offline and deterministically.
+
+The recording's GPS fixes, wheel odometry and cone detections are fed to the pose filter (PoseFilterNode),
+whose poses drive the StateMachine and MobileRobotMagellan, with the same code as on the robot. Around it:
+
+- a simulated clock, which jumps from one event to the next: the recorded messages at their receive
+  times, the filter at --pose-rate and the mission at --rate. No sleeping, so a run takes seconds
+- a seeded random number generator for the behaviors
+- an in-process bus in place of pub_sub, and a motor stub in place of the motors: no sockets, no hardware
+
+Topics are conflated like the shared pub_sub subscribers, and messages go through encode/decode as on
+the wire. Every CmdVel (with the state that produced it) and every state transition is captured, so two
+runs of the same recording and seed are identical, and runs of two code versions can be diffed:
+
+    python replay_harness.py -d logs/run_1 -o before.json
+    (change the code)
+    python replay_harness.py -d logs/run_1 -o after.json --compare before.json
+"""
+
+from collections import deque
+from contextlib import ExitStack, contextmanager
+import json
+import logging
+import random
+import sys
+import time
+from unittest.mock import patch
+
+import click
+
+import behaviors
+import mobile_robot_magellan
+import pose_estimator
+from message_log import MessageLogReader, open_log_directory
+from messages import Message, decode_message
+from mission import Mission
+from mobile_robot_magellan import MobileRobotMagellan
+from pose_estimator import PoseFilterNode
+from pub_sub import TOPIC_CMD_VEL, TOPIC_CONE_DETECTIONS, TOPIC_GPS, TOPIC_POSE, TOPIC_WHEEL_ODOMETRY
+from state_machine import StateMachine
+
+
+# The recorded topics fed to the stack. The recorded poses and commands are its outputs, and are regenerated.
+INPUT_TOPICS = (TOPIC_GPS, TOPIC_WHEEL_ODOMETRY, TOPIC_CONE_DETECTIONS)
+
+# Loggers silenced during a run: they log every step
+QUIET_LOGGERS = ("state_machine", "mobile_robot_magellan", "behaviors", "pose_estimator", "mission", "projection")
+
+
+class SimulatedClock:
+    """
+    Stands in for the time module: time() and monotonic() return the simulated time, sleep() advances it.
+    """
+
+    def __init__(self, start_time=0.0):
+        self.now = start_time
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+class OfflineSubscriber:
+    def __init__(self, topic, conflate=True):
+        self.topic = topic
+        self.queue = deque(maxlen=1 if conflate else None)
+
+    def deliver(self, message: Message):
+        self.queue.append(message)
+
+    def recv_msg(self, block=True):
+        # Nothing arrives while a step runs, so blocking would not change the outcome
+        return self.queue.popleft() if self.queue else None
+
+    def drain(self) -> int:
+        dropped = len(self.queue)
+        self.queue.clear()
+        return dropped
+
+    def close(self):
+        pass
+
+
+class OfflinePublisher:
+    def __init__(self, bus, topic):
+        self.bus = bus
+        self.topic = topic
+
+    def send_msg(self, message: Message):
+        self.bus.publish(self.topic, message)
+
+    def close(self):
+        pass
+
+
+class OfflineMultiSubscriber:
+    """
+    MultiSubscriber for OfflineSubscribers. Every message due has been delivered before a step, so there is
+    nothing to wait for.
+    """
+
+    def __init__(self, subscribers):
+        self.subscribers = list(subscribers)
+
+    def wait(self, timeout, wait_for_all=True) -> set:
+        return {subscriber for subscriber in self.subscribers if subscriber.queue}
+
+    def close(self):
+        pass
+
+
+class OfflineBus:
+    """
+    In-process pub_sub: one conflating subscriber per topic, like the shared subscribers of pub_sub.
+    """
+
+    def __init__(self, clock: SimulatedClock):
+        self.clock = clock
+        self.subscribers = {}  # type: dict[str, OfflineSubscriber]
+        self.published = {}  # type: dict[str, list[tuple[float, Message]]]
+
+    def get_subscriber(self, topic) -> OfflineSubscriber:
+        subscriber = self.subscribers.get(topic)
+        if subscriber is None:
+            subscriber = self.subscribers[topic] = OfflineSubscriber(topic)
+        return subscriber
+
+    def get_publisher(self, topic) -> OfflinePublisher:
+        return OfflinePublisher(self, topic)
+
+    def deliver(self, topic, data: bytes):
+        subscriber = self.subscribers.get(topic)
+        if subscriber is not None:
+            subscriber.deliver(decode_message(data))
+
+    def publish(self, topic, message: Message):
+        self.published.setdefault(topic, []).append((self.clock.now, message))
+        self.deliver(topic, message.encode())
+
+
+@contextmanager
+def offline(bus: OfflineBus, clock: SimulatedClock, rng: random.Random, motor_speeds: list):
+    """
+    Point the control stack at the bus, clock, random number generator and motor stub.
+    """
+    seams = {
+        behaviors: {
+            "time": clock,
+            "random": rng,
+            "get_subscriber_cone_detections": lambda: bus.get_subscriber(TOPIC_CONE_DETECTIONS),
+        },
+        mobile_robot_magellan: {
+            "time": clock,
+            "MultiSubscriber": OfflineMultiSubscriber,
+            "get_subscriber_pose": lambda: bus.get_subscriber(TOPIC_POSE),
+            "get_subscriber_cone_detections": lambda: bus.get_subscriber(TOPIC_CONE_DETECTIONS),
+            "get_publisher_cmd_vel": lambda: bus.get_publisher(TOPIC_CMD_VEL),
+            "set_motor_speeds": lambda left_speed, right_speed: motor_speeds.append((left_speed, right_speed)),
+        },
+        pose_estimator: {
+            "time": clock,
+            "get_subscriber_gps": lambda: bus.get_subscriber(TOPIC_GPS),
+            "get_subscriber_wheel_odometry": lambda: bus.get_subscriber(TOPIC_WHEEL_ODOMETRY),
+            "get_subscriber_cmd_vel": lambda: bus.get_subscriber(TOPIC_CMD_VEL),
+            "get_publisher_pose": lambda: bus.get_publisher(TOPIC_POSE),
+        },
+    }
+    with ExitStack() as stack:
+        for module, attributes in seams.items():
+            for name, value in attributes.items():
+                stack.enter_context(patch.object(module, name, value))
+        yield
+
+
+@contextmanager
+def quiet_loggers(names=QUIET_LOGGERS):
+    levels = {name: logging.getLogger(name).level for name in names}
+    for name in names:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+
+
+class ReplayHarness:
+    def __init__(
+        self,
+        reader: MessageLogReader,
+        mission_filename="mission.csv",
+        rate=10,
+        pose_rate=50,
+        motion_model="both",
+        seed=0,
+        start=0.0,
+        end=None,
+    ):
+        """
+        start, end: offsets (s) from the beginning of the recording. Defaults to the whole recording.
+        """
+        if reader.start_time is None:
+            raise ValueError(f"{reader.filename} is empty")
+        self.reader = reader
+        self.mission_filename = mission_filename
+        self.rate = rate
+        self.pose_rate = pose_rate
+        self.motion_model = motion_model
+        self.seed = seed
+        self.start_time = reader.start_time + start
+        self.end_time = reader.end_time if end is None else reader.start_time + end
+
+    def run(self, quiet=True) -> dict:
+        """
+        Replay the recording. Returns the captured commands and transitions, with times relative to the start.
+        """
+        clock = SimulatedClock(self.start_time)
+        bus = OfflineBus(clock)
+        motor_speeds = []
+        cmd_vels = []
+        transitions = []
+        wall_start_t = time.perf_counter()
+
+        with ExitStack() as stack:
+            if quiet:
+                stack.enter_context(quiet_loggers())
+            # The mission's first waypoint is the projection origin, as on the robot, whatever ran before
+            Mission().load_from_file(self.mission_filename)
+            stack.enter_context(offline(bus, clock, random.Random(self.seed), motor_speeds))
+
+            node = PoseFilterNode(self.pose_rate, self.motion_model)
+            robot = MobileRobotMagellan(period=1 / self.rate)
+            state_machine = StateMachine(robot=robot, mission_filename=self.mission_filename)
+
+            records = self.reader.records(INPUT_TOPICS, self.start_time, self.end_time)
+            record = next(records, None)
+            pose_ticks = 0
+            control_start_time = None
+            control_ticks = 0
+
+            while not state_machine.in_final_state():
+                pose_time = self.start_time + pose_ticks / self.pose_rate
+                if control_start_time is None:
+                    now = pose_time
+                else:
+                    now = min(pose_time, control_start_time + control_ticks / self.rate)
+                if now > self.end_time:
+                    break
+
+                # The recorded messages received by now
+                while record is not None and record[0] <= now:
+                    clock.now = record[0]
+                    bus.deliver(record[1], record[2])
+                    record = next(records, None)
+                clock.now = now
+
+                if now == pose_time:
+                    node.step()
+                    pose_ticks += 1
+                    # Like runner_magellan.py, the mission starts once there is a pose
+                    if control_start_time is None and TOPIC_POSE in bus.published:
+                        control_start_time = now
+                    continue
+
+                state = state_machine.state
+                published = len(bus.published.get(TOPIC_CMD_VEL, ()))
+                state_machine.step()
+                control_ticks += 1
+
+                for timestamp, message in bus.published.get(TOPIC_CMD_VEL, [])[published:]:
+                    cmd_vels.append(
+                        {
+                            "t": timestamp - self.start_time,
+                            "state": state.name,
+                            "linear_vel": message.linear_vel,
+                            "angular_vel": message.angular_vel,
+                        }
+                    )
+                if state_machine.state != state:
+                    transitions.append({"t": now - self.start_time, "from": state.name, "to": state_machine.state.name})
+
+            node.close()
+            robot.close()
+
+        return {
+            "seed": self.seed,
+            "rate": self.rate,
+            "pose_rate": self.pose_rate,
+            "motion_model": self.motion_model,
+            "mission": self.mission_filename,
+            "duration": clock.now - self.start_time,
+            "wall_time": time.perf_counter() - wall_start_t,
+            "final_state": state_machine.state.name,
+            "poses": len(bus.published.get(TOPIC_POSE, ())),
+            "motor_writes": len(motor_speeds),
+            "cmd_vel": cmd_vels,
+            "transitions": transitions,
+        }
+
+
+def diff_runs(baseline: dict, current: dict, tolerance=1e-9, max_differences=20) -> list:
+    """
+    The differences between the transitions and commands of two runs, first ones first.
+    """
+    differences = []
+
+    for i, (a, b) in enumerate(zip(baseline["transitions"], current["transitions"])):
+        if (a["from"], a["to"]) != (b["from"], b["to"]) or abs(a["t"] - b["t"]) > tolerance:
+            differences.append(
+                f"transition {i}: {a['from']} -> {a['to']} at {a['t']:.2f} s, "
+                f"now {b['from']} -> {b['to']} at {b['t']:.2f} s"
+            )
+            break
+    if len(baseline["transitions"]) != len(current["transitions"]):
+        differences.append(f"transitions: {len(baseline['transitions'])}, now {len(current['transitions'])}")
+
+    for i, (a, b) in enumerate(zip(baseline["cmd_vel"], current["cmd_vel"])):
+        if len(differences) >= max_differences:
+            break
+        if a["state"] != b["state"] or any(
+            abs(a[key] - b[key]) > tolerance for key in ("t", "linear_vel", "angular_vel")
+        ):
+            differences.append(
+                f"cmd_vel {i} at {a['t']:.2f} s: {a['state']} ({a['linear_vel']:.4f}, {a['angular_vel']:.4f}), "
+                f"now {b['state']} ({b['linear_vel']:.4f}, {b['angular_vel']:.4f})"
+            )
+    if len(baseline["cmd_vel"]) != len(current["cmd_vel"]):
+        differences.append(f"commands: {len(baseline['cmd_vel'])}, now {len(current['cmd_vel'])}")
+
+    return differences
+
+
+@click.command()
+@click.option("-d", "--log-directory", required=True, help="Path to the directory of the recorded run")
+@click.option("--mission", "mission_filename", default="mission.csv", help="Mission CSV file")
+@click.option("--rate", default=10, help="Mission step rate (Hz)")
+@click.option("--pose-rate", default=50, help="Pose filter rate (Hz)")
+@click.option(
+    "-m",
+    "--motion-model",
+    type=click.Choice(["odom", "cmd_vel", "both"]),
+    default="both",
+    help="Motion model for the pose filter",
+)
+@click.option("--seed", default=0, help="Seed of the behaviors' random number generator")
+@click.option("--start", default=0.0, help="Start this many seconds into the recording")
+@click.option("--end", default=None, type=float, help="Stop this many seconds into the recording")
+@click.option("-o", "--output", default=None, help="Write the commands and transitions to this JSON file")
+@click.option("-c", "--compare", default=None, help="Output JSON of a previous run to diff against")
+@click.option("--tolerance", default=1e-9, help="Differences up to this are ignored when comparing")
+def main(log_directory, mission_filename, rate, pose_rate, motion_model, seed, start, end, output, compare, tolerance):
+    reader = open_log_directory(log_directory)
+    harness = ReplayHarness(reader, mission_filename, rate, pose_rate, motion_model, seed, start, end)
+    result = harness.run()
+    reader.close()
+
+    print(
+        f"Replayed {result['duration']:.1f} s in {result['wall_time']:.2f} s "
+        f"({result['duration'] / max(result['wall_time'], 1e-9):.0f}x real time): "
+        f"{len(result['cmd_vel'])} commands, {len(result['transitions'])} transitions, "
+        f"final state {result['final_state']}"
+    )
+    for transition in result["transitions"]:
+        print(f"{transition['t']:>8.2f} s  {transition['from']} -> {transition['to']}")
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results saved to {output}")
+
+    if compare is not None:
+        with open(compare) as f:
+            baseline = json.load(f)
+        differences = diff_runs(baseline, result, tolerance)
+        for difference in differences:
+            print(difference)
+        if differences:
+            sys.exit(1)
+        print(f"Same commands and transitions as {compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,108 @@
+import binascii
 import random
 import serial
 import struct
 import time
 
 
+def _make_crc16_table():
+    # CRC16-CCITT (XModem), polynomial 0x1021, as used by the Roboclaw packet serial protocol
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for bit in range(0, 8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data, crc=0):
+    """
+    CRC of a whole buffer. binascii.crc_hqx implements the same CRC16-CCITT in C.
+    """
+    return binascii.crc_hqx(data, crc)
+
+
+# Packet layouts are cached by payload format, e.g. "ll" for SpeedM1M2
+_FRAME_STRUCTS = {}
+
+
+def _frame_struct(fmt):
+    packer = _FRAME_STRUCTS.get(fmt)
+    if packer is None:
+        packer = struct.Struct(">BB" + fmt)
+        _FRAME_STRUCTS[fmt] = packer
+    return packer
+
+
+_REPLY_STRUCTS = {}
+
+
+def _reply_struct(fmt):
+    unpacker = _REPLY_STRUCTS.get(fmt)
+    if unpacker is None:
+        unpacker = struct.Struct(">" + fmt)
+        _REPLY_STRUCTS[fmt] = unpacker
+    return unpacker
+
+
+def _wrap_values(fmt, values):
+    """
+    Wrap each value to the width of its field, two's complement, as the byte-at-a-time driver sent it
+    (each byte masked with 0xFF). fmt has one code per value, without repeat counts.
+    """
+    wrapped = []
+    for code, value in zip(fmt, values):
+        bits = 8 * struct.calcsize(">" + code)
+        value &= (1 << bits) - 1
+        if code.islower() and value >= 1 << (bits - 1):
+            value -= 1 << bits
+        wrapped.append(value)
+    return wrapped
+
+
+def build_frame(address, cmd, fmt="", *values):
+    """
+    Pack a complete write packet: address, command, big-endian payload and CRC16.
+
+    fmt uses struct codes for the payload, e.g. build_frame(0x80, Cmd.MIXEDSPEED, "ll", m1, m2).
+    """
+    packer = _frame_struct(fmt)
+    frame = bytearray(packer.size + 2)
+    try:
+        packer.pack_into(frame, 0, address, cmd, *values)
+    except struct.error:
+        # Out of range for its field, e.g. a negative encoder count for an unsigned one
+        packer.pack_into(frame, 0, address, cmd, *_wrap_values(fmt, values))
+    crc = binascii.crc_hqx(memoryview(frame)[: packer.size], 0)
+    frame[-2] = crc >> 8
+    frame[-1] = crc & 0xFF
+    return bytes(frame)
+
+
 class Roboclaw:
     "Roboclaw Interface Class"
 
-    def __init__(self, comport, rate, timeout=0.01, retries=3):
+    def __init__(self, comport, rate, timeout=0.01, retries=3, read_timeout=1):
         self.comport = comport
         self.rate = rate
         self.timeout = timeout
+        self.read_timeout = read_timeout
         self._trystimeout = retries
         self._crc = 0
 
+        # Link health counters. A write the Roboclaw rejects (e.g. bad CRC) gets no ack,
+        # so on writes it shows up as a timeout.
+        self.retry_count = 0
+        self.timeout_count = 0
+        self.crc_error_count = 0
+
     # Command Enums
     class Cmd:
         M1FORWARD = 0
@@ -88,6 +177,7 @@ class Roboclaw:
         GETPINFUNCTIONS = 75
         SETDEADBAND = 76
         GETDEADBAND = 77
+        GETENCODERS = 78
         RESTOREDEFAULTS = 80
         GETTEMP = 82
         GETTEMP2 = 83
@@ -115,22 +205,14 @@ class Roboclaw:
         return
 
     def crc_update(self, data):
-        self._crc = self._crc ^ (data << 8)
-        for bit in range(0, 8):
-            if (self._crc & 0x8000) == 0x8000:
-                self._crc = (self._crc << 1) ^ 0x1021
-            else:
-                self._crc = self._crc << 1
+        self._crc = ((self._crc << 8) & 0xFFFF) ^ _CRC16_TABLE[((self._crc >> 8) ^ data) & 0xFF]
         return
 
     def _sendcommand(self, address, command):
         self.crc_clear()
         self.crc_update(address)
-        # 		self._port.write(chr(address))
-        self._port.write(address.to_bytes(1, "big"))
         self.crc_update(command)
-        # 		self._port.write(chr(command))
-        self._port.write(command.to_bytes(1, "big"))
+        self._port.write(bytes((address, command)))
         return
 
     def _readchecksumword(self):
@@ -149,508 +231,184 @@ class Roboclaw:
             return (1, val)
         return (0, 0)
 
-    def _readword(self):
-        val1 = self._readbyte()
-        if val1[0]:
-            val2 = self._readbyte()
-            if val2[0]:
-                return (1, val1[1] << 8 | val2[1])
-        return (0, 0)
-
-    def _readlong(self):
-        val1 = self._readbyte()
-        if val1[0]:
-            val2 = self._readbyte()
-            if val2[0]:
-                val3 = self._readbyte()
-                if val3[0]:
-                    val4 = self._readbyte()
-                    if val4[0]:
-                        return (1, val1[1] << 24 | val2[1] << 16 | val3[1] << 8 | val4[1])
-        return (0, 0)
-
-    def _readslong(self):
-        val = self._readlong()
-        if val[0]:
-            if val[1] & 0x80000000:
-                return (val[0], val[1] - 0x100000000)
-            return (val[0], val[1])
-        return (0, 0)
-
-    def _writebyte(self, val):
-        self.crc_update(val & 0xFF)
-        # 		self._port.write(chr(val&0xFF))
-        self._port.write(val.to_bytes(1, "big"))
-
-    def _writesbyte(self, val):
-        self._writebyte(val)
-
-    def _writeword(self, val):
-        self._writebyte((val >> 8) & 0xFF)
-        self._writebyte(val & 0xFF)
-
-    def _writesword(self, val):
-        self._writeword(val)
-
-    def _writelong(self, val):
-        self._writebyte((val >> 24) & 0xFF)
-        self._writebyte((val >> 16) & 0xFF)
-        self._writebyte((val >> 8) & 0xFF)
-        self._writebyte(val & 0xFF)
-
-    def _writeslong(self, val):
-        self._writelong(val)
-
-    def _read1(self, address, cmd):
+    def _read(self, address, cmd, fmt, payload=b""):
+        # Send the request, then read the fixed size reply and its CRC in a single call.
+        # The CRC covers the request bytes as well as the reply data.
+        unpacker = _reply_struct(fmt)
+        request = bytes((address, cmd)) + payload
+        request_crc = crc16(request)
+        reply_size = unpacker.size + 2
         trys = self._trystimeout
-        while 1:
+        while trys:
             self._port.flushInput()
-            self._sendcommand(address, cmd)
-            val1 = self._readbyte()
-            if val1[0]:
-                crc = self._readchecksumword()
-                if crc[0]:
-                    if self._crc & 0xFFFF != crc[1] & 0xFFFF:
-                        return (0, 0)
-                    return (1, val1[1])
+            self._port.write(request)
+            reply = self._port.read(reply_size)
+            if len(reply) == reply_size:
+                crc = (reply[-2] << 8) | reply[-1]
+                if crc16(memoryview(reply)[: unpacker.size], request_crc) == crc:
+                    return unpacker.unpack_from(reply)
+                self.crc_error_count += 1
+            else:
+                self.timeout_count += 1
             trys -= 1
-            if trys == 0:
-                break
+            if trys:
+                self.retry_count += 1
+        return None
+
+    def _read1(self, address, cmd):
+        val = self._read(address, cmd, "B")
+        if val is not None:
+            return (1, val[0])
         return (0, 0)
 
     def _read2(self, address, cmd):
-        trys = self._trystimeout
-        while 1:
-            self._port.flushInput()
-            self._sendcommand(address, cmd)
-            val1 = self._readword()
-            if val1[0]:
-                crc = self._readchecksumword()
-                if crc[0]:
-                    if self._crc & 0xFFFF != crc[1] & 0xFFFF:
-                        return (0, 0)
-                    return (1, val1[1])
-            trys -= 1
-            if trys == 0:
-                break
+        val = self._read(address, cmd, "H")
+        if val is not None:
+            return (1, val[0])
         return (0, 0)
 
     def _read4(self, address, cmd):
-        trys = self._trystimeout
-        while 1:
-            self._port.flushInput()
-            self._sendcommand(address, cmd)
-            val1 = self._readlong()
-            if val1[0]:
-                crc = self._readchecksumword()
-                if crc[0]:
-                    if self._crc & 0xFFFF != crc[1] & 0xFFFF:
-                        return (0, 0)
-                    return (1, val1[1])
-            trys -= 1
-            if trys == 0:
-                break
+        val = self._read(address, cmd, "L")
+        if val is not None:
+            return (1, val[0])
         return (0, 0)
 
     def _read4_1(self, address, cmd):
-        trys = self._trystimeout
-        while 1:
-            self._port.flushInput()
-            self._sendcommand(address, cmd)
-            val1 = self._readslong()
-            if val1[0]:
-                val2 = self._readbyte()
-                if val2[0]:
-                    crc = self._readchecksumword()
-                    if crc[0]:
-                        if self._crc & 0xFFFF != crc[1] & 0xFFFF:
-                            return (0, 0)
-                        return (1, val1[1], val2[1])
-            trys -= 1
-            if trys == 0:
-                break
+        val = self._read(address, cmd, "lB")
+        if val is not None:
+            return (1, val[0], val[1])
         return (0, 0)
 
     def _read_n(self, address, cmd, args):
-        trys = self._trystimeout
-        while 1:
-            self._port.flushInput()
-            trys -= 1
-            if trys == 0:
-                break
-            failed = False
-            self._sendcommand(address, cmd)
-            data = [
-                1,
-            ]
-            for i in range(0, args):
-                val = self._readlong()
-                if val[0] == 0:
-                    failed = True
-                    break
-                data.append(val[1])
-            if failed:
-                continue
-            crc = self._readchecksumword()
-            if crc[0]:
-                if self._crc & 0xFFFF == crc[1] & 0xFFFF:
-                    return data
+        val = self._read(address, cmd, "L" * args)
+        if val is not None:
+            return [1, *val]
         return (0, 0, 0, 0, 0)
 
-    def _writechecksum(self):
-        self._writeword(self._crc & 0xFFFF)
-        val = self._readbyte()
-        if len(val) > 0:
-            if val[0]:
-                return True
-        return False
+    def _readack(self):
+        # The Roboclaw answers a valid write packet with a single 0xFF byte
+        return len(self._port.read(1)) == 1
 
-    def _write0(self, address, cmd):
+    def _write(self, address, cmd, fmt="", *values):
+        # Build the whole packet once and send it with a single write per attempt
+        frame = build_frame(address, cmd, fmt, *values)
         trys = self._trystimeout
         while trys:
-            self._sendcommand(address, cmd)
-            if self._writechecksum():
+            self._port.write(frame)
+            if self._readack():
                 return True
+            self.timeout_count += 1
             trys = trys - 1
+            if trys:
+                self.retry_count += 1
         return False
 
-    def _write1(self, address, cmd, val):
+    def _write_batch(self, frames):
+        # Send the packets for several controllers on the shared bus back-to-back, then collect
+        # all the acks with a single read. Each controller acks in the order its packet went out.
+        # A missing ack can't be attributed to one controller, so the whole batch is resent.
+        # Only use this for commands that are safe to repeat, like speed setpoints.
+        batch = b"".join(frames)
         trys = self._trystimeout
         while trys:
-            self._sendcommand(address, cmd)
-            self._writebyte(val)
-            if self._writechecksum():
+            # Acks that came in after an attempt timed out would be counted for this one
+            self._port.flushInput()
+            self._port.write(batch)
+            if len(self._port.read(len(frames))) == len(frames):
                 return True
+            self.timeout_count += 1
             trys = trys - 1
+            if trys:
+                self.retry_count += 1
         return False
 
+    def _write0(self, address, cmd):
+        return self._write(address, cmd)
+
+    def _write1(self, address, cmd, val):
+        return self._write(address, cmd, "B", val)
+
     def _write11(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writebyte(val1)
-            self._writebyte(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "BB", val1, val2)
 
     def _write111(self, address, cmd, val1, val2, val3):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writebyte(val1)
-            self._writebyte(val2)
-            self._writebyte(val3)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "BBB", val1, val2, val3)
 
     def _write2(self, address, cmd, val):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writeword(val)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "H", val)
 
     def _writeS2(self, address, cmd, val):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writesword(val)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "h", val)
 
     def _write22(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writeword(val1)
-            self._writeword(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "HH", val1, val2)
 
     def _writeS22(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writesword(val1)
-            self._writeword(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "hH", val1, val2)
 
     def _writeS2S2(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writesword(val1)
-            self._writesword(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "hh", val1, val2)
 
     def _writeS24(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writesword(val1)
-            self._writelong(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "hL", val1, val2)
 
     def _writeS24S24(self, address, cmd, val1, val2, val3, val4):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writesword(val1)
-            self._writelong(val2)
-            self._writesword(val3)
-            self._writelong(val4)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "hLhL", val1, val2, val3, val4)
 
     def _write4(self, address, cmd, val):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "L", val)
 
     def _writeS4(self, address, cmd, val):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writeslong(val)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "l", val)
 
     def _write44(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writelong(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LL", val1, val2)
 
     def _write4S4(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writeslong(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "Ll", val1, val2)
 
     def _writeS4S4(self, address, cmd, val1, val2):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writeslong(val1)
-            self._writeslong(val2)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "ll", val1, val2)
 
     def _write441(self, address, cmd, val1, val2, val3):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writelong(val2)
-            self._writebyte(val3)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LLB", val1, val2, val3)
 
     def _writeS441(self, address, cmd, val1, val2, val3):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writeslong(val1)
-            self._writelong(val2)
-            self._writebyte(val3)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "lLB", val1, val2, val3)
 
     def _write4S4S4(self, address, cmd, val1, val2, val3):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writeslong(val2)
-            self._writeslong(val3)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "Lll", val1, val2, val3)
 
     def _write4S441(self, address, cmd, val1, val2, val3, val4):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writeslong(val2)
-            self._writelong(val3)
-            self._writebyte(val4)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LlLB", val1, val2, val3, val4)
 
     def _write4444(self, address, cmd, val1, val2, val3, val4):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writelong(val2)
-            self._writelong(val3)
-            self._writelong(val4)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LLLL", val1, val2, val3, val4)
 
     def _write4S44S4(self, address, cmd, val1, val2, val3, val4):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writeslong(val2)
-            self._writelong(val3)
-            self._writeslong(val4)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LlLl", val1, val2, val3, val4)
 
     def _write44441(self, address, cmd, val1, val2, val3, val4, val5):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writelong(val2)
-            self._writelong(val3)
-            self._writelong(val4)
-            self._writebyte(val5)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LLLLB", val1, val2, val3, val4, val5)
 
     def _writeS44S441(self, address, cmd, val1, val2, val3, val4, val5):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writeslong(val1)
-            self._writelong(val2)
-            self._writeslong(val3)
-            self._writelong(val4)
-            self._writebyte(val5)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "lLlLB", val1, val2, val3, val4, val5)
 
     def _write4S44S441(self, address, cmd, val1, val2, val3, val4, val5, val6):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writeslong(val2)
-            self._writelong(val3)
-            self._writeslong(val4)
-            self._writelong(val5)
-            self._writebyte(val6)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LlLlLB", val1, val2, val3, val4, val5, val6)
 
     def _write4S444S441(self, address, cmd, val1, val2, val3, val4, val5, val6, val7):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(self, address, cmd)
-            self._writelong(val1)
-            self._writeslong(val2)
-            self._writelong(val3)
-            self._writelong(val4)
-            self._writeslong(val5)
-            self._writelong(val6)
-            self._writebyte(val7)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LlLLlLB", val1, val2, val3, val4, val5, val6, val7)
 
     def _write4444444(self, address, cmd, val1, val2, val3, val4, val5, val6, val7):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writelong(val2)
-            self._writelong(val3)
-            self._writelong(val4)
-            self._writelong(val5)
-            self._writelong(val6)
-            self._writelong(val7)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LLLLLLL", val1, val2, val3, val4, val5, val6, val7)
 
     def _write444444441(self, address, cmd, val1, val2, val3, val4, val5, val6, val7, val8, val9):
-        trys = self._trystimeout
-        while trys:
-            self._sendcommand(address, cmd)
-            self._writelong(val1)
-            self._writelong(val2)
-            self._writelong(val3)
-            self._writelong(val4)
-            self._writelong(val5)
-            self._writelong(val6)
-            self._writelong(val7)
-            self._writelong(val8)
-            self._writebyte(val9)
-            if self._writechecksum():
-                return True
-            trys = trys - 1
-        return False
+        return self._write(address, cmd, "LLLLLLLLB", val1, val2, val3, val4, val5, val6, val7, val8, val9)
 
     # User accessible functions
     def SendRandomData(self, cnt):
-        for i in range(0, cnt):
-            byte = random.getrandbits(8)
-            # 			self._port.write(chr(byte))
-            self._port.write(byte.to_bytes(1, "big"))
+        self._port.write(bytes(random.getrandbits(8) for i in range(0, cnt)))
         return
 
     def ForwardM1(self, address, val):
@@ -701,6 +459,13 @@ class Roboclaw:
     def ReadEncM2(self, address):
         return self._read4_1(address, self.Cmd.GETM2ENC)
 
+    # Both encoder counts in one round trip: (1, enc1, enc2)
+    def ReadEncoders(self, address):
+        val = self._read(address, self.Cmd.GETENCODERS, "ll")
+        if val is not None:
+            return (1, val[0], val[1])
+        return (0, 0, 0)
+
     def ReadSpeedM1(self, address):
         return self._read4_1(address, self.Cmd.GETM1SPEED)
 
@@ -764,11 +529,11 @@ class Roboclaw:
 
     def SetM1VelocityPID(self, address, p, i, d, qpps):
         # 		return self._write4444(address,self.Cmd.SETM1PID,long(d*65536),long(p*65536),long(i*65536),qpps)
-        return self._write4444(address, self.Cmd.SETM1PID, d * 65536, p * 65536, i * 65536, qpps)
+        return self._write4444(address, self.Cmd.SETM1PID, int(d * 65536), int(p * 65536), int(i * 65536), qpps)
 
     def SetM2VelocityPID(self, address, p, i, d, qpps):
         # 		return self._write4444(address,self.Cmd.SETM2PID,long(d*65536),long(p*65536),long(i*65536),qpps)
-        return self._write4444(address, self.Cmd.SETM2PID, d * 65536, p * 65536, i * 65536, qpps)
+        return self._write4444(address, self.Cmd.SETM2PID, int(d * 65536), int(p * 65536), int(i * 65536), qpps)
 
     def ReadISpeedM1(self, address):
         return self._read4_1(address, self.Cmd.GETM1ISPEED)
@@ -794,6 +559,12 @@ class Roboclaw:
     def SpeedM1M2(self, address, m1, m2):
         return self._writeS4S4(address, self.Cmd.MIXEDSPEED, m1, m2)
 
+    # Pipelined SpeedM1M2 for several controllers sharing one serial link.
+    # commands: [(address, m1, m2), ...]. Takes about one round trip instead of one per controller.
+    def SpeedM1M2Batch(self, commands):
+        frames = [build_frame(address, self.Cmd.MIXEDSPEED, "ll", m1, m2) for address, m1, m2 in commands]
+        return self._write_batch(frames)
+
     def SpeedAccelM1(self, address, accel, speed):
         return self._write4S4(address, self.Cmd.M1SPEEDACCEL, accel, speed)
 
@@ -830,27 +601,15 @@ class Roboclaw:
         return (0, 0, 0)
 
     def ReadPWMs(self, address):
-        val = self._read4(address, self.Cmd.GETPWMS)
-        if val[0]:
-            pwm1 = val[1] >> 16
-            pwm2 = val[1] & 0xFFFF
-            if pwm1 & 0x8000:
-                pwm1 -= 0x10000
-            if pwm2 & 0x8000:
-                pwm2 -= 0x10000
-            return (1, pwm1, pwm2)
+        val = self._read(address, self.Cmd.GETPWMS, "hh")
+        if val is not None:
+            return (1, val[0], val[1])
         return (0, 0, 0)
 
     def ReadCurrents(self, address):
-        val = self._read4(address, self.Cmd.GETCURRENTS)
-        if val[0]:
-            cur1 = val[1] >> 16
-            cur2 = val[1] & 0xFFFF
-            if cur1 & 0x8000:
-                cur1 -= 0x10000
-            if cur2 & 0x8000:
-                cur2 -= 0x10000
-            return (1, cur1, cur2)
+        val = self._read(address, self.Cmd.GETCURRENTS, "hh")
+        if val is not None:
+            return (1, val[0], val[1])
         return (0, 0, 0)
 
     def SpeedAccelM1M2_2(self, address, accel1, speed1, accel2, speed2):
@@ -913,13 +672,13 @@ class Roboclaw:
     def SetM1PositionPID(self, address, kp, ki, kd, kimax, deadzone, min, max):
         # 		return self._write4444444(address,self.Cmd.SETM1POSPID,long(kd*1024),long(kp*1024),long(ki*1024),kimax,deadzone,min,max)
         return self._write4444444(
-            address, self.Cmd.SETM1POSPID, kd * 1024, kp * 1024, ki * 1024, kimax, deadzone, min, max
+            address, self.Cmd.SETM1POSPID, int(kd * 1024), int(kp * 1024), int(ki * 1024), kimax, deadzone, min, max
         )
 
     def SetM2PositionPID(self, address, kp, ki, kd, kimax, deadzone, min, max):
         # 		return self._write4444444(address,self.Cmd.SETM2POSPID,long(kd*1024),long(kp*1024),long(ki*1024),kimax,deadzone,min,max)
         return self._write4444444(
-            address, self.Cmd.SETM2POSPID, kd * 1024, kp * 1024, ki * 1024, kimax, deadzone, min, max
+            address, self.Cmd.SETM2POSPID, int(kd * 1024), int(kp * 1024), int(ki * 1024), kimax, deadzone, min, max
         )
 
     def ReadM1PositionPID(self, address):
@@ -973,23 +732,9 @@ class Roboclaw:
         return self._write111(address, self.Cmd.SETPINFUNCTIONS, S3mode, S4mode, S5mode)
 
     def ReadPinFunctions(self, address):
-        trys = self._trystimeout
-        while 1:
-            self._sendcommand(address, self.Cmd.GETPINFUNCTIONS)
-            val1 = self._readbyte()
-            if val1[0]:
-                val2 = self._readbyte()
-                if val1[0]:
-                    val3 = self._readbyte()
-                    if val1[0]:
-                        crc = self._readchecksumword()
-                        if crc[0]:
-                            if self._crc & 0xFFFF != crc[1] & 0xFFFF:
-                                return (0, 0)
-                            return (1, val1[1], val2[1], val3[1])
-            trys -= 1
-            if trys == 0:
-                break
+        val = self._read(address, self.Cmd.GETPINFUNCTIONS, "BBB")
+        if val is not None:
+            return (1, *val)
         return (0, 0)
 
     def SetDeadBand(self, address, min, max):
@@ -1068,22 +813,9 @@ class Roboclaw:
         return self._read1(address, self.Cmd.GETPWMMODE)
 
     def ReadEeprom(self, address, ee_address):
-        trys = self._trystimeout
-        while 1:
-            self._port.flushInput()
-            self._sendcommand(address, self.Cmd.READEEPROM)
-            self.crc_update(ee_address)
-            self._port.write(chr(ee_address))
-            val1 = self._readword()
-            if val1[0]:
-                crc = self._readchecksumword()
-                if crc[0]:
-                    if self._crc & 0xFFFF != crc[1] & 0xFFFF:
-                        return (0, 0)
-                    return (1, val1[1])
-            trys -= 1
-            if trys == 0:
-                break
+        val = self._read(address, self.Cmd.READEEPROM, "H", bytes((ee_address,)))
+        if val is not None:
+            return (1, val[0])
         return (0, 0)
 
     def WriteEeprom(self, address, ee_address, ee_word):
@@ -1103,7 +835,9 @@ class Roboclaw:
 
     def Open(self):
         try:
-            self._port = serial.Serial(port=self.comport, baudrate=self.rate, timeout=1, interCharTimeout=self.timeout)
+            self._port = serial.Serial(
+                port=self.comport, baudrate=self.rate, timeout=self.read_timeout, interCharTimeout=self.timeout
+            )
         except:
             return 0
         return 1
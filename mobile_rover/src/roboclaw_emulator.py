@@ -0,0 +1,380 @@
+"""
+A software Roboclaw that speaks packet serial on a Linux pseudo-terminal.
+
+- Emulates one or more controllers sharing one serial link, like ADDRESS_LEFT and ADDRESS_RIGHT do
+- Checks the CRC of every packet, acks writes with 0xFF and answers reads with CRC'd replies
+- Speed commands integrate into simulated encoder counts
+- Optionally takes as long as the bytes would take on the wire at the configured baud rate
+- Can drop bytes and corrupt CRCs at random, and delay or withhold a controller's acks, to exercise the
+  driver's retry paths
+- Records when each controller received each write packet, to measure the skew between controllers
+
+Usage:
+    emulator = RoboclawEmulator(addresses=(0x80, 0x81), baud=38400)
+    roboclaw = Roboclaw(emulator.start(), 38400)
+    roboclaw.Open()
+"""
+
+from collections import deque
+import math
+import os
+import pty
+import random
+import select
+import struct
+import threading
+import time
+import tty
+
+import click
+
+from custom_logger import get_logger
+from roboclaw import Roboclaw, crc16
+
+
+logger = get_logger("roboclaw_emulator")
+
+Cmd = Roboclaw.Cmd
+
+# Payload layouts of the write commands the emulator understands
+WRITE_COMMANDS = {
+    Cmd.RESETENC: "",
+    Cmd.SETM1ENCCOUNT: "l",
+    Cmd.SETM2ENCCOUNT: "l",
+    Cmd.M1DUTY: "h",
+    Cmd.M2DUTY: "h",
+    Cmd.MIXEDDUTY: "hh",
+    Cmd.M1SPEED: "l",
+    Cmd.M2SPEED: "l",
+    Cmd.MIXEDSPEED: "ll",
+    Cmd.M1SPEEDACCEL: "Ll",
+    Cmd.M2SPEEDACCEL: "Ll",
+    Cmd.MIXEDSPEEDACCEL: "Lll",
+}
+
+READ_COMMANDS = {
+    Cmd.GETM1ENC,
+    Cmd.GETM2ENC,
+    Cmd.GETENCODERS,
+    Cmd.GETM1SPEED,
+    Cmd.GETM2SPEED,
+    Cmd.GETVERSION,
+    Cmd.GETMBATT,
+    Cmd.GETLBATT,
+    Cmd.GETPWMS,
+    Cmd.GETCURRENTS,
+    Cmd.GETTEMP,
+    Cmd.GETERROR,
+}
+
+# start bit + 8 data bits + stop bit
+BITS_PER_BYTE = 10
+
+# Write packet receive times kept per controller
+PACKET_TIMES_KEPT = 10000
+
+# Full scale speed used to turn duty cycles into speeds, and speeds into currents
+MAX_QPPS = 3000
+
+
+class EmulatedController:
+    """
+    State of one motor controller: two channels with a speed setpoint and an encoder each.
+    """
+
+    def __init__(self, address, now):
+        self.address = address
+        self.speed = [0, 0]  # quadrature pulses per second
+        self.encoder = [0.0, 0.0]
+        self.main_battery = 120  # tenths of a volt
+        self.logic_battery = 50
+        self.temperature = 300  # tenths of a degree C
+        self.last_update = now
+
+    def integrate(self, now):
+        dt = now - self.last_update
+        self.last_update = now
+        for i in range(2):
+            self.encoder[i] += self.speed[i] * dt
+
+    def write(self, cmd, values):
+        if cmd == Cmd.RESETENC:
+            self.encoder = [0.0, 0.0]
+        elif cmd == Cmd.SETM1ENCCOUNT:
+            self.encoder[0] = float(values[0])
+        elif cmd == Cmd.SETM2ENCCOUNT:
+            self.encoder[1] = float(values[0])
+        elif cmd in (Cmd.M1DUTY, Cmd.M2DUTY, Cmd.MIXEDDUTY):
+            channels = {Cmd.M1DUTY: [0], Cmd.M2DUTY: [1], Cmd.MIXEDDUTY: [0, 1]}[cmd]
+            for channel, duty in zip(channels, values):
+                self.speed[channel] = int(duty / 32767 * MAX_QPPS)
+        elif cmd in (Cmd.M1SPEED, Cmd.M1SPEEDACCEL):
+            self.speed[0] = values[-1]
+        elif cmd in (Cmd.M2SPEED, Cmd.M2SPEEDACCEL):
+            self.speed[1] = values[-1]
+        elif cmd in (Cmd.MIXEDSPEED, Cmd.MIXEDSPEEDACCEL):
+            self.speed[0], self.speed[1] = values[-2], values[-1]
+
+    def read(self, cmd) -> bytes:
+        if cmd in (Cmd.GETM1ENC, Cmd.GETM2ENC):
+            channel = cmd - Cmd.GETM1ENC
+            count = int(self.encoder[channel])
+            # Status bit 1: direction
+            status = 0x02 if self.speed[channel] < 0 else 0x00
+            return struct.pack(">lB", count, status)
+        elif cmd == Cmd.GETENCODERS:
+            return struct.pack(">ll", int(self.encoder[0]), int(self.encoder[1]))
+        elif cmd in (Cmd.GETM1SPEED, Cmd.GETM2SPEED):
+            channel = cmd - Cmd.GETM1SPEED
+            speed = self.speed[channel]
+            return struct.pack(">lB", speed, 1 if speed < 0 else 0)
+        elif cmd == Cmd.GETVERSION:
+            return b"USB Roboclaw 2x15a v4.2.8 (emulated)\n\0"
+        elif cmd == Cmd.GETMBATT:
+            return struct.pack(">H", self.main_battery)
+        elif cmd == Cmd.GETLBATT:
+            return struct.pack(">H", self.logic_battery)
+        elif cmd == Cmd.GETPWMS:
+            return struct.pack(">hh", *(int(s / MAX_QPPS * 32767) for s in self.speed))
+        elif cmd == Cmd.GETCURRENTS:
+            # 10 mA units. Idle draw plus a load proportional to speed.
+            return struct.pack(">hh", *(5 + int(abs(s) / MAX_QPPS * 300) for s in self.speed))
+        elif cmd == Cmd.GETTEMP:
+            return struct.pack(">H", self.temperature)
+        elif cmd == Cmd.GETERROR:
+            return struct.pack(">L", 0)
+        raise ValueError(f"Unsupported read command: {cmd}")
+
+
+class RoboclawEmulator:
+    def __init__(
+        self,
+        addresses=(0x80, 0x81),
+        baud=38400,
+        byte_loss=0.0,
+        crc_corruption=0.0,
+        turnaround=0.0005,
+        packet_timeout=0.01,
+        seed=None,
+    ):
+        """
+        baud: emulate time on the wire at this rate. None delivers bytes as fast as the pty allows.
+        byte_loss: probability that any byte, in either direction, is lost.
+        crc_corruption: probability that a packet (either direction) arrives with a bad CRC.
+        turnaround: controller delay between receiving a packet and starting its reply.
+        packet_timeout: a partial packet is discarded after this much silence, like on the real controller.
+        """
+        self.baud = baud
+        self.byte_loss = byte_loss
+        self.crc_corruption = crc_corruption
+        self.turnaround = turnaround
+        self.packet_timeout = packet_timeout
+        self.rng = random.Random(seed)
+        # Extra delay before a controller acks a write (s), by address. math.inf: never ack.
+        self.ack_delays = {}
+
+        now = time.monotonic()
+        self.controllers = {address: EmulatedController(address, now) for address in addresses}
+        # When each controller's valid write packets finished arriving, on the emulated wire (monotonic time)
+        self.packet_times = {address: deque(maxlen=PACKET_TIMES_KEPT) for address in addresses}
+
+        self._master_fd = None
+        self._slave_fd = None
+        self._thread = None
+        self._running = False
+        self._buffer = bytearray()
+        self._last_rx_time = now
+        self._rx_free_time = now  # when the last received byte finished arriving
+        self._tx_free_time = now  # when the reply line is free again
+
+        # Counters
+        self.packets_received = 0
+        self.packets_rejected = 0
+        self.bytes_dropped = 0
+        self.replies_corrupted = 0
+        self.bytes_discarded = 0
+
+    @property
+    def port(self) -> str:
+        return os.ttyname(self._slave_fd)
+
+    def start(self) -> str:
+        """
+        Open the pseudo-terminal, start serving and return the path to open with Roboclaw.
+        """
+        self._master_fd, self._slave_fd = pty.openpty()
+        tty.setraw(self._slave_fd)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="roboclaw_emulator", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Roboclaw emulator on {self.port} for addresses {[hex(a) for a in self.controllers]}")
+        return self.port
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self._master_fd)
+        os.close(self._slave_fd)
+
+    def stats(self) -> dict:
+        return {
+            "packets_received": self.packets_received,
+            "packets_rejected": self.packets_rejected,
+            "bytes_dropped": self.bytes_dropped,
+            "bytes_discarded": self.bytes_discarded,
+            "replies_corrupted": self.replies_corrupted,
+        }
+
+    #
+    # Serial link
+    #
+
+    def _byte_time(self):
+        return BITS_PER_BYTE / self.baud if self.baud else 0.0
+
+    def _run(self):
+        while self._running:
+            readable, _, _ = select.select([self._master_fd], [], [], 0.005)
+            now = time.monotonic()
+
+            if readable:
+                try:
+                    data = os.read(self._master_fd, 1024)
+                except OSError:
+                    continue
+                self._receive(data, now)
+            elif self._buffer and now - self._last_rx_time > self.packet_timeout:
+                # Partial packet followed by silence: the real controller resets its packet state
+                self.bytes_discarded += len(self._buffer)
+                self._buffer.clear()
+
+    def _receive(self, data, now):
+        # Bytes come out of the pty all at once. On the wire they arrive one byte-time apart.
+        byte_time = self._byte_time()
+        start = max(now, self._rx_free_time)
+        for i, byte in enumerate(data):
+            arrival_time = start + (i + 1) * byte_time
+            if self.byte_loss and self.rng.random() < self.byte_loss:
+                self.bytes_dropped += 1
+                continue
+            self._buffer.append(byte)
+            self._parse(arrival_time)
+        self._rx_free_time = start + len(data) * byte_time
+        self._last_rx_time = now
+
+    def _parse(self, arrival_time):
+        """
+        Called after each received byte. Handles a packet as soon as the buffer holds a complete one.
+        """
+        buffer = self._buffer
+        while buffer:
+            address = buffer[0]
+            if address not in self.controllers:
+                # Not addressed to us, or out of sync. Drop a byte and try again.
+                self.bytes_discarded += 1
+                del buffer[0]
+                continue
+            if len(buffer) < 2:
+                return
+
+            cmd = buffer[1]
+            if cmd in READ_COMMANDS:
+                del buffer[:2]
+                self.packets_received += 1
+                self._reply_read(self.controllers[address], bytes((address, cmd)), cmd, arrival_time)
+                continue
+
+            fmt = WRITE_COMMANDS.get(cmd)
+            if fmt is None:
+                self.bytes_discarded += 1
+                del buffer[0]
+                continue
+
+            packet_size = 2 + struct.calcsize(">" + fmt) + 2
+            if len(buffer) < packet_size:
+                return
+
+            packet = bytes(buffer[:packet_size])
+            crc = (packet[-2] << 8) | packet[-1]
+            corrupted = self.crc_corruption and self.rng.random() < self.crc_corruption
+            if corrupted or crc16(packet[:-2]) != crc:
+                # The real controller silently ignores a bad packet. Resync from the next byte.
+                self.packets_rejected += 1
+                del buffer[0]
+                continue
+
+            del buffer[:packet_size]
+            self.packets_received += 1
+            self.packet_times[address].append(arrival_time)
+            controller = self.controllers[address]
+            controller.integrate(time.monotonic())
+            controller.write(cmd, struct.unpack_from(">" + fmt, packet, 2))
+            ack_delay = self.ack_delays.get(address, 0.0)
+            if ack_delay == math.inf:
+                continue
+            if ack_delay:
+                # The line is held up meanwhile, like a controller slow to answer
+                time.sleep(ack_delay)
+            self._send(b"\xff", arrival_time + ack_delay)
+
+    def _reply_read(self, controller, request, cmd, arrival_time):
+        controller.integrate(time.monotonic())
+        data = controller.read(cmd)
+        crc = crc16(data, crc16(request))
+        if self.crc_corruption and self.rng.random() < self.crc_corruption:
+            crc ^= 0x0001
+            self.replies_corrupted += 1
+        self._send(data + crc.to_bytes(2, "big"), arrival_time)
+
+    def _send(self, data, arrival_time):
+        if self.byte_loss:
+            kept = bytearray()
+            for byte in data:
+                if self.rng.random() < self.byte_loss:
+                    self.bytes_dropped += 1
+                else:
+                    kept.append(byte)
+            data = bytes(kept)
+
+        # The reply starts after the turnaround, once the reply line is free, and takes a byte-time per byte
+        start = max(arrival_time + self.turnaround, self._tx_free_time)
+        done = start + len(data) * self._byte_time()
+        self._tx_free_time = done
+        if self.baud:
+            delay = done - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if data:
+            os.write(self._master_fd, data)
+
+
+@click.command()
+@click.option("-b", "--baud", default=38400, help="Baud rate to emulate. 0 for no wire timing.")
+@click.option("--byte-loss", default=0.0, help="Probability of losing each byte")
+@click.option("--crc-corruption", default=0.0, help="Probability of corrupting each packet's CRC")
+@click.option("--seed", default=None, type=int, help="Seed for the fault injection")
+def main(baud, byte_loss, crc_corruption, seed):
+    emulator = RoboclawEmulator(
+        baud=baud or None,
+        byte_loss=byte_loss,
+        crc_corruption=crc_corruption,
+        seed=seed,
+    )
+    port = emulator.start()
+    print(f"Roboclaw emulator running. Open {port} with Roboclaw({port!r}, {baud or 38400}).")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\nShutting down... {emulator.stats()}")
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
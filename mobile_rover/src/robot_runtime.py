@@ -0,0 +1,233 @@
+"""
+Run the robot side of the stack as asyncio tasks of one process, instead of one process per loop.
+
+Tasks:
+- motors: integrates the encoder samples into wheel odometry and publishes it
+- pose: the pose estimator's filter (PoseFilterNode), at --pose-rate
+- mission: the StateMachine driving MobileRobotMagellan, at --rate
+- logger (--log): records the topics to logs/<date>/recording.mlog (see data_logger.py)
+
+The topics between the tasks (pose, cmd_vel, wheel_odometry) use inproc sockets, so they skip the ipc
+hop and cannot be subscribed to from other processes: record them with --log. GPS and cone detections
+still come from sensor_server.py.
+
+The tasks wait on zmq sockets and deadlines without blocking the event loop. The motor backend keeps its
+own serial thread (pyserial only has blocking I/O), and set_motor_speeds() only hands it a setpoint.
+
+SIGINT, SIGTERM, the end of the mission or a failing task cancels every task. The motors are stopped
+and closed once all of them have finished.
+"""
+
+import asyncio
+import datetime
+import os
+import signal
+
+import click
+
+import pub_sub
+from config_manager import encoder_poll_rate, motor_backend
+from custom_logger import get_logger
+from data_logger import Recorder
+from message_log import RECORDING_FILENAME
+from mobile_robot_magellan import MobileRobotMagellan
+from motors import (
+    close_motors,
+    get_motor_backend,
+    get_motor_stats,
+    motors_started,
+    select_motor_backend,
+    stop_motors,
+)
+from odometry import OdometryPublisher
+from pose_estimator import PoseFilterNode
+from profiling import ProfileReporter, enable_profiling, log_profiles
+from pub_sub import (
+    MultiSubscriber,
+    TOPIC_CMD_VEL,
+    TOPIC_IDS,
+    TOPIC_POSE,
+    TOPIC_WHEEL_ODOMETRY,
+    get_publisher_stats,
+    get_publisher_wheel_odometry,
+)
+from state_machine import StateMachine
+from utils.rate_scheduler import RateScheduler
+
+
+logger = get_logger("robot_runtime")
+
+# Topics published and consumed by the tasks of this process
+INTERNAL_TOPICS = (TOPIC_POSE, TOPIC_CMD_VEL, TOPIC_WHEEL_ODOMETRY)
+
+
+async def run_motors(encoder_rate):
+    motor_backend = get_motor_backend()
+    odometry_publisher = OdometryPublisher(motor_backend, get_publisher_wheel_odometry())
+    scheduler = RateScheduler(encoder_rate, name="odometry")
+    last_timestamp = None
+
+    try:
+        while True:
+            sample = motor_backend.read_encoders()
+            if sample is not None and sample[0] != last_timestamp:
+                last_timestamp = sample[0]
+                odometry_publisher.publish_sample(sample)
+            await scheduler.sleep_async()
+    finally:
+        odometry_publisher.publisher.close()
+
+
+async def run_pose_estimator(rate, motion_model):
+    node = PoseFilterNode(rate, motion_model)
+    scheduler = RateScheduler(rate, name="pose_estimator")
+
+    try:
+        while True:
+            node.step()
+            await scheduler.sleep_async()
+    finally:
+        node.close()
+
+
+async def run_mission(rate, mission_filename):
+    # Steps do not wait themselves (period=0): the task waits for their topics without blocking the loop
+    robot = MobileRobotMagellan(period=0)
+    profile_reporter = ProfileReporter(get_publisher_stats())
+
+    try:
+        while robot.pose is None:
+            logger.info("Waiting for pose...")
+            await robot.receiver.wait_async(1.0)
+            pose_msg = robot.pose_subscriber.recv_msg(block=False)
+            if pose_msg is not None:
+                robot.set_pose(pose_msg)
+        logger.info(f"Got pose: {robot.pose}")
+
+        state_machine = StateMachine(robot=robot, mission_filename=mission_filename)
+        # After the setup, so the first deadline is a period away
+        scheduler = RateScheduler(rate, name="magellan")
+        while not state_machine.in_final_state():
+            await robot.receiver.wait_async(scheduler.remaining())
+            state_machine.step()
+            profile_reporter.maybe_publish()
+            await scheduler.sleep_async()
+
+        logger.info(f"Pose stats: {robot.stats()}")
+        logger.info(f"Loop stats: {scheduler.stats()}")
+        robot.visualize_path()
+    finally:
+        log_profiles()
+        profile_reporter.publisher.close()
+        robot.close()
+
+
+async def run_logger(topics, log_directory):
+    recorder = Recorder(topics, os.path.join(log_directory, RECORDING_FILENAME))
+    receiver = MultiSubscriber(recorder.subscribers)
+    logger.info(f"Recording to {recorder.writer.filename}")
+
+    try:
+        while True:
+            time_to_flush = recorder.writer.time_to_flush()
+            await receiver.wait_async(1.0 if time_to_flush is None else time_to_flush, wait_for_all=False)
+            recorder.poll(0)
+    finally:
+        receiver.close()
+        recorder.close()
+
+
+class RobotRuntime:
+    def __init__(self):
+        self.coroutines = []  # (name, coroutine)
+        self._stop_event = None  # type: asyncio.Event
+
+    def add(self, name, coroutine):
+        self.coroutines.append((name, coroutine))
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    async def run(self):
+        """
+        Run the tasks until one of them finishes or fails, or stop() is called. Re-raises a task's error.
+        """
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        tasks = [asyncio.create_task(coroutine, name=name) for name, coroutine in self.coroutines]
+        stop_task = asyncio.create_task(self._stop_event.wait(), name="stop")
+        error = None
+
+        try:
+            done, _ = await asyncio.wait(tasks + [stop_task], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop_task and task.exception() is not None:
+                    logger.error(f"Task {task.get_name()} failed: {task.exception()!r}")
+                    error = error or task.exception()
+                else:
+                    logger.info(f"Task {task.get_name()} finished")
+        finally:
+            logger.info("Shutting down")
+            for task in tasks + [stop_task]:
+                task.cancel()
+            await asyncio.gather(*tasks, stop_task, return_exceptions=True)
+
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+            # Only once nothing can send a new setpoint. If startup failed before the motors were used, there is
+            # nothing to stop: stop_motors() would create the backend and open the serial port.
+            if motors_started():
+                stop_motors()
+            logger.info(f"Motor driver stats: {get_motor_stats()}")
+            close_motors()
+
+        if error is not None:
+            raise error
+
+
+@click.command()
+@click.option("--rate", default=10, help="Mission step rate (Hz)")
+@click.option("--pose-rate", default=50, help="Rate at which to publish the filtered pose (Hz)")
+@click.option(
+    "-m",
+    "--motion-model",
+    type=click.Choice(["odom", "cmd_vel", "both"]),
+    default="both",
+    help="Motion model for the pose filter",
+)
+@click.option("-b", "--backend", default=None, help="Motor backend (roboclaw, sim, null). Defaults to the config.")
+@click.option(
+    "--encoder-rate",
+    default=encoder_poll_rate,
+    help="Rate at which to poll the encoders and publish wheel odometry (Hz)",
+)
+@click.option("--mission", "mission_filename", default="mission.csv", help="Mission CSV file")
+@click.option("--log", "log_data", is_flag=True, default=False, help="Record every topic")
+@click.option("--profile", is_flag=True, help="Time the stages of each step, and publish them on the stats topic")
+def main(rate, pose_rate, motion_model, backend, encoder_rate, mission_filename, log_data, profile):
+    for topic in INTERNAL_TOPICS:
+        pub_sub.pub_sub_transports[topic] = "inproc"
+    # The driver polls the encoders at the rate the odometry is published at
+    select_motor_backend(backend or motor_backend, encoder_rate=encoder_rate)
+    if profile:
+        enable_profiling()
+
+    runtime = RobotRuntime()
+    runtime.add("motors", run_motors(encoder_rate))
+    runtime.add("pose", run_pose_estimator(pose_rate, motion_model))
+    runtime.add("mission", run_mission(rate, mission_filename))
+    if log_data:
+        log_directory = os.path.join("logs", datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+        os.makedirs(log_directory, exist_ok=True)
+        runtime.add("logger", run_logger(tuple(TOPIC_IDS), log_directory))
+
+    asyncio.run(runtime.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Load a recorded run into one pandas DataFrame per topic, and compute its metrics with numpy.
+
+Each frame has a "received" column (the recorder's receive time), a column per message field, and a
+"trace_<hop>" column per traced hop (see tracing.py). Metrics are computed on whole columns:
+
+- gps: fix rate, gaps between fixes, accuracy distribution, heading noise
+- distance travelled, from the poses (or the GPS fixes when no pose was recorded)
+- arrival time at each waypoint of the mission
+- control loop: command period, and latency from the phone fix to the motor setpoint
+
+    python run_analysis.py logs/run_1 --mission mission.csv
+    python run_analysis.py logs/run_1 --export parquet   # or npz
+
+Exported frames (logs/run_1/frames/<topic>.parquet or .npz) load much faster than the recording, and
+load_frames() reads them back. Parquet needs pyarrow; npz only needs numpy.
+"""
+
+import glob
+import importlib.util
+import json
+import os
+
+import click
+import numpy as np
+import pandas as pd
+
+from message_log import MessageLogReader, open_log_directory
+from mission import Mission
+from pub_sub import TOPIC_CMD_VEL, TOPIC_GPS, TOPIC_POSE
+from tracing import HOP_NAMES, HOP_MOTOR_SETPOINT, HOP_PHONE_FIX, hop_name
+from utils.projection import LocalProjection
+
+
+# A gap between GPS fixes longer than this is a dropout (s)
+GPS_GAP = 0.5
+
+# GPS accuracy histogram bucket edges (m)
+ACCURACY_EDGES = (1, 2, 3, 5, 10, 20)
+
+# Distance from a waypoint that counts as arriving (m), as in the state machine
+ARRIVAL_DISTANCE = 1.0
+
+
+def load_run(reader: MessageLogReader) -> dict:
+    """
+    {topic: DataFrame} of every message of a recording.
+    """
+    rows = {}  # type: dict[str, list]
+    for received, topic, message in reader.messages():
+        row = {"received": received}
+        for name in message.FIELDS:
+            row[name] = getattr(message, name)
+        for hop, timestamp in message.trace:
+            row[f"trace_{hop_name(hop)}"] = timestamp
+        rows.setdefault(topic, []).append(row)
+
+    # Missing values (optional fields, untraced hops) are NaN
+    return {topic: pd.DataFrame(topic_rows, dtype="float64") for topic, topic_rows in rows.items()}
+
+
+def save_frames(frames: dict, directory, file_format="parquet"):
+    os.makedirs(directory, exist_ok=True)
+    for topic, frame in frames.items():
+        filename = os.path.join(directory, f"{topic}.{file_format}")
+        if file_format == "parquet":
+            frame.to_parquet(filename, index=False)
+        elif file_format == "npz":
+            np.savez(filename, **{column: frame[column].to_numpy() for column in frame.columns})
+        else:
+            raise ValueError(f"Unknown format: {file_format}")
+
+
+def load_frames(directory) -> dict:
+    frames = {}
+    # Parquet first, when a run was exported in both formats
+    parquet_filenames = sorted(glob.glob(os.path.join(directory, "*.parquet")))
+    npz_filenames = sorted(glob.glob(os.path.join(directory, "*.npz")))
+    for filename in parquet_filenames + npz_filenames:
+        topic, extension = os.path.splitext(os.path.basename(filename))
+        if topic in frames:
+            continue
+        if extension == ".parquet":
+            frames[topic] = pd.read_parquet(filename)
+        else:
+            with np.load(filename) as data:
+                frames[topic] = pd.DataFrame({column: data[column] for column in data.files})
+    return frames
+
+
+def distribution(values) -> dict:
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]).tolist()
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "p50": p50,
+        "p90": p90,
+        "p99": p99,
+        "max": float(values.max()),
+    }
+
+
+def wrap_angle(th):
+    """
+    Angles to (-pi, pi], elementwise.
+    """
+    return np.angle(np.exp(1j * np.asarray(th)))
+
+
+def gps_metrics(gps: pd.DataFrame, gap=GPS_GAP) -> dict:
+    received = gps["received"].to_numpy()
+    gaps = np.diff(received)
+    duration = received[-1] - received[0] if received.size > 1 else 0.0
+
+    accuracy = gps["gps_accuracy"].to_numpy()
+    valid_accuracy = accuracy[accuracy > 0]
+    counts = np.histogram(valid_accuracy, bins=[0, *ACCURACY_EDGES, np.inf])[0]
+    labels = [f"<={edge:g}" for edge in ACCURACY_EDGES] + [f">{ACCURACY_EDGES[-1]:g}"]
+
+    # Heading noise: the spread of the fix to fix heading changes, for the fixes with a valid heading
+    heading_accuracy = gps["heading_accuracy"].to_numpy()
+    valid_heading = heading_accuracy > 0
+    heading = gps["heading"].to_numpy()[valid_heading]
+    heading_changes = wrap_angle(np.diff(heading))
+    # Independent noise on both fixes of a change: sqrt(2) times the noise of one fix
+    heading_noise = np.degrees(heading_changes.std() / np.sqrt(2)) if heading_changes.size > 1 else None
+
+    return {
+        "count": int(received.size),
+        "rate": (received.size - 1) / duration if duration > 0 else None,
+        "gap": distribution(gaps),
+        "dropouts": int(np.count_nonzero(gaps > gap)),
+        "longest_dropout": float(gaps.max()) if gaps.size else None,
+        "invalid_accuracy": int(np.count_nonzero(accuracy <= 0)),
+        "accuracy": distribution(valid_accuracy),
+        "accuracy_histogram_m": {label: int(count) for label, count in zip(labels, counts) if count},
+        "heading_accuracy_deg": distribution(np.degrees(heading_accuracy[valid_heading])),
+        "heading_noise_deg": None if heading_noise is None else float(heading_noise),
+    }
+
+
+def track(frames: dict):
+    """
+    (receive times, x, y) of the robot: the poses, or else the projected GPS fixes.
+    """
+    pose = frames.get(TOPIC_POSE)
+    if pose is not None and len(pose):
+        return pose["received"].to_numpy(), pose["x"].to_numpy(), pose["y"].to_numpy()
+
+    gps = frames[TOPIC_GPS]
+    latitude, longitude = gps["latitude"].to_numpy(), gps["longitude"].to_numpy()
+    projection = LocalProjection(latitude[0], longitude[0])
+    x, y = projection.to_xy_batch(latitude, longitude)
+    return gps["received"].to_numpy(), np.asarray(x), np.asarray(y)
+
+
+def distance_travelled(x, y) -> float:
+    return float(np.hypot(np.diff(x), np.diff(y)).sum())
+
+
+def waypoint_arrivals(received, x, y, mission: Mission, arrival_distance=ARRIVAL_DISTANCE) -> list:
+    """
+    For each waypoint in order, the first time the robot came within `arrival_distance` of it after arriving
+    at the previous one. None from the first waypoint it never reached.
+    """
+    waypoints = [waypoint.gps.to_pose() for waypoint in mission.waypoints]
+    waypoint_x = np.array([waypoint.x for waypoint in waypoints])
+    waypoint_y = np.array([waypoint.y for waypoint in waypoints])
+    # Distance from every point of the track to every waypoint
+    within = np.hypot(x[:, None] - waypoint_x[None, :], y[:, None] - waypoint_y[None, :]) < arrival_distance
+
+    arrivals = []
+    first = 0
+    for i in range(len(waypoints)):
+        hits = np.flatnonzero(within[first:, i])
+        if hits.size == 0:
+            arrivals.extend([None] * (len(waypoints) - i))
+            break
+        first += hits[0]
+        arrivals.append(float(received[first] - received[0]))
+    return arrivals
+
+
+def control_metrics(cmd_vel: pd.DataFrame) -> dict:
+    metrics = {"command_period": distribution(np.diff(cmd_vel["received"].to_numpy()))}
+
+    phone_fix = f"trace_{HOP_NAMES[HOP_PHONE_FIX]}"
+    motor_setpoint = f"trace_{HOP_NAMES[HOP_MOTOR_SETPOINT]}"
+    if phone_fix in cmd_vel and motor_setpoint in cmd_vel:
+        metrics["fix_to_setpoint_latency"] = distribution(cmd_vel[motor_setpoint] - cmd_vel[phone_fix])
+
+    # Latency of each hop, between consecutive traced stages
+    hops = [f"trace_{name}" for name in HOP_NAMES.values() if f"trace_{name}" in cmd_vel]
+    for start, end in zip(hops, hops[1:]):
+        metrics[f"{start[6:]}->{end[6:]}"] = distribution(cmd_vel[end] - cmd_vel[start])
+    return metrics
+
+
+def analyze(frames: dict, mission: Mission = None) -> dict:
+    metrics = {}
+    if TOPIC_GPS in frames:
+        metrics["gps"] = gps_metrics(frames[TOPIC_GPS])
+
+    if TOPIC_POSE in frames or TOPIC_GPS in frames:
+        received, x, y = track(frames)
+        metrics["distance_travelled"] = distance_travelled(x, y)
+        metrics["duration"] = float(received[-1] - received[0])
+        if mission is not None and mission.waypoints:
+            metrics["waypoint_arrivals"] = waypoint_arrivals(received, x, y, mission)
+
+    if TOPIC_CMD_VEL in frames:
+        metrics["control"] = control_metrics(frames[TOPIC_CMD_VEL])
+    return metrics
+
+
+@click.command()
+@click.argument("log_directory")
+@click.option("--mission", "mission_filename", default=None, help="Mission CSV file, for the waypoint arrivals")
+@click.option(
+    "-e", "--export", "file_format", type=click.Choice(["parquet", "npz"]), default=None, help="Export the frames"
+)
+@click.option("-o", "--output", default=None, help="Write the metrics to this JSON file")
+def main(log_directory, mission_filename, file_format, output):
+    frames_directory = os.path.join(log_directory, "frames")
+    frames = load_frames(frames_directory)
+    if not frames:
+        reader = open_log_directory(log_directory)
+        frames = load_run(reader)
+        reader.close()
+
+    if file_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise click.ClickException("Parquet export needs pyarrow (pip install pyarrow). Use --export npz instead.")
+    if file_format is not None:
+        save_frames(frames, frames_directory, file_format)
+        print(f"Frames saved to {frames_directory}")
+
+    mission = None
+    if mission_filename is not None:
+        mission = Mission()
+        mission.load_from_file(mission_filename)
+
+    metrics = analyze(frames, mission)
+    print(json.dumps(metrics, indent=2))
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(metrics, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
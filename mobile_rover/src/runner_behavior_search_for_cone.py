@@ -4,11 +4,11 @@ Run a specific behavior against the physical Magellan Mobile Robot.
 
 import signal
 import sys
-import time
 
 from behaviors import BehaviorType, BehaviorResult
 from mobile_robot_magellan import MobileRobotMagellan
 from motors import stop_motors
+from utils.rate_scheduler import RateScheduler
 
 
 def signal_handler(sig, frame):
@@ -23,11 +23,13 @@ if __name__ == "__main__":
     signal.signal(signal.SIGTERM, signal_handler)
 
     # Create a mobile robot
-    mobile_robot = MobileRobotMagellan()
+    scheduler = RateScheduler(rate, name="search_for_cone")
+    mobile_robot = MobileRobotMagellan(scheduler=scheduler)
     mobile_robot.wait_for_pose()
     mobile_robot.start_behavior(behavior_type=BehaviorType.SEARCH_FOR_CONE)
 
-    # Run the state machine to completion
+    # Run the state machine to completion, on deadlines counted from now rather than from before the setup
+    scheduler.reset()
     while True:
         result = mobile_robot.step()
         if result == BehaviorResult.SUCCESS:
@@ -37,4 +39,6 @@ if __name__ == "__main__":
             print("Error!")
             break
 
-        time.sleep(1 / rate)
+        scheduler.sleep()
+
+    print(f"Loop stats: {scheduler.stats()}")
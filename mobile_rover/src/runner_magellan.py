@@ -4,11 +4,16 @@ Run the State Machine against the physical Magellan Mobile Robot.
 
 import signal
 import sys
-import time
+
+import click
 
 from mobile_robot_magellan import MobileRobotMagellan
-from motors import stop_motors
+from motors import get_motor_stats, stop_motors
+from odometry import start_odometry_publisher
+from profiling import ProfileReporter, enable_profiling, log_profiles
+from pub_sub import get_publisher_stats
 from state_machine import StateMachine
+from utils.rate_scheduler import RateScheduler, set_realtime
 
 
 def signal_handler(sig, frame):
@@ -16,23 +21,54 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-rate = 10
-
-if __name__ == "__main__":
+@click.command()
+@click.option("--rate", default=10, help="Step rate (Hz). With --event-driven, the minimum rate when no data arrives.")
+@click.option("--event-driven", is_flag=True, help="Step as soon as a new pose or cone detection arrives.")
+@click.option("--max-rate", default=50, help="With --event-driven, the maximum step rate (Hz).")
+@click.option("--rt-priority", type=int, default=None, help="Run with SCHED_FIFO at this priority (1-99, needs root).")
+@click.option("--cpus", default=None, help="Pin the process to these CPUs, e.g. 2,3.")
+@click.option("--profile", is_flag=True, help="Time the stages of each step, and publish them on the stats topic.")
+def main(rate, event_driven, max_rate, rt_priority, cpus, profile):
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    # Create a mobile robot
-    mobile_robot = MobileRobotMagellan()
+    if rt_priority is not None or cpus:
+        set_realtime(rt_priority, [int(cpu) for cpu in cpus.split(",")] if cpus else None)
+
+    if profile:
+        enable_profiling()
+    profile_reporter = ProfileReporter(get_publisher_stats())
+
+    # Publish wheel odometry from the encoders, read by the same driver thread that commands the motors
+    odometry_publisher = start_odometry_publisher()
+
+    # Create a mobile robot. At a fixed rate, each step waits for its data until the next deadline at the most.
+    scheduler = None if event_driven else RateScheduler(rate, name="magellan")
+    mobile_robot = MobileRobotMagellan(
+        period=1 / rate, event_driven=event_driven, min_period=1 / max_rate, scheduler=scheduler
+    )
     mobile_robot.wait_for_pose()
 
     # Create a state machine to orchestrate the mission
     state_machine = StateMachine(robot=mobile_robot, mission_filename="mission.csv")
 
-    # Run the state machine to completion
+    # Run the state machine to completion, on deadlines counted from now rather than from before the setup
+    if scheduler is not None:
+        scheduler.reset()
     while not state_machine.in_final_state():
         state_machine.step()
+        profile_reporter.maybe_publish()
+        if scheduler is not None:
+            scheduler.sleep()
 
-        time.sleep(1 / rate)
-
+    odometry_publisher.stop()
+    print(f"Motor driver stats: {get_motor_stats()}")
+    print(f"Pose stats: {mobile_robot.stats()}")
+    if scheduler is not None:
+        print(f"Loop stats: {scheduler.stats()}")
+    log_profiles()
     mobile_robot.visualize_path()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,19 @@ Run the State Machine against the Simulated Mobile Robot.
 import math
 from random import random
 
+from messages import ConeDetectionMessage
 from mobile_robot_sim import MobileRobotSim
+from motors import close_motors, get_motor_stats, select_motor_backend
+from profiling import log_profiles
 from pub_sub import get_publisher_cone_detections
 from state_machine import StateMachine, State
 from utils.gps import GPSCoordinate
 
 
 if __name__ == "__main__":
+    # Drive the Roboclaw emulator through the same motor pipeline as the real robot
+    select_motor_backend("sim")
+
     # Create a starting pose for the robot, and add some noise to it
     j = random() / 10000.0
     robot_init_gps = GPSCoordinate(37.57128 + j, -122.30064 + j)  # Survy's backyard
@@ -31,6 +37,12 @@ if __name__ == "__main__":
         state_machine.step()
 
         if state_machine.state == State.SEARCHING_FOR_CONE:
-            cone_detections_publisher.send_json({})
+            cone_detections_publisher.send_msg(ConeDetectionMessage())
+
+    print(f"Motor stats: {get_motor_stats()}")
+    close_motors()
+
+    # Stage timings, if profiling_enabled is set in config_manager.py
+    log_profiles()
 
     mobile_robot.visualize_path()
@@ -25,8 +25,10 @@ import uvicorn
 
 from config_manager import get_sensor_service_address
 from custom_logger import get_logger
+from messages import ConeDetectionMessage, GPSMessage
 from pub_sub import get_publisher_gps
 from pub_sub import get_publisher_cone_detections
+from tracing import HOP_HTTP_RECEIPT, HOP_PHONE_FIX
 
 
 def signal_handler(sig, frame):
@@ -99,10 +101,12 @@ async def sensor_data(request: Request):
     timestamp_received = time.time()
     data_json = json.loads(data_raw.decode("utf-8"))
     data_gps = gps_from_sensor_frame(data_json)
-    data_gps["timestampReceivedData"] = timestamp_received
     if data_gps is not None:
+        data_gps["timestampReceivedData"] = timestamp_received
         logger.info(f"Sending data: {data_gps}")
-        gps_publisher.send_json(data_gps)
+        gps = GPSMessage.from_dict(data_gps)
+        gps.add_hop(HOP_PHONE_FIX, gps.timestamp).add_hop(HOP_HTTP_RECEIPT, timestamp_received)
+        gps_publisher.send_msg(gps)
 
     return {"status": "OK"}
 
@@ -115,6 +119,7 @@ async def cone_detections(request: Request):
     data_raw = await request.body()
     logger.debug(f"Raw data received on /server_data: {data_raw}")
 
+    timestamp_received = time.time()
     data_json = json.loads(data_raw.decode("utf-8"))
     """
     example_raw_data = {
@@ -141,7 +146,10 @@ async def cone_detections(request: Request):
             largest_detection_area = detection_area
     logger.debug(f"Largest detection: {largest_detection}")
 
-    cone_detections_publisher.send_json(largest_detection)
+    # Frames without a cone are not published: subscribers see no detection
+    if largest_detection is not None:
+        detection = ConeDetectionMessage.from_dict(largest_detection).add_hop(HOP_HTTP_RECEIPT, timestamp_received)
+        cone_detections_publisher.send_msg(detection)
 
     return {"status": "OK"}
 
@@ -14,6 +14,7 @@ from behaviors import BehaviorResult, BehaviorType
 from custom_logger import get_logger
 from mission import Mission
 from mobile_robot_base import MobileRobotBase
+from profiling import get_profiler
 
 
 # TODO: figure out how to enable state machine internal logger
@@ -49,6 +50,7 @@ class StateMachine:
     def __init__(self, robot: MobileRobotBase, mission_filename: str):
         # The entity that the state machine will control
         self.robot = robot
+        self.profiler = get_profiler("state_machine")
         self.mission_filename = mission_filename
         self.mission = None  # type: Mission
 
@@ -178,7 +180,12 @@ class StateMachine:
 
     def step(self):
         # Call the self.step_* method for the current state
-        getattr(self, f"step_{self.state.name}")()
+        state_name = self.state.name
+        t = self.profiler.start()
+        getattr(self, f"step_{state_name}")()
+        self.profiler.lap(state_name, t)
+        if self.state.name != state_name:
+            self.profiler.count("transitions")
 
     #
     # Helpers
@@ -3,6 +3,7 @@ import math
 import unittest
 
 from behaviors import TurnInPlace, BehaviorResult, NavToPose, ApproachCone
+from messages import ConeDetectionMessage
 from utils.gps import Pose
 
 
@@ -65,18 +66,18 @@ class TestApproachCone(unittest.TestCase):
         self.approach_cone = ApproachCone()
 
     def test_approach_cone(self):
-        # Have "receive_json" return a detection in the LEFT half of of the image
-        self.mock__cone_detections_subscriber.receive_json.return_value = {"x": 0.25}
+        # Have "recv_msg" return a detection in the LEFT half of of the image
+        self.mock__cone_detections_subscriber.recv_msg.return_value = ConeDetectionMessage(x=0.25)
         cmd_vel, result = self.approach_cone.step(Pose(0, 0, 0))
         assert cmd_vel.angular_vel > 0
 
-        # Have "receive_json" return a detection in the RIGHT half of of the image
-        self.mock__cone_detections_subscriber.receive_json.return_value = {"x": 0.75}
+        # Have "recv_msg" return a detection in the RIGHT half of of the image
+        self.mock__cone_detections_subscriber.recv_msg.return_value = ConeDetectionMessage(x=0.75)
         cmd_vel, result = self.approach_cone.step(Pose(0, 0, 0))
         assert cmd_vel.angular_vel < 0
 
-        # Have "receive_json" NOT return a detection
-        self.mock__cone_detections_subscriber.receive_json.return_value = None
+        # Have "recv_msg" NOT return a detection
+        self.mock__cone_detections_subscriber.recv_msg.return_value = None
         cmd_vel, result = self.approach_cone.step(Pose(0, 0, 0))
         assert abs(cmd_vel.angular_vel) < 0.01
 
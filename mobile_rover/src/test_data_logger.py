@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from data_logger import Recorder
+from message_log import read_messages
+from messages import CmdVelMessage, GPSMessage, decode_message
+from pub_sub import Publisher, TOPIC_CMD_VEL, TOPIC_GPS, get_endpoint
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.transport_patch = patch.dict("pub_sub.pub_sub_transports", {TOPIC_GPS: "inproc", TOPIC_CMD_VEL: "inproc"})
+        self.transport_patch.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "recording.mlog")
+
+    def tearDown(self):
+        self.transport_patch.stop()
+        self.directory.cleanup()
+
+    def test_records_every_topic_from_one_loop(self):
+        recorder = Recorder((TOPIC_GPS, TOPIC_CMD_VEL), self.filename)
+        gps_publisher = Publisher(get_endpoint(TOPIC_GPS))
+        cmd_vel_publisher = Publisher(get_endpoint(TOPIC_CMD_VEL))
+        time.sleep(0.05)
+
+        gps = GPSMessage(37.57, -122.30, 4.7, 1.29, 0.26, 1718000000.0)
+        cmd_vels = [CmdVelMessage(1718000000.0 + i, 0.5, 0.1) for i in range(10)]
+        gps_publisher.send_msg(gps)
+        for cmd_vel in cmd_vels:
+            cmd_vel_publisher.send_msg(cmd_vel)
+
+        deadline = time.monotonic() + 2
+        while sum(recorder.counts.values()) < 11 and time.monotonic() < deadline:
+            recorder.poll(0.1)
+        recorder.close()
+        gps_publisher.close()
+        cmd_vel_publisher.close()
+
+        self.assertEqual(recorder.counts, {TOPIC_GPS: 1, TOPIC_CMD_VEL: 10})
+        messages = list(read_messages(self.filename))
+        self.assertEqual(
+            [message for _, topic, message in messages if topic == TOPIC_GPS], [decode_message(gps.encode())]
+        )
+        self.assertEqual(
+            [message for _, topic, message in messages if topic == TOPIC_CMD_VEL],
+            [decode_message(cmd_vel.encode()) for cmd_vel in cmd_vels],
+        )
+        received = [received for received, _, _ in messages]
+        self.assertEqual(received, sorted(received))
+
+
+if __name__ == "__main__":
+    unittest.main()
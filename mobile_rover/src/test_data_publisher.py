@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from data_publisher import LogReplayer
+from message_log import MessageLogReader, MessageLogWriter
+from messages import CmdVelMessage, GPSMessage, decode_message
+from pub_sub import TOPIC_CMD_VEL, TOPIC_GPS
+from tracing import HOP_PHONE_FIX
+
+
+class TestLogReplayer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.directory.name, "recording.mlog")
+
+        # GPS every 100 ms, cmd_vel every 50 ms, for 1 s
+        writer = MessageLogWriter(filename)
+        for i in range(20):
+            if i % 2 == 0:
+                gps = GPSMessage(37.57, -122.30, 4.7, 1.29, 0.26, 1000.0 + i * 0.05 - 0.2)
+                writer.write_message(1000.0 + i * 0.05, TOPIC_GPS, gps.add_hop(HOP_PHONE_FIX, gps.timestamp))
+            writer.write_message(1000.0 + i * 0.05 + 0.01, TOPIC_CMD_VEL, CmdVelMessage(1000.0 + i * 0.05, 0.5, 0.1))
+        writer.close()
+        self.reader = MessageLogReader(filename)
+
+    def tearDown(self):
+        self.reader.close()
+        self.directory.cleanup()
+
+    def replay(self, **kwargs):
+        replayer = LogReplayer(self.reader, **kwargs)
+        sent = []
+        replayer.send = lambda topic, data: sent.append((time.monotonic(), topic))
+        return replayer, sent
+
+    def test_merges_topics_with_recorded_gaps(self):
+        replayer, sent = self.replay(speed=2.0)
+        self.assertEqual(replayer.run(), 30)
+
+        self.assertEqual(replayer.published, {TOPIC_GPS: 10, TOPIC_CMD_VEL: 20})
+        self.assertEqual([topic for _, topic in sent[:3]], [TOPIC_GPS, TOPIC_CMD_VEL, TOPIC_CMD_VEL])
+        # 0.96 s of recording at 2x
+        self.assertAlmostEqual(sent[-1][0] - sent[0][0], 0.48, delta=0.03)
+
+    def test_as_fast_as_possible(self):
+        replayer, sent = self.replay(speed=0)
+        start_t = time.monotonic()
+        self.assertEqual(replayer.run(), 30)
+        self.assertLess(time.monotonic() - start_t, 0.2)
+
+    def test_start_and_end_offsets(self):
+        replayer, sent = self.replay(speed=0, topics=[TOPIC_GPS], start=0.2, end=0.5)
+        self.assertEqual(replayer.run(), 4)
+
+    def test_times_are_shifted_to_now(self):
+        replayer = LogReplayer(self.reader, speed=0)
+        sent = []
+        replayer.send = lambda topic, data: sent.append((time.time(), decode_message(data)))
+        replayer.run()
+
+        # As old when published as when it was received
+        published_t, gps = sent[0]
+        self.assertAlmostEqual(published_t - gps.timestamp, 0.2, delta=0.01)
+        self.assertEqual(gps.trace, ((HOP_PHONE_FIX, gps.timestamp),))
+        published_t, cmd_vel = sent[1]
+        self.assertAlmostEqual(published_t - cmd_vel.timestamp, 0.01, delta=0.01)
+
+    def test_original_times(self):
+        replayer, sent = self.replay(speed=0, topics=[TOPIC_GPS], end=0.0, shift_times=False)
+        replayer.send = lambda topic, data: sent.append(decode_message(data))
+        replayer.run()
+        self.assertEqual(sent[0].timestamp, 999.8)
+
+    def test_loop(self):
+        stop_event = threading.Event()
+        replayer, sent = self.replay(speed=0, end=0.1, loop=True)
+        replayer.send = lambda topic, data: sent.append(topic) or (len(sent) >= 12 and stop_event.set())
+
+        replayer.run(stop_event)
+        self.assertEqual(len(sent), 12)
+        self.assertEqual(sent[:4], sent[4:8])
+
+
+if __name__ == "__main__":
+    unittest.main()
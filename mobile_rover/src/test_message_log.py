@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import unittest
+
+from message_log import (
+    RECORD,
+    TRAILER,
+    MessageLogReader,
+    MessageLogWriter,
+    import_data_files,
+    open_log_directory,
+    read_messages,
+)
+from messages import CmdVelMessage, GPSMessage, PoseMessage, decode_message
+from pub_sub import TOPIC_CMD_VEL, TOPIC_GPS, TOPIC_IDS, TOPIC_POSE
+
+
+class TestMessageLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "recording.mlog")
+        # As decoded: some fields are sent as float32
+        self.gps = decode_message(GPSMessage(37.57, -122.30, 4.7, 1.29, 0.26, 1718000000.0).encode())
+        self.cmd_vel = decode_message(CmdVelMessage(1718000000.1, 0.5, 0.1).encode())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_run(self, **kwargs):
+        """
+        GPS at 1 Hz and cmd_vel at 10 Hz for 100 s.
+        """
+        writer = MessageLogWriter(self.filename, **kwargs)
+        for i in range(1000):
+            if i % 10 == 0:
+                writer.write_message(i / 10, TOPIC_GPS, self.gps)
+            writer.write_message(i / 10 + 0.05, TOPIC_CMD_VEL, self.cmd_vel)
+        writer.close()
+
+    def test_round_trip(self):
+        writer = MessageLogWriter(self.filename)
+        writer.write_message(1.0, TOPIC_GPS, self.gps)
+        writer.write_message(2.0, TOPIC_CMD_VEL, self.cmd_vel)
+        writer.close()
+
+        self.assertEqual(
+            list(read_messages(self.filename)), [(1.0, TOPIC_GPS, self.gps), (2.0, TOPIC_CMD_VEL, self.cmd_vel)]
+        )
+        self.assertEqual(
+            list(read_messages(self.filename, topics=(TOPIC_CMD_VEL,))), [(2.0, TOPIC_CMD_VEL, self.cmd_vel)]
+        )
+
+    def test_topics_are_merged_by_time(self):
+        self.write_run(batch_bytes=1024)
+        reader = MessageLogReader(self.filename)
+
+        self.assertTrue(reader.indexed)
+        self.assertGreater(len(reader.chunks[TOPIC_CMD_VEL]), 1)
+        self.assertEqual(reader.count(), 1100)
+        self.assertEqual(reader.count(TOPIC_GPS), 100)
+        received = [received for received, _, _ in reader.records()]
+        self.assertEqual(received, sorted(received))
+        reader.close()
+
+    def test_time_window(self):
+        self.write_run(batch_bytes=1024)
+        reader = MessageLogReader(self.filename)
+
+        records = list(reader.records(start=50.0, end=59.99))
+        self.assertEqual(len(records), 110)
+        self.assertEqual(records[0][:2], (50.0, TOPIC_GPS))
+        self.assertEqual([topic for _, topic, _ in reader.records(topics=(TOPIC_GPS,), start=95)], [TOPIC_GPS] * 5)
+
+        received, topic, message = next(reader.seek(42.0, topics=(TOPIC_CMD_VEL,)))
+        self.assertEqual((received, topic, message), (42.05, TOPIC_CMD_VEL, self.cmd_vel))
+        reader.close()
+
+    def test_only_the_window_is_decompressed(self):
+        self.write_run(batch_bytes=1024)
+        reader = MessageLogReader(self.filename)
+        read_chunks = []
+        read_chunk = reader._read_chunk
+        reader._read_chunk = lambda chunk: read_chunks.append(chunk) or read_chunk(chunk)
+
+        list(reader.records(topics=(TOPIC_CMD_VEL,), start=50.0, end=51.0))
+        self.assertLessEqual(len(read_chunks), 2)
+        self.assertEqual({chunk.topic_id for chunk in read_chunks}, {TOPIC_IDS[TOPIC_CMD_VEL]})
+        reader.close()
+
+    def test_batches_until_size(self):
+        data = self.gps.encode()
+        writer = MessageLogWriter(self.filename, batch_bytes=3 * (RECORD.size + len(data)), batch_interval=60)
+        writer.write(1.0, TOPIC_IDS[TOPIC_GPS], data)
+        writer.write(2.0, TOPIC_IDS[TOPIC_GPS], data)
+        self.assertEqual(len(writer.chunks), 0)
+
+        writer.write(3.0, TOPIC_IDS[TOPIC_GPS], data)
+        self.assertEqual(len(writer.chunks), 1)
+        self.assertEqual(writer.chunks[0].count, 3)
+        writer.close()
+
+    def test_batches_until_interval(self):
+        writer = MessageLogWriter(self.filename, batch_interval=0)
+        self.assertIsNone(writer.time_to_flush())
+        writer.write_message(1.0, TOPIC_GPS, self.gps)
+        self.assertEqual(writer.time_to_flush(), 0)
+
+        writer.maybe_flush()
+        self.assertEqual(len(writer.chunks), 1)
+        self.assertIsNone(writer.time_to_flush())
+        writer.close()
+
+    def test_unclosed_recording(self):
+        self.write_run(batch_bytes=1024)
+        # A crash before the index was written, in the middle of the last chunk
+        reader = MessageLogReader(self.filename)
+        last_chunk = max(chunk.offset for chunks in reader.chunks.values() for chunk in chunks)
+        reader.close()
+        with open(self.filename, "r+b") as f:
+            f.truncate(last_chunk + 10)
+
+        reader = MessageLogReader(self.filename)
+        self.assertFalse(reader.indexed)
+        received = [received for received, _, _ in reader.records()]
+        self.assertGreater(len(received), 0)
+        self.assertLess(len(received), 1100)
+        self.assertEqual(received, sorted(received))
+        reader.close()
+
+    def test_not_a_recording(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"{}\n" + bytes(TRAILER.size))
+        with self.assertRaises(ValueError):
+            MessageLogReader(self.filename)
+
+    def test_import_data_files(self):
+        pose = PoseMessage(1.0, 2.0, 0.5, timestamp=1718000000.5)
+        with open(os.path.join(self.directory.name, "gps.data"), "w") as f:
+            f.write(json.dumps({**self.gps.to_dict(), "timestampReceivedData": 1718000000.2}) + "\n")
+        with open(os.path.join(self.directory.name, "pose.data"), "w") as f:
+            f.write(json.dumps(pose.to_dict()) + "\n")
+
+        self.assertEqual(import_data_files(self.directory.name), 2)
+        reader = open_log_directory(self.directory.name)
+        messages = list(reader.messages())
+        self.assertEqual(
+            [(received, topic) for received, topic, _ in messages],
+            [(1718000000.2, TOPIC_GPS), (1718000000.5, TOPIC_POSE)],
+        )
+        self.assertEqual(messages[1][2].x, 1.0)
+        reader.close()
+
+    def test_import_untimestamped_data_files(self):
+        # As the baseline logger wrote them: GPS with its receive time, poses with only x, y, th
+        with open(os.path.join(self.directory.name, "gps.data"), "w") as f:
+            for i in range(11):
+                f.write(json.dumps({**self.gps.to_dict(), "timestampReceivedData": 1718000000.0 + i}) + "\n")
+        with open(os.path.join(self.directory.name, "pose.data"), "w") as f:
+            for i in range(21):
+                f.write(json.dumps({"x": float(i), "y": 0.0, "th": 0.0}) + "\n")
+
+        self.assertEqual(import_data_files(self.directory.name), 32)
+        reader = open_log_directory(self.directory.name)
+        self.assertEqual((reader.start_time, reader.end_time), (1718000000.0, 1718000010.0))
+        poses = list(reader.messages(topics=(TOPIC_POSE,)))
+        self.assertEqual([received for received, _, _ in poses], [1718000000.0 + i / 2 for i in range(21)])
+        self.assertEqual([message.x for _, _, message in poses], [float(i) for i in range(21)])
+        reader.close()
+
+    def test_import_untimestamped_data_files_alone(self):
+        with open(os.path.join(self.directory.name, "pose.data"), "w") as f:
+            f.write(json.dumps({"x": 1.0, "y": 0.0, "th": 0.0}) + "\n")
+
+        with self.assertLogs("message_log", "WARNING"):
+            self.assertEqual(import_data_files(self.directory.name), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import math
+import unittest
+
+from messages import (
+    CmdVelMessage,
+    ConeDetectionMessage,
+    GPSMessage,
+    HEADER,
+    PoseMessage,
+    SCHEMA_VERSION,
+    TRACE_COUNT,
+    TRACE_HOP,
+    WheelOdometryMessage,
+    decode_message,
+)
+
+
+class TestMessages(unittest.TestCase):
+
+    def test_round_trips(self):
+        messages = [
+            GPSMessage(37.57125784995419, -122.30067882311883, 4.5, 1.25, 0.25, 1718000000.123, 1718000000.456),
+            PoseMessage(565000.125, 4158000.5, 1.5, timestamp=1718000000.123, covariance=[0.5] * 9),
+            ConeDetectionMessage(0.25, 0.5, 0.125, 0.25, 0.875, 1),
+            WheelOdometryMessage(1718000000.123, 1.5, -2.25, 3.0, 0.5, -0.25, [0.125] * 9),
+            CmdVelMessage(1718000000.123, 1.0, -0.5),
+        ]
+        for message in messages:
+            decoded = decode_message(message.encode())
+            self.assertIs(type(decoded), type(message))
+            self.assertEqual(decoded, message)
+
+    def test_doubles_keep_gps_precision(self):
+        gps = GPSMessage(37.57125784995419, -122.30067882311883, timestamp=1718000000.123456)
+        decoded = GPSMessage.decode(gps.encode())
+        self.assertEqual(decoded.latitude, gps.latitude)
+        self.assertEqual(decoded.longitude, gps.longitude)
+        self.assertEqual(decoded.timestamp, gps.timestamp)
+
+    def test_optional_fields(self):
+        decoded = decode_message(PoseMessage(1.0, 2.0, 3.0).encode())
+        self.assertIsNone(decoded.timestamp)
+        self.assertIsNone(decoded.covariance)
+        self.assertEqual(decoded.to_dict(), {"x": 1.0, "y": 2.0, "th": 3.0, "timestamp": None})
+
+    def test_dict_conversion_matches_json_logs(self):
+        data = {
+            "timestamp": 1718000000.0,
+            "longitude": -122.3,
+            "latitude": 37.5,
+            "gpsAccuracy": 4.0,
+            "heading": 1.0,
+            "headingAccuracy": 0.5,
+            "timestampReceivedData": 1718000000.5,
+        }
+        self.assertEqual(GPSMessage.from_dict(data).to_dict(), data)
+
+        detection = ConeDetectionMessage.from_dict({"x": 0.25, "y": 0.5, "width": 0.1, "height": 0.2, "score": 0.9})
+        self.assertEqual(detection.to_dict()["class"], 0)
+
+    def test_version_and_type_are_checked(self):
+        data = bytearray(CmdVelMessage(0.0, 1.0, 0.0).encode())
+        with self.assertRaises(ValueError):
+            PoseMessage.decode(bytes(data))
+
+        data[0] = SCHEMA_VERSION + 1
+        with self.assertRaises(ValueError):
+            decode_message(bytes(data))
+
+        data[0], data[1] = SCHEMA_VERSION, 255
+        with self.assertRaises(ValueError):
+            decode_message(bytes(data))
+
+    def test_sizes(self):
+        self.assertEqual(len(CmdVelMessage(0.0, 0.0, 0.0).encode()), HEADER.size + 8 + 4 + 4 + TRACE_COUNT.size)
+        self.assertEqual(
+            len(PoseMessage(0.0, 0.0, math.pi).encode()), HEADER.size + 4 * 8 + 9 * 4 + TRACE_COUNT.size
+        )
+
+    def test_trace(self):
+        message = GPSMessage(37.5, -122.3).add_hop(1, 1718000000.125).add_hop(2, 1718000000.5)
+        decoded = decode_message(message.encode())
+        self.assertEqual(decoded.trace, ((1, 1718000000.125), (2, 1718000000.5)))
+        self.assertEqual(decoded, message)
+
+        # A new message does not share the trace it was copied from
+        pose = PoseMessage(1.0, 2.0, 3.0)
+        pose.trace = decoded.trace
+        pose.add_hop(3)
+        self.assertEqual(len(decoded.trace), 2)
+
+        with self.assertRaises(ValueError):
+            decode_message(message.encode()[: -TRACE_HOP.size])
+
+    def test_shift_times(self):
+        gps = GPSMessage(37.5, -122.3, timestamp=100.0, timestamp_received=100.5).add_hop(1, 100.0)
+        gps.shift_times(10.0)
+        self.assertEqual((gps.timestamp, gps.timestamp_received, gps.latitude), (110.0, 110.5, 37.5))
+        self.assertEqual(gps.trace, ((1, 110.0),))
+
+        # Missing timestamps stay missing
+        self.assertIsNone(PoseMessage(1.0, 2.0, 3.0).shift_times(10.0).timestamp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from motor_driver import MotorDriver
+
+
+class FakeRoboclaw:
+    def __init__(self, write_time=0.0):
+        self.rate = 38400
+        self.write_time = write_time
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.retry_count = 0
+        self.timeout_count = 0
+        self.crc_error_count = 0
+        self.encoders = {0x80: 0, 0x81: 0}
+
+    def SpeedM1M2(self, address, m1, m2):
+        self.release.wait()
+        time.sleep(self.write_time)
+        self.calls.append((address, m1, m2))
+        return True
+
+    def SpeedM1M2Batch(self, commands):
+        self.release.wait()
+        time.sleep(self.write_time)
+        self.calls.extend(commands)
+        return True
+
+    def ReadEncoders(self, address):
+        self.encoders[address] += 1
+        return (1, self.encoders[address], self.encoders[address])
+
+
+class TestMotorDriver(unittest.TestCase):
+
+    def setUp(self):
+        self.roboclaw = FakeRoboclaw()
+        self.driver = MotorDriver(self.roboclaw, address_right=0x81, address_left=0x80, rate=20)
+        self.driver.start()
+
+    def tearDown(self):
+        self.roboclaw.release.set()
+        self.driver.stop()
+
+    def test_set_speeds_reaches_both_controllers(self):
+        self.driver.set_speeds(1000, -500)
+        self.assertTrue(self.driver.flush(timeout=1))
+        self.assertIn((0x81, 1000, 1000), self.roboclaw.calls)
+        self.assertIn((0x80, -500, -500), self.roboclaw.calls)
+
+    def test_only_newest_setpoint_is_written(self):
+        self.driver.flush(timeout=1)
+
+        # Stall the serial link while several setpoints come in
+        self.roboclaw.release.clear()
+        self.driver.set_speeds(1, 1)
+        time.sleep(0.05)
+        for speed in range(2, 10):
+            self.driver.set_speeds(speed, speed)
+        self.roboclaw.release.set()
+
+        self.assertTrue(self.driver.flush(timeout=1))
+        written = [m1 for address, m1, m2 in self.roboclaw.calls if address == 0x81]
+        self.assertEqual(written[-1], 9)
+        self.assertNotIn(5, written)
+        self.assertGreater(self.driver.stats()["setpoints_coalesced"], 0)
+
+    def test_setpoint_is_refreshed_at_rate(self):
+        self.driver.set_speeds(100, 100)
+        time.sleep(0.3)
+        self.assertGreaterEqual(len(self.roboclaw.calls), 2 * 4)
+
+    def test_sequential_writes(self):
+        self.driver.stop()
+        self.driver = MotorDriver(self.roboclaw, address_right=0x81, address_left=0x80, pipelined=False)
+        self.driver.start()
+
+        self.driver.set_speeds(10, 20)
+        self.assertTrue(self.driver.flush(timeout=1))
+        self.assertEqual(self.roboclaw.calls[-2:], [(0x81, 10, 10), (0x80, 20, 20)])
+
+    def test_encoders_are_polled(self):
+        self.driver.stop()
+        self.driver = MotorDriver(self.roboclaw, address_right=0x81, address_left=0x80, rate=20, encoder_rate=100)
+        self.driver.start()
+
+        seq, sample = self.driver.wait_for_encoders(timeout=1)
+        self.assertIsNotNone(sample)
+        seq, newer = self.driver.wait_for_encoders(seq, timeout=1)
+        self.assertGreater(newer[0], sample[0])
+        self.assertGreater(newer[1], sample[1])
+
+        # Writes still go out while the encoders are being polled
+        self.driver.set_speeds(10, 20)
+        self.assertTrue(self.driver.flush(timeout=1))
+        self.assertIn((0x80, 20, 20), self.roboclaw.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import sys
+import unittest
+
+import motors
+from cmd_vel import CmdVel
+
+
+class TestMotors(unittest.TestCase):
+
+    def tearDown(self):
+        motors.select_motor_backend("null")
+
+    def test_import_does_not_create_a_backend(self):
+        self.assertIsNone(motors._backend)
+
+    def test_null_backend(self):
+        motors.select_motor_backend("null")
+        motors.set_motor_speeds(0.5, -0.5)
+
+        backend = motors.get_motor_backend()
+        self.assertEqual(backend.setpoint, (motors.MAX_SPEED // 2, -motors.MAX_SPEED // 2))
+
+        motors.stop_motors()
+        self.assertEqual(backend.setpoint, (0, 0))
+
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            motors.select_motor_backend("hoverboard")
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "The Roboclaw emulator needs a Linux pseudo-terminal")
+    def test_sim_backend_drives_the_emulator(self):
+        motors.select_motor_backend("sim")
+        motors.set_motor_speeds(0.1, 0.2)
+
+        backend = motors.get_motor_backend()
+        self.assertTrue(backend.motor_driver.flush(timeout=1))
+        self.assertEqual(backend.emulator.controllers[motors.ADDRESS_RIGHT].speed, [300, 300])
+        self.assertEqual(backend.emulator.controllers[motors.ADDRESS_LEFT].speed, [600, 600])
+
+        motors.stop_motors()
+        self.assertEqual(backend.emulator.controllers[motors.ADDRESS_RIGHT].speed, [0, 0])
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "The Roboclaw emulator needs a Linux pseudo-terminal")
+    def test_encoder_rate(self):
+        motors.select_motor_backend("sim", encoder_rate=20)
+        self.assertEqual(motors.get_motor_backend().motor_driver.encoder_period, 1 / 20)
+
+        # Accepted, and ignored, by the backend without encoders
+        motors.select_motor_backend("null", encoder_rate=20)
+        self.assertFalse(motors.motors_started())
+        motors.get_motor_backend()
+        self.assertTrue(motors.motors_started())
+
+    def test_cmd_vel_to_wheel_speeds(self):
+        left_speed, right_speed = motors.cmd_vel_to_wheel_speeds(CmdVel(1.0, 0.0))
+        self.assertAlmostEqual(left_speed, right_speed)
+
+        left_speed, right_speed = motors.cmd_vel_to_wheel_speeds(CmdVel(0.0, 1.0))
+        self.assertAlmostEqual(left_speed, -right_speed)
+        self.assertGreater(right_speed, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
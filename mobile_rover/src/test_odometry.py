@@ -0,0 +1,99 @@
+import math
+import sys
+import time
+import unittest
+
+import motors
+from cmd_vel import CmdVel
+from odometry import OdometryPublisher, WheelOdometry, tick_delta
+
+
+class FakePublisher:
+    def __init__(self):
+        self.messages = []
+
+    def send_msg(self, message):
+        self.messages.append(message)
+
+
+class TestWheelOdometry(unittest.TestCase):
+
+    def setUp(self):
+        self.odometry = WheelOdometry(track_width=1.0, ticks_per_meter=100)
+        self.odometry.update(0.0, 0, 0)
+
+    def test_straight_line(self):
+        self.odometry.update(1.0, 100, 100)
+        self.assertAlmostEqual(self.odometry.x, 1.0)
+        self.assertAlmostEqual(self.odometry.y, 0.0)
+        self.assertAlmostEqual(self.odometry.linear_vel, 1.0)
+        self.assertAlmostEqual(self.odometry.angular_vel, 0.0)
+
+        # Uncertainty grows along the direction of travel
+        self.assertGreater(self.odometry.covariance[0, 0], 0)
+
+    def test_turn_in_place(self):
+        quarter_turn_ticks = int(round(math.pi / 4 * 100))
+        self.odometry.update(1.0, -quarter_turn_ticks, quarter_turn_ticks)
+        self.assertAlmostEqual(self.odometry.th, math.pi / 2, delta=0.02)
+        self.assertAlmostEqual(self.odometry.x, 0.0)
+        self.assertGreater(self.odometry.angular_vel, 0)
+
+    def test_arc_matches_pose_update(self):
+        # Small steps around an arc should track Pose.update with the same CmdVel
+        from utils.gps import Pose
+
+        cmd_vel = CmdVel(1.0, 0.5)
+        left_speed, right_speed = motors.cmd_vel_to_wheel_speeds(cmd_vel)
+        odometry = WheelOdometry()
+        pose = Pose(0, 0, 0)
+        dt = 0.01
+        for i in range(201):
+            odometry.update(i * dt, left_speed * motors.MAX_SPEED * i * dt, right_speed * motors.MAX_SPEED * i * dt)
+            if i:
+                pose.update(cmd_vel, dt)
+
+        self.assertAlmostEqual(odometry.x, pose.x, places=1)
+        self.assertAlmostEqual(odometry.y, pose.y, places=1)
+
+    def test_tick_wrap_around(self):
+        self.assertEqual(tick_delta(-(2**31) + 5, 2**31 - 5), 10)
+        self.assertEqual(tick_delta(10, 20), -10)
+
+    def test_message(self):
+        self.odometry.update(0.5, 10, 10)
+        message = self.odometry.to_message()
+        self.assertEqual(message.timestamp, 0.5)
+        self.assertEqual(len(message.covariance), 9)
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "The Roboclaw emulator needs a Linux pseudo-terminal")
+class TestOdometryPublisher(unittest.TestCase):
+
+    def tearDown(self):
+        motors.select_motor_backend("null")
+
+    def test_publishes_odometry_from_the_emulator(self):
+        motors.select_motor_backend("sim", encoder_rate=100)
+        backend = motors.get_motor_backend()
+        publisher = FakePublisher()
+        odometry_publisher = OdometryPublisher(backend, publisher)
+        odometry_publisher.start()
+
+        # Drive forward at 1 m/s, called the way the control stack does it
+        left_speed, right_speed = motors.cmd_vel_to_wheel_speeds(CmdVel(1.0, 0.0))
+        motors.set_motor_speeds(left_speed, right_speed)
+        time.sleep(0.5)
+        odometry_publisher.stop()
+
+        self.assertGreater(len(publisher.messages), 10)
+        last = publisher.messages[-1]
+        self.assertGreater(last.x, 0.2)
+        self.assertAlmostEqual(last.y, 0.0, places=2)
+        self.assertAlmostEqual(last.linear_vel, 1.0, delta=0.2)
+        timestamps = [message.timestamp for message in publisher.messages]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+
+if __name__ == "__main__":
+    unittest.main()
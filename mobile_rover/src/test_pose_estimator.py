@@ -0,0 +1,103 @@
+import math
+import random
+import unittest
+
+import utm
+
+from messages import GPSMessage, WheelOdometryMessage
+from pose_estimator import PoseEKF, gps_to_pose
+
+
+LAT, LON = 37.7749, -122.4194
+
+
+def make_gps(x=0.0, y=0.0, heading_deg=90.0, gps_accuracy=3.0, heading_accuracy_deg=10.0):
+    """
+    GPS message for a point `x` m east and `y` m north of LAT, LON. heading_deg is a compass heading.
+    """
+    easting, northing, zone_number, zone_letter = utm.from_latlon(LAT, LON)
+    lat, lon = utm.to_latlon(easting + x, northing + y, zone_number, zone_letter)
+    return GPSMessage(lat, lon, gps_accuracy, math.radians(heading_deg), math.radians(heading_accuracy_deg))
+
+
+class TestPoseEKF(unittest.TestCase):
+
+    def setUp(self):
+        self.ekf = PoseEKF()
+        self.ekf.update_gps(make_gps())
+        self.origin = gps_to_pose(make_gps())
+
+    def test_first_fix_initializes(self):
+        self.assertAlmostEqual(self.ekf.state[0], self.origin.x)
+        self.assertAlmostEqual(self.ekf.state[2], 0.0)  # compass east is cartesian 0
+        self.assertAlmostEqual(self.ekf.covariance[0, 0], 9.0)
+
+    def test_noisy_fixes_are_smoothed(self):
+        rng = random.Random(0)
+        for i in range(200):
+            self.ekf.update_gps(make_gps(rng.gauss(0, 3), rng.gauss(0, 3)))
+
+        self.assertLess(abs(self.ekf.state[0] - self.origin.x), 1.0)
+        self.assertLess(abs(self.ekf.state[1] - self.origin.y), 1.0)
+        self.assertLess(self.ekf.covariance[0, 0], 1.0)
+
+    def test_accurate_fixes_weigh_more(self):
+        sloppy = PoseEKF()
+        sloppy.update_gps(make_gps())
+        sloppy.update_gps(make_gps(x=10, gps_accuracy=30))
+
+        self.ekf.update_gps(make_gps(x=10, gps_accuracy=1))
+        self.assertGreater(self.ekf.state[0] - self.origin.x, sloppy.state[0] - self.origin.x)
+
+    def test_invalid_heading_accuracy_is_ignored(self):
+        self.ekf.update_gps(make_gps(heading_deg=180, heading_accuracy_deg=-1))
+        self.assertAlmostEqual(self.ekf.state[2], 0.0)
+        self.assertEqual(self.ekf.heading_updates, 0)
+
+    def test_heading_residual_wraps(self):
+        # Compass 91 deg is cartesian -1 deg: the filter should move to just below 2pi, not through pi
+        self.ekf.update_gps(make_gps(heading_deg=91))
+        self.assertGreater(self.ekf.state[2], math.radians(350))
+
+    def test_predict_cmd_vel(self):
+        for i in range(50):
+            self.ekf.predict_cmd_vel(1.0, 0.0, 0.02)
+        self.assertAlmostEqual(self.ekf.state[0] - self.origin.x, 1.0)
+        self.assertGreater(self.ekf.covariance[0, 0], 9.0)
+
+    def test_predict_odometry_uses_relative_motion(self):
+        # The odometry frame is rotated by 90 degrees from the map frame: only relative motion counts
+        self.ekf.predict_odometry(WheelOdometryMessage(0.0, 5.0, 5.0, math.pi / 2))
+        self.ekf.predict_odometry(WheelOdometryMessage(1.0, 5.0, 7.0, math.pi / 2))
+        self.assertAlmostEqual(self.ekf.state[0] - self.origin.x, 2.0)
+        self.assertAlmostEqual(self.ekf.state[1] - self.origin.y, 0.0)
+
+    def test_late_fix_is_applied_at_its_fix_time(self):
+        # Drive east at 1 m/s, recording the state every 20 ms
+        for i in range(1, 51):
+            self.ekf.predict_cmd_vel(1.0, 0.0, 0.02)
+            self.ekf.record(i * 0.02)
+        self.assertAlmostEqual(self.ekf.state[0] - self.origin.x, 1.0)
+
+        # A fix taken at t=0.7 s arrives at t=1.0 s and agrees with where the robot was then
+        gps = make_gps(x=0.7)
+        gps.timestamp = 0.7
+        self.ekf.update_gps(gps)
+        self.assertAlmostEqual(self.ekf.state[0] - self.origin.x, 1.0, places=1)
+
+        # Without its timestamp the same fix pulls the pose backwards
+        naive = PoseEKF()
+        naive.update_gps(make_gps())
+        naive.predict_cmd_vel(1.0, 0.0, 1.0)
+        naive.covariance = self.ekf.covariance.copy()
+        naive.update_gps(make_gps(x=0.7))
+        self.assertLess(naive.state[0] - self.origin.x, 0.95)
+
+    def test_message(self):
+        message = self.ekf.to_message(123.0)
+        self.assertEqual(message.timestamp, 123.0)
+        self.assertEqual(len(message.covariance), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
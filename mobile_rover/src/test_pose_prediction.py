@@ -0,0 +1,39 @@
+import math
+import unittest
+
+from cmd_vel import CmdVel
+from pose_prediction import CmdVelHistory
+from utils.gps import Pose
+
+
+class TestCmdVelHistory(unittest.TestCase):
+
+    def test_no_commands_keeps_pose(self):
+        predicted = CmdVelHistory().predict(Pose(1, 2, 0), 0.0, 1.0)
+        self.assertEqual((predicted.x, predicted.y), (1, 2))
+
+    def test_predicts_with_commands_in_effect(self):
+        history = CmdVelHistory()
+        history.add(9.0, CmdVel(0.5, 0.0))  # in effect when the pose was valid
+        history.add(10.2, CmdVel(1.0, 0.0))
+
+        pose = Pose(0, 0, 0)
+        predicted = history.predict(pose, 10.0, 10.5)
+        self.assertAlmostEqual(predicted.x, 0.5 * 0.2 + 1.0 * 0.3)
+        self.assertEqual(pose.x, 0)
+
+    def test_turning(self):
+        history = CmdVelHistory()
+        history.add(0.0, CmdVel(0.0, math.pi / 2))
+        predicted = history.predict(Pose(0, 0, 0), 0.0, 1.0)
+        self.assertAlmostEqual(predicted.th, math.pi / 2)
+
+    def test_old_commands_are_dropped(self):
+        history = CmdVelHistory(max_age=1.0)
+        for t in range(10):
+            history.add(float(t), CmdVel(1.0, 0.0))
+        self.assertEqual(len(history.commands), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import time
+import unittest
+
+import profiling
+from profiling import enable_profiling, get_profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def tearDown(self):
+        enable_profiling(False)
+        profiling._profilers.clear()
+
+    def test_off(self):
+        enable_profiling(False)
+        profiler = get_profiler("test")
+        t = profiler.start()
+        t = profiler.lap("stage", t)
+        profiler.count("steps")
+        self.assertIsNone(t)
+        self.assertEqual(profiler.summary(), {"stages": {}, "counters": {}})
+
+    def test_stages(self):
+        enable_profiling()
+        profiler = get_profiler("test")
+        self.assertIs(get_profiler("test"), profiler)
+
+        for _ in range(3):
+            t = profiler.start()
+            time.sleep(0.002)
+            t = profiler.lap("sleep", t)
+            t = profiler.lap("nothing", t)
+            profiler.count("steps")
+
+        summary = profiling.profiles()["test"]
+        self.assertEqual(summary["counters"], {"steps": 3})
+        self.assertEqual(summary["stages"]["sleep"]["count"], 3)
+        self.assertGreaterEqual(summary["stages"]["sleep"]["p50"], 0.002)
+        self.assertLess(summary["stages"]["nothing"]["max"], 0.002)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import utm
+
+from utils import projection
+from utils.gps import GPSCoordinate, GPSPose, Pose
+from utils.projection import LocalProjection
+
+
+ORIGIN = (37.57125784995419, -122.30067882311883)
+
+
+class TestLocalProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.projection = LocalProjection(*ORIGIN)
+
+    def test_matches_utm_over_the_course(self):
+        # About 1 km in every direction
+        for dlat, dlon in [(0, 0), (0.009, 0), (-0.009, 0.011), (0.005, -0.011), (-0.009, -0.011)]:
+            lat, lon = ORIGIN[0] + dlat, ORIGIN[1] + dlon
+            easting, northing, _, _ = utm.from_latlon(lat, lon)
+            x, y = self.projection.to_xy(lat, lon)
+            self.assertLess(abs(x - easting), 1e-3)
+            self.assertLess(abs(y - northing), 1e-3)
+
+            lat2, lon2 = self.projection.to_latlon(easting, northing)
+            self.assertAlmostEqual(lat2, lat, places=8)
+            self.assertAlmostEqual(lon2, lon, places=8)
+
+    def test_batch_matches_scalar(self):
+        lats = ORIGIN[0] + np.linspace(-0.001, 0.001, 5)
+        lons = ORIGIN[1] + np.linspace(0.001, -0.001, 5)
+        xs, ys = self.projection.to_xy_batch(lats, lons)
+        for i in range(5):
+            x, y = self.projection.to_xy(lats[i], lons[i])
+            self.assertAlmostEqual(xs[i], x)
+            self.assertAlmostEqual(ys[i], y)
+
+        lats2, lons2 = self.projection.to_latlon_batch(xs, ys)
+        np.testing.assert_allclose(lats2, lats, atol=1e-9)
+        np.testing.assert_allclose(lons2, lons, atol=1e-9)
+
+    def test_zone_is_picked_from_the_origin(self):
+        self.assertEqual((self.projection.zone_number, self.projection.zone_letter), (10, "S"))
+
+        berlin = LocalProjection(52.52, 13.405)
+        self.assertEqual((berlin.zone_number, berlin.zone_letter), (33, "U"))
+        easting, northing, _, _ = utm.from_latlon(52.521, 13.406)
+        lat, lon = berlin.to_latlon(easting, northing)
+        self.assertAlmostEqual(lat, 52.521, places=8)
+        self.assertAlmostEqual(lon, 13.406, places=8)
+
+
+class TestCachedProjection(unittest.TestCase):
+
+    def tearDown(self):
+        projection._projection = None
+
+    def test_first_conversion_sets_the_origin(self):
+        projection._projection = None
+        pose = GPSCoordinate(*ORIGIN).to_pose()
+        self.assertEqual(projection.get_projection().origin_lat, ORIGIN[0])
+
+        gps = GPSCoordinate.from_pose(Pose(pose.x + 10, pose.y, 0))
+        self.assertGreater(gps.lon, ORIGIN[1])
+        self.assertAlmostEqual(gps.lat, ORIGIN[0], places=5)
+
+    def test_gps_pose_outside_zone_10s(self):
+        projection.set_projection_origin(52.52, 13.405)
+        pose = GPSCoordinate(52.52, 13.405).to_pose()
+        gps_pose = GPSPose(Pose(pose.x, pose.y, 0))
+        self.assertAlmostEqual(gps_pose.lat, 52.52, places=8)
+        self.assertAlmostEqual(gps_pose.lon, 13.405, places=8)
+
+    def test_no_origin(self):
+        projection._projection = None
+        with self.assertRaises(RuntimeError):
+            projection.get_projection()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import asyncio
+import errno
+import os
+import tempfile
+import time
+import unittest
+
+import zmq
+
+from messages import PoseMessage
+from unittest.mock import patch
+
+from pub_sub import (
+    Endpoint,
+    MultiSubscriber,
+    Publisher,
+    Subscriber,
+    TOPIC_CONE_DETECTIONS,
+    TOPIC_POSE,
+    TOPIC_PORTS,
+    close_subscribers,
+    get_context,
+    get_endpoint,
+    get_subscriber,
+)
+
+
+def wait_for_message(publisher, subscriber, message, attempts=100):
+    # Slow joiner: the first messages are dropped until the subscription has gone through
+    for _ in range(attempts):
+        publisher.send_msg(message)
+        received = subscriber.recv_msg()
+        if received is not None:
+            return received
+    return None
+
+
+class TestEndpoints(unittest.TestCase):
+
+    def test_tcp(self):
+        endpoint = get_endpoint(TOPIC_POSE, "tcp")
+        self.assertEqual(endpoint.bind_address, f"tcp://*:{TOPIC_PORTS[TOPIC_POSE]}")
+        self.assertTrue(endpoint.connect_address.endswith(f":{TOPIC_PORTS[TOPIC_POSE]}"))
+
+    def test_ipc_and_inproc(self):
+        self.assertTrue(get_endpoint(TOPIC_POSE, "ipc").bind_address.startswith("ipc://"))
+        self.assertEqual(get_endpoint(TOPIC_POSE, "inproc").connect_address, "inproc://pose")
+
+    def test_invalid_transport(self):
+        with self.assertRaises(ValueError):
+            get_endpoint(TOPIC_POSE, "udp")
+
+
+class TestTransports(unittest.TestCase):
+
+    def round_trip(self, transport):
+        endpoint = get_endpoint(TOPIC_POSE, transport)
+        publisher = Publisher(endpoint)
+        subscriber = Subscriber(endpoint, timeout=10)
+        try:
+            message = PoseMessage(1.0, 2.0, 3.0, timestamp=4.0)
+            self.assertEqual(wait_for_message(publisher, subscriber, message), message)
+        finally:
+            subscriber.close()
+            publisher.close()
+
+    def test_inproc(self):
+        self.round_trip("inproc")
+
+    def test_ipc(self):
+        self.round_trip("ipc")
+
+    def test_bad_message_is_dropped(self):
+        endpoint = get_endpoint(TOPIC_POSE, "inproc")
+        publisher = Publisher(endpoint)
+        subscriber = Subscriber(endpoint, timeout=10, conflate=False)
+        try:
+            message = PoseMessage(1.0, 2.0, 3.0, timestamp=4.0)
+            self.assertEqual(wait_for_message(publisher, subscriber, message), message)
+            subscriber.drain()
+
+            # Truncated, then from another schema version
+            publisher.socket.send(message.encode()[:-3])
+            publisher.socket.send(bytes([0]) + message.encode()[1:])
+            publisher.send_msg(message)
+            with self.assertLogs("pub_sub", "WARNING"):
+                self.assertIsNone(subscriber.recv_msg())
+                self.assertIsNone(subscriber.recv_msg(block=False))
+            self.assertEqual(subscriber.recv_msg(), message)
+            self.assertEqual(subscriber.stats(), {"none_received": 0, "decode_errors": 2})
+        finally:
+            subscriber.close()
+            publisher.close()
+
+    def test_ipc_endpoint_in_use(self):
+        with tempfile.TemporaryDirectory() as directory:
+            address = f"ipc://{os.path.join(directory, TOPIC_POSE)}"
+            endpoint = Endpoint(TOPIC_POSE, "ipc", address, address)
+            publisher = Publisher(endpoint)
+            # libzmq would unlink and rebind the path: the second publisher must fail instead
+            with self.assertRaises(zmq.ZMQError) as error:
+                Publisher(endpoint)
+            self.assertEqual(error.exception.errno, errno.EADDRINUSE)
+
+            publisher.close()
+            Publisher(endpoint).close()
+
+
+class TestSubscriberRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.transport_patch = patch.dict("pub_sub.pub_sub_transports", {TOPIC_CONE_DETECTIONS: "inproc"})
+        self.transport_patch.start()
+        self.publisher = Publisher(get_endpoint(TOPIC_CONE_DETECTIONS))
+
+    def tearDown(self):
+        close_subscribers()
+        self.publisher.close()
+        self.transport_patch.stop()
+
+    def test_same_subscriber(self):
+        subscriber = get_subscriber(TOPIC_CONE_DETECTIONS, timeout=10)
+        self.assertIs(get_subscriber(TOPIC_CONE_DETECTIONS, timeout=10), subscriber)
+        self.assertIs(subscriber.context, get_context())
+        self.assertIs(self.publisher.context, get_context())
+
+    def test_drain(self):
+        subscriber = get_subscriber(TOPIC_CONE_DETECTIONS, timeout=10)
+        message = PoseMessage(1.0, 2.0, 3.0)
+        self.assertIsNotNone(wait_for_message(self.publisher, subscriber, message))
+
+        # A stale message is waiting: a drained hand-out must not return it
+        self.publisher.send_msg(message)
+        time.sleep(0.01)
+        subscriber = get_subscriber(TOPIC_CONE_DETECTIONS, timeout=10, drain=True)
+        self.assertIsNone(subscriber.recv_msg())
+
+
+class TestMultiSubscriber(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = get_endpoint(TOPIC_POSE, "inproc")
+        self.publisher = Publisher(self.endpoint)
+        self.subscriber = Subscriber(self.endpoint, timeout=10)
+        self.receiver = MultiSubscriber([self.subscriber])
+
+    def tearDown(self):
+        self.receiver.close()
+        self.subscriber.close()
+        self.publisher.close()
+
+    def test_deadline(self):
+        start_time = time.monotonic()
+        self.assertEqual(self.receiver.receive(0.05), {})
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.05)
+
+    def test_returns_when_ready(self):
+        message = PoseMessage(1.0, 2.0, 3.0)
+        self.assertIsNotNone(wait_for_message(self.publisher, self.subscriber, message))
+
+        self.publisher.send_msg(message)
+        start_time = time.monotonic()
+        self.assertEqual(self.receiver.receive(1.0), {TOPIC_POSE: message})
+        self.assertLess(time.monotonic() - start_time, 0.5)
+
+    def test_wait_async(self):
+        message = PoseMessage(1.0, 2.0, 3.0)
+        self.assertIsNotNone(wait_for_message(self.publisher, self.subscriber, message))
+
+        async def wait():
+            self.assertEqual(await self.receiver.wait_async(0.05), set())
+            self.publisher.send_msg(message)
+            return await self.receiver.wait_async(1.0)
+
+        self.assertEqual(asyncio.run(wait()), {self.subscriber})
+        self.assertEqual(self.subscriber.recv_msg(block=False), message)
+
+    def test_wait_for_any(self):
+        message = PoseMessage(1.0, 2.0, 3.0)
+        self.assertIsNotNone(wait_for_message(self.publisher, self.subscriber, message))
+
+        # Nothing is published on the second topic: only wait_for_all=False returns early
+        silent_subscriber = Subscriber(get_endpoint(TOPIC_CONE_DETECTIONS, "inproc"))
+        receiver = MultiSubscriber([self.subscriber, silent_subscriber])
+        try:
+            self.publisher.send_msg(message)
+            start_time = time.monotonic()
+            self.assertEqual(receiver.wait(1.0, wait_for_all=False), {self.subscriber})
+            self.assertLess(time.monotonic() - start_time, 0.5)
+        finally:
+            receiver.close()
+            silent_subscriber.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
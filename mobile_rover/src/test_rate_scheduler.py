@@ -0,0 +1,48 @@
+import time
+import unittest
+
+from utils.rate_scheduler import RateScheduler
+
+
+class TestRateScheduler(unittest.TestCase):
+
+    def test_no_drift(self):
+        # The work time is absorbed by the deadlines, not added to the period
+        scheduler = RateScheduler(50)
+        start_time = time.monotonic()
+        for _ in range(20):
+            time.sleep(0.005)
+            scheduler.sleep()
+        elapsed = time.monotonic() - start_time
+
+        # A loaded machine may miss a deadline, which is skipped rather than drifting
+        self.assertAlmostEqual(elapsed, (20 + scheduler.missed_ticks) * 0.02, delta=0.02)
+        self.assertLess(scheduler.actual_period.percentile(50), 0.025)
+
+    def test_overrun(self):
+        scheduler = RateScheduler(100)
+        time.sleep(0.035)
+        scheduler.sleep()
+        self.assertEqual(scheduler.overruns, 1)
+        self.assertEqual(scheduler.missed_ticks, 2)
+
+        # Back on the grid: the next tick is not a burst
+        start_time = time.monotonic()
+        scheduler.sleep()
+        self.assertGreater(time.monotonic() - start_time, 0.001)
+        self.assertEqual(scheduler.overruns, 1)
+
+    def test_reset(self):
+        # Setup ran for several periods after the scheduler was created
+        scheduler = RateScheduler(100)
+        time.sleep(0.035)
+        self.assertEqual(scheduler.remaining(), 0.0)
+
+        scheduler.reset()
+        self.assertGreater(scheduler.remaining(), 0.005)
+        scheduler.sleep()
+        self.assertEqual((scheduler.overruns, scheduler.missed_ticks), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
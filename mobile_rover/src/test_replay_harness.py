@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from message_log import MessageLogReader, MessageLogWriter
+from messages import ConeDetectionMessage, GPSMessage
+from pub_sub import TOPIC_CONE_DETECTIONS, TOPIC_GPS
+from replay_harness import ReplayHarness, diff_runs
+
+
+MISSION_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mission.csv")
+
+
+class TestReplayHarness(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.directory.name, "recording.mlog")
+
+        # 20 s parked next to the first waypoint of mission.csv, with a 5 Hz GPS and a cone in sight
+        writer = MessageLogWriter(filename)
+        for i in range(100):
+            received = 1718000000.0 + i * 0.2
+            gps = GPSMessage(37.571258, -122.300679, 2.0, 0.5, 0.1, received - 0.1, received)
+            writer.write_message(received, TOPIC_GPS, gps)
+            writer.write_message(received + 0.05, TOPIC_CONE_DETECTIONS, ConeDetectionMessage(0.4, 0.5, 0.1, 0.2, 0.9))
+        writer.close()
+        self.reader = MessageLogReader(filename)
+
+    def tearDown(self):
+        self.reader.close()
+        self.directory.cleanup()
+
+    @patch("pub_sub.get_context", side_effect=AssertionError("no sockets offline"))
+    def test_replay(self, mock__get_context):
+        result = ReplayHarness(self.reader, MISSION_FILENAME).run()
+
+        self.assertEqual(
+            [(transition["from"], transition["to"]) for transition in result["transitions"][:4]],
+            [
+                ("START", "IDLING"),
+                ("IDLING", "NAVIGATING_TO_WAYPOINT"),
+                ("NAVIGATING_TO_WAYPOINT", "IDLING"),
+                ("IDLING", "NAVIGATING_TO_WAYPOINT"),
+            ],
+        )
+        self.assertGreater(len(result["cmd_vel"]), 150)
+        self.assertEqual(result["motor_writes"], len(result["cmd_vel"]))
+        self.assertLess(result["wall_time"], result["duration"])
+
+    def test_deterministic(self):
+        first = ReplayHarness(self.reader, MISSION_FILENAME, seed=1).run()
+        second = ReplayHarness(self.reader, MISSION_FILENAME, seed=1).run()
+        self.assertEqual(diff_runs(first, second, tolerance=0), [])
+        self.assertEqual(first["cmd_vel"], second["cmd_vel"])
+
+    def test_diff(self):
+        baseline = ReplayHarness(self.reader, MISSION_FILENAME).run()
+        current = ReplayHarness(self.reader, MISSION_FILENAME, end=10.0).run()
+        current["cmd_vel"][50]["angular_vel"] += 0.1
+
+        differences = diff_runs(baseline, current)
+        self.assertTrue(differences[0].startswith("cmd_vel 50 "))
+        self.assertTrue(differences[-1].startswith("commands: "))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import math
+import struct
+import sys
+import time
+import unittest
+
+from roboclaw import Roboclaw, build_frame, crc16
+
+
+def bitwise_crc16(data):
+    # Reference implementation, as in the Basicmicro python library
+    crc = 0
+    for byte in data:
+        crc = crc ^ (byte << 8)
+        for bit in range(0, 8):
+            if (crc & 0x8000) == 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc = crc << 1
+    return crc & 0xFFFF
+
+
+class FakeSerial:
+    """
+    Records every write and answers reads from a queue of canned bytes.
+    """
+
+    def __init__(self, responses=b""):
+        self.writes = []
+        self.responses = bytearray(responses)
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+    def read(self, size=1):
+        data = bytes(self.responses[:size])
+        del self.responses[:size]
+        return data
+
+    def flushInput(self):
+        pass
+
+
+class TestCRC(unittest.TestCase):
+
+    def test_crc_matches_bitwise_reference(self):
+        for data in [b"", b"\x80", b"\x80\x25", bytes(range(256)), b"\xff" * 17]:
+            self.assertEqual(crc16(data), bitwise_crc16(data))
+
+    def test_crc_update_matches_bitwise_reference(self):
+        roboclaw = Roboclaw("/dev/null", 38400)
+        data = bytes(range(0, 256, 3))
+        roboclaw.crc_clear()
+        for byte in data:
+            roboclaw.crc_update(byte)
+        self.assertEqual(roboclaw._crc, bitwise_crc16(data))
+
+
+class TestFrames(unittest.TestCase):
+
+    def test_build_frame(self):
+        frame = build_frame(0x80, Roboclaw.Cmd.MIXEDSPEED, "ll", 1500, -1500)
+        self.assertEqual(frame[:2], b"\x80\x25")
+        self.assertEqual(frame[2:6], (1500).to_bytes(4, "big"))
+        self.assertEqual(frame[6:10], (-1500).to_bytes(4, "big", signed=True))
+        self.assertEqual(int.from_bytes(frame[10:], "big"), bitwise_crc16(frame[:10]))
+
+    def test_out_of_range_values_wrap_like_the_old_driver(self):
+        # The old driver wrote each byte of a value masked with 0xFF
+        def old_frame(address, cmd, *bytes_):
+            data = bytes((address, cmd, *bytes_))
+            return data + bitwise_crc16(data).to_bytes(2, "big")
+
+        count = -5
+        old_bytes = [(count >> shift) & 0xFF for shift in (24, 16, 8, 0)]
+        roboclaw = Roboclaw("/dev/null", 38400)
+        roboclaw._port = FakeSerial(b"\xff\xff")
+        self.assertTrue(roboclaw.SetEncM1(0x80, count))
+        self.assertTrue(roboclaw.SetEncM2(0x80, count))
+        self.assertEqual(
+            roboclaw._port.writes,
+            [
+                old_frame(0x80, Roboclaw.Cmd.SETM1ENCCOUNT, *old_bytes),
+                old_frame(0x80, Roboclaw.Cmd.SETM2ENCCOUNT, *old_bytes),
+            ],
+        )
+
+        self.assertEqual(build_frame(0x80, 0, "H", -1)[2:4], b"\xff\xff")
+        self.assertEqual(build_frame(0x80, 0, "B", 256 + 7)[2], 7)
+        self.assertEqual(build_frame(0x80, 0, "h", 0xFFFF)[2:4], b"\xff\xff")
+
+    def test_speed_command_is_a_single_write(self):
+        roboclaw = Roboclaw("/dev/null", 38400)
+        roboclaw._port = FakeSerial(b"\xff")
+
+        self.assertTrue(roboclaw.SpeedM1M2(0x81, 3000, -3000))
+        self.assertEqual(roboclaw._port.writes, [build_frame(0x81, Roboclaw.Cmd.MIXEDSPEED, "ll", 3000, -3000)])
+
+    def test_batch_is_one_write_and_one_read(self):
+        roboclaw = Roboclaw("/dev/null", 38400)
+        roboclaw._port = FakeSerial(b"\xff\xff")
+
+        self.assertTrue(roboclaw.SpeedM1M2Batch([(0x81, 100, 100), (0x80, -100, -100)]))
+        self.assertEqual(
+            roboclaw._port.writes,
+            [
+                build_frame(0x81, Roboclaw.Cmd.MIXEDSPEED, "ll", 100, 100)
+                + build_frame(0x80, Roboclaw.Cmd.MIXEDSPEED, "ll", -100, -100)
+            ],
+        )
+
+    def test_batch_is_resent_on_missing_ack(self):
+        roboclaw = Roboclaw("/dev/null", 38400, retries=3)
+        # Only one of the two controllers answers
+        roboclaw._port = FakeSerial(b"\xff")
+
+        self.assertFalse(roboclaw.SpeedM1M2Batch([(0x81, 1, 1), (0x80, 2, 2)]))
+        self.assertEqual(len(roboclaw._port.writes), 3)
+        self.assertEqual(roboclaw.retry_count, 2)
+
+    def test_write_retries_without_ack(self):
+        roboclaw = Roboclaw("/dev/null", 38400, retries=3)
+        roboclaw._port = FakeSerial()
+
+        self.assertFalse(roboclaw.ForwardM1(0x80, 64))
+        self.assertEqual(len(roboclaw._port.writes), 3)
+
+
+def reply(request, fmt, *values):
+    data = struct.pack(">" + fmt, *values)
+    return data + bitwise_crc16(request + data).to_bytes(2, "big")
+
+
+class TestReads(unittest.TestCase):
+
+    def test_read_encoder(self):
+        roboclaw = Roboclaw("/dev/null", 38400)
+        roboclaw._port = FakeSerial(reply(b"\x80\x10", "lB", -123456, 0x02))
+
+        self.assertEqual(roboclaw.ReadEncM1(0x80), (1, -123456, 0x02))
+        self.assertEqual(roboclaw._port.writes, [b"\x80\x10"])
+
+    def test_read_currents_and_voltage(self):
+        roboclaw = Roboclaw("/dev/null", 38400)
+        roboclaw._port = FakeSerial(reply(b"\x81\x31", "hh", 250, -30) + reply(b"\x81\x18", "H", 121))
+
+        self.assertEqual(roboclaw.ReadCurrents(0x81), (1, 250, -30))
+        self.assertEqual(roboclaw.ReadMainBatteryVoltage(0x81), (1, 121))
+
+    def test_read_retries_on_bad_crc(self):
+        roboclaw = Roboclaw("/dev/null", 38400, retries=3)
+        good = reply(b"\x80\x12", "lB", 42, 0)
+        bad = good[:-1] + bytes([good[-1] ^ 0xFF])
+        roboclaw._port = FakeSerial(bad + good)
+
+        self.assertEqual(roboclaw.ReadSpeedM1(0x80), (1, 42, 0))
+        self.assertEqual(len(roboclaw._port.writes), 2)
+
+    def test_read_fails_after_retries(self):
+        roboclaw = Roboclaw("/dev/null", 38400, retries=2)
+        roboclaw._port = FakeSerial()
+
+        self.assertEqual(roboclaw.ReadEncM2(0x80), (0, 0))
+        self.assertEqual(len(roboclaw._port.writes), 2)
+
+    def test_read_n(self):
+        roboclaw = Roboclaw("/dev/null", 38400)
+        roboclaw._port = FakeSerial(reply(b"\x80\x37", "LLLL", 65536, 2 * 65536, 0, 44000))
+
+        self.assertEqual(roboclaw.ReadM1VelocityPID(0x80), [1, 1.0, 2.0, 0.0, 44000])
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "The Roboclaw emulator needs a Linux pseudo-terminal")
+class TestEmulator(unittest.TestCase):
+
+    def setUp(self):
+        from roboclaw_emulator import RoboclawEmulator
+
+        self.emulator = RoboclawEmulator(addresses=(0x80, 0x81), baud=None, seed=0)
+        self.roboclaw = Roboclaw(self.emulator.start(), 38400, read_timeout=0.05)
+        self.assertTrue(self.roboclaw.Open())
+
+    def tearDown(self):
+        self.roboclaw._port.close()
+        self.emulator.stop()
+
+    def test_speed_integrates_into_encoders(self):
+        self.assertTrue(self.roboclaw.SpeedM1M2(0x81, 1000, -1000))
+        time.sleep(0.1)
+
+        self.assertEqual(self.roboclaw.ReadSpeedM1(0x81), (1, 1000, 0))
+        ok, m1, status = self.roboclaw.ReadEncM1(0x81)
+        self.assertEqual(ok, 1)
+        self.assertGreater(m1, 50)
+        ok, m2, status = self.roboclaw.ReadEncM2(0x81)
+        self.assertLess(m2, -50)
+
+        # The other controller on the link did not move
+        self.assertEqual(self.roboclaw.ReadEncM1(0x80), (1, 0, 0))
+
+        ok, enc1, enc2 = self.roboclaw.ReadEncoders(0x81)
+        self.assertEqual(ok, 1)
+        self.assertGreaterEqual(enc1, m1)
+        self.assertLessEqual(enc2, m2)
+
+    def test_batch_acks(self):
+        self.assertTrue(self.roboclaw.SpeedM1M2Batch([(0x81, 10, 10), (0x80, 20, 20)]))
+        self.assertEqual(self.emulator.controllers[0x81].speed, [10, 10])
+        self.assertEqual(self.emulator.controllers[0x80].speed, [20, 20])
+
+    def test_late_batch_ack_is_not_counted_later(self):
+        self.roboclaw._trystimeout = 1
+        commands = [(0x81, 10, 10), (0x80, 20, 20)]
+
+        # The left controller acks after the read timed out
+        self.emulator.ack_delays[0x80] = 0.1
+        self.assertFalse(self.roboclaw.SpeedM1M2Batch(commands))
+        time.sleep(0.15)
+
+        # Its late ack must not stand in for the one it no longer sends
+        self.emulator.ack_delays[0x80] = math.inf
+        self.assertFalse(self.roboclaw.SpeedM1M2Batch(commands))
+
+        del self.emulator.ack_delays[0x80]
+        self.assertTrue(self.roboclaw.SpeedM1M2Batch(commands))
+
+    def test_retries_on_injected_faults(self):
+        self.emulator.crc_corruption = 0.2
+        successes = sum(self.roboclaw.ReadMainBatteryVoltage(0x80)[0] for i in range(50))
+
+        self.assertGreater(self.roboclaw.retry_count, 0)
+        self.assertGreater(self.roboclaw.crc_error_count, 0)
+        self.assertGreaterEqual(successes, 45)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from robot_runtime import RobotRuntime
+
+
+class TestRobotRuntime(unittest.TestCase):
+
+    def setUp(self):
+        self.cleaned_up = []
+
+    async def run_forever(self, name):
+        try:
+            await asyncio.sleep(3600)
+        finally:
+            self.cleaned_up.append(name)
+
+    async def fail(self):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("task failed")
+
+    @patch("robot_runtime.motors_started", return_value=True)
+    @patch("robot_runtime.close_motors")
+    @patch("robot_runtime.stop_motors")
+    def test_failing_task_stops_everything(self, mock__stop_motors, mock__close_motors, mock__motors_started):
+        runtime = RobotRuntime()
+        runtime.add("a", self.run_forever("a"))
+        runtime.add("b", self.run_forever("b"))
+        runtime.add("failing", self.fail())
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(runtime.run())
+
+        self.assertEqual(sorted(self.cleaned_up), ["a", "b"])
+        mock__stop_motors.assert_called_once()
+        mock__close_motors.assert_called_once()
+
+    @patch("robot_runtime.motors_started", return_value=True)
+    @patch("robot_runtime.close_motors")
+    @patch("robot_runtime.stop_motors")
+    def test_stop(self, mock__stop_motors, mock__close_motors, mock__motors_started):
+        runtime = RobotRuntime()
+
+        async def stop_soon():
+            await asyncio.sleep(0.01)
+            # Motors must still be running while the tasks shut down
+            mock__stop_motors.assert_not_called()
+            runtime.stop()
+            await asyncio.sleep(3600)
+
+        runtime.add("a", self.run_forever("a"))
+        runtime.add("stopper", stop_soon())
+        asyncio.run(runtime.run())
+
+        self.assertEqual(self.cleaned_up, ["a"])
+        mock__stop_motors.assert_called_once()
+
+    @patch("robot_runtime.stop_motors")
+    def test_motors_not_started(self, mock__stop_motors):
+        # A task failed before anything used the motors: shutting down must not open them
+        runtime = RobotRuntime()
+        runtime.add("failing", self.fail())
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(runtime.run())
+        mock__stop_motors.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
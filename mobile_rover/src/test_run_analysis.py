@@ -0,0 +1,95 @@
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from message_log import MessageLogReader, MessageLogWriter
+from messages import CmdVelMessage, GPSMessage, PoseMessage
+from mission import Mission
+from pub_sub import TOPIC_CMD_VEL, TOPIC_GPS, TOPIC_POSE
+from run_analysis import analyze, load_frames, load_run, save_frames, waypoint_arrivals
+from tracing import HOP_MOTOR_SETPOINT, HOP_PHONE_FIX
+from utils.gps import GPSWaypoint
+from utils.projection import set_projection_origin
+
+
+START_TIME = 1718000000.0
+
+
+class TestRunAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.directory.name, "recording.mlog")
+
+        # 10 s at 1 m/s along x: GPS at 5 Hz with a 2 s dropout, poses and commands at 10 Hz
+        writer = MessageLogWriter(filename)
+        for i in range(100):
+            received = START_TIME + i * 0.1
+            if i % 2 == 0 and not 40 <= i < 60:
+                heading = 0.1 if i % 4 == 0 else -0.1
+                gps = GPSMessage(37.57, -122.30, 2.0 + i / 100, heading, 0.2, received - 0.2, received - 0.05)
+                writer.write_message(received, TOPIC_GPS, gps)
+            writer.write_message(received, TOPIC_POSE, PoseMessage(i * 0.1, 0.0, 0.0, timestamp=received))
+            cmd_vel = CmdVelMessage(received, 1.0, 0.0).add_hop(HOP_PHONE_FIX, received - 0.3)
+            writer.write_message(received + 0.01, TOPIC_CMD_VEL, cmd_vel.add_hop(HOP_MOTOR_SETPOINT, received))
+        writer.close()
+
+        reader = MessageLogReader(filename)
+        self.frames = load_run(reader)
+        reader.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_frames(self):
+        self.assertEqual(len(self.frames[TOPIC_POSE]), 100)
+        self.assertEqual(len(self.frames[TOPIC_GPS]), 40)
+        self.assertIn("trace_motor_setpoint", self.frames[TOPIC_CMD_VEL])
+        self.assertEqual(self.frames[TOPIC_GPS]["latitude"].dtype, np.float64)
+
+    def test_metrics(self):
+        metrics = analyze(self.frames)
+
+        gps = metrics["gps"]
+        self.assertEqual(gps["count"], 40)
+        self.assertEqual(gps["dropouts"], 1)
+        self.assertAlmostEqual(gps["longest_dropout"], 2.2, places=5)
+        self.assertAlmostEqual(gps["gap"]["p50"], 0.2, places=5)
+        self.assertAlmostEqual(gps["heading_noise_deg"], math.degrees(0.2 / math.sqrt(2)), places=1)
+        self.assertAlmostEqual(metrics["distance_travelled"], 9.9)
+        self.assertAlmostEqual(metrics["control"]["fix_to_setpoint_latency"]["p50"], 0.3, places=5)
+        self.assertAlmostEqual(metrics["control"]["command_period"]["max"], 0.1, places=5)
+
+    def test_waypoint_arrivals(self):
+        set_projection_origin(37.57, -122.30)
+        mission = Mission()
+        mission.waypoints = [
+            GPSWaypoint(37.57, -122.30, "route"),
+            GPSWaypoint(37.57, -122.2999, "route"),  # 8.8 m east
+            GPSWaypoint(37.58, -122.30, "goal"),
+        ]
+        start, end = mission.waypoints[0].gps.to_pose(), mission.waypoints[1].gps.to_pose()
+
+        # There and back in 10 s
+        received = START_TIME + np.arange(100) * 0.1
+        x = np.concatenate([np.linspace(start.x, end.x, 50), np.linspace(end.x, start.x, 50)])
+        arrivals = waypoint_arrivals(received, x, np.full(100, start.y), mission)
+
+        self.assertEqual(arrivals[0], 0.0)
+        self.assertTrue(4.0 < arrivals[1] < 4.9)
+        self.assertIsNone(arrivals[2])
+
+    def test_npz_round_trip(self):
+        directory = os.path.join(self.directory.name, "frames")
+        save_frames(self.frames, directory, "npz")
+        frames = load_frames(directory)
+
+        self.assertEqual(set(frames), set(self.frames))
+        np.testing.assert_array_equal(frames[TOPIC_GPS]["gps_accuracy"], self.frames[TOPIC_GPS]["gps_accuracy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from messages import CmdVelMessage, GPSMessage
+from pose_estimator import PoseEKF, gps_to_pose
+from tracing import (
+    HOP_BEHAVIOR_STEP,
+    HOP_HTTP_RECEIPT,
+    HOP_MOTOR_SETPOINT,
+    HOP_PHONE_FIX,
+    HOP_POSE_PUBLISH,
+    TraceRecorder,
+)
+from utils import projection
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        projection.set_projection_origin(37.5712, -122.3006)
+
+    def test_trace_follows_the_data(self):
+        gps = GPSMessage(37.5712, -122.3006, 3.0, 0.0, 0.1, timestamp=100.0)
+        gps.add_hop(HOP_PHONE_FIX, 100.0).add_hop(HOP_HTTP_RECEIPT, 100.3)
+
+        # Straight through, and through the filter
+        self.assertEqual(gps_to_pose(gps).trace, gps.trace)
+        ekf = PoseEKF()
+        ekf.update_gps(gps)
+        pose = ekf.to_message(100.35).add_hop(HOP_POSE_PUBLISH, 100.35)
+        self.assertEqual([hop for hop, _ in pose.trace], [HOP_PHONE_FIX, HOP_HTTP_RECEIPT, HOP_POSE_PUBLISH])
+        self.assertEqual(len(gps.trace), 2)
+
+    def test_recorder(self):
+        recorder = TraceRecorder(stale_age=1.0)
+        trace = (
+            (HOP_PHONE_FIX, 100.0),
+            (HOP_HTTP_RECEIPT, 100.3),
+            (HOP_POSE_PUBLISH, 100.32),
+            (HOP_BEHAVIOR_STEP, 100.4),
+            (HOP_MOTOR_SETPOINT, 100.401),
+        )
+        self.assertFalse(recorder.record(trace))
+
+        stale = CmdVelMessage(0.0, 0.0, 0.0)
+        stale.trace = trace[:3]
+        stale.add_hop(HOP_BEHAVIOR_STEP, 101.5).add_hop(HOP_MOTOR_SETPOINT, 101.5)
+        self.assertTrue(recorder.record(stale.trace))
+
+        summary = recorder.summary()
+        self.assertEqual(summary["count"], 2)
+        self.assertEqual(summary["stale_count"], 1)
+        self.assertAlmostEqual(summary["hops"]["phone_fix->http_receipt"]["p50"], 0.3)
+        self.assertEqual(summary["hops"]["phone_fix->http_receipt"]["histogram_ms"], {"<=500": 2})
+        self.assertAlmostEqual(summary["end_to_end"]["max"], 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
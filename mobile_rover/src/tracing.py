@@ -0,0 +1,159 @@
+"""
+End-to-end latency of the data behind each motor command.
+
+Every message carries a trace (see messages.py): the time at which each stage handled the data.
+The stages append their hop as the data moves along:
+
+    phone fix -> HTTP receipt (sensor_server) -> pose publish (pose_estimator) -> behavior step -> motor setpoint
+
+The motor setpoint hop is when set_motor_speeds() handed the setpoint to the MotorDriver thread, not when
+it went out on the serial link: the trace leaves out the serial stage. The driver writes the newest setpoint
+at its next cycle, or merges it into a later one. Its stats() cover that stage: setpoint_age (setpoint ->
+start of the write), command_latency (write -> acks) and setpoints_coalesced.
+
+The motor command's CmdVel message carries the whole trace. TraceRecorder aggregates the latency of each
+hop and of the whole chain, and flags the steps that acted on stale data. MobileRobotMagellan records its
+own commands (see its stats()); `python tracing.py` records them from another process.
+"""
+
+import time
+
+import click
+
+from custom_logger import get_logger
+from pub_sub import Subscriber, TOPIC_CMD_VEL, get_endpoint
+from utils.stats import Histogram, SampleStats
+
+
+logger = get_logger("tracing")
+
+HOP_PHONE_FIX = 1
+HOP_HTTP_RECEIPT = 2
+HOP_POSE_PUBLISH = 3
+HOP_BEHAVIOR_STEP = 4
+HOP_MOTOR_SETPOINT = 5
+
+HOP_NAMES = {
+    HOP_PHONE_FIX: "phone_fix",
+    HOP_HTTP_RECEIPT: "http_receipt",
+    HOP_POSE_PUBLISH: "pose_publish",
+    HOP_BEHAVIOR_STEP: "behavior_step",
+    HOP_MOTOR_SETPOINT: "motor_setpoint",
+}
+
+# A command acting on data older than this is stale (s). Past it, pose prediction is capped (pose_prediction.py).
+STALE_AGE = 1.0
+
+# Histogram bucket edges (ms)
+HISTOGRAM_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+def hop_name(hop) -> str:
+    return HOP_NAMES.get(hop, str(hop))
+
+
+def format_trace(trace) -> str:
+    """
+    The hops of a trace, with their time relative to the first one.
+    """
+    if not trace:
+        return "[]"
+    start_time = trace[0][1]
+    return ", ".join(f"{hop_name(hop)} +{(timestamp - start_time) * 1e3:.1f} ms" for hop, timestamp in trace)
+
+
+class HopLatency:
+    def __init__(self):
+        self.stats = SampleStats()
+        self.histogram = Histogram(HISTOGRAM_EDGES_MS)
+
+    def add(self, latency):
+        self.stats.add(latency)
+        self.histogram.add(latency * 1000)
+
+    def summary(self) -> dict:
+        return {**self.stats.summary(), "histogram_ms": self.histogram.buckets()}
+
+
+class TraceRecorder:
+    def __init__(self, stale_age=STALE_AGE):
+        self.stale_age = stale_age
+        self.hops = {}  # type: dict[str, HopLatency]
+        self.end_to_end = HopLatency()
+        self.count = 0
+        self.stale_count = 0
+
+    def record(self, trace) -> bool:
+        """
+        Add the latencies of one trace. Returns True if its data was stale.
+        """
+        self.count += 1
+        if not trace:
+            return False
+
+        for (hop, timestamp), (next_hop, next_timestamp) in zip(trace, trace[1:]):
+            key = f"{hop_name(hop)}->{hop_name(next_hop)}"
+            hop_latency = self.hops.get(key)
+            if hop_latency is None:
+                hop_latency = self.hops[key] = HopLatency()
+            hop_latency.add(next_timestamp - timestamp)
+
+        age = trace[-1][1] - trace[0][1]
+        self.end_to_end.add(age)
+        if age > self.stale_age:
+            self.stale_count += 1
+            return True
+        return False
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "stale_count": self.stale_count,
+            "end_to_end": self.end_to_end.summary(),
+            "hops": {key: hop_latency.summary() for key, hop_latency in self.hops.items()},
+        }
+
+    def log_summary(self):
+        logger.info(f"Traces: {self.count}, stale: {self.stale_count}")
+        for key, hop_latency in list(self.hops.items()) + [("end_to_end", self.end_to_end)]:
+            summary = hop_latency.stats.summary()
+            if "mean" not in summary:
+                continue
+            logger.info(
+                f"{key:>28s}  p50 {summary['p50'] * 1e3:7.1f} ms  p90 {summary['p90'] * 1e3:7.1f} ms  "
+                f"p99 {summary['p99'] * 1e3:7.1f} ms  max {summary['max'] * 1e3:7.1f} ms  "
+                f"{hop_latency.histogram.buckets()}"
+            )
+
+
+@click.command()
+@click.option("-i", "--interval", default=10.0, help="Seconds between summaries")
+@click.option("--stale-age", default=STALE_AGE, help="Age (s) above which a command's data is stale")
+def main(interval, stale_age):
+    """
+    Record the traces of the published motor commands, and log a latency summary periodically.
+    """
+    subscriber = Subscriber(get_endpoint(TOPIC_CMD_VEL), timeout=1000, conflate=False)
+    recorder = TraceRecorder(stale_age)
+    last_summary_time = time.monotonic()
+
+    try:
+        while True:
+            message = subscriber.recv_msg(block=False)
+            if message is None:
+                subscriber.socket.poll(1000)
+            elif recorder.record(message.trace):
+                logger.warning(f"Stale data: {format_trace(message.trace)}")
+
+            if time.monotonic() - last_summary_time > interval:
+                last_summary_time = time.monotonic()
+                recorder.log_summary()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.log_summary()
+        subscriber.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 from __future__ import annotations
 import math
 import re
-import utm
 
 from scipy.spatial import distance
 
 from cmd_vel import CmdVel
 from geometry import normalize_th_2pi
+from utils.projection import get_projection
 
 
 class Pose:
@@ -51,8 +51,7 @@ class GPSCoordinate:
     """
     Represents a GPS latitude and longitude coordinates.
 
-    Note: UTM zone is hard coded to 10S: https://www.dmap.co.uk/utmworld.htm
-          TODO: Generalize to all zones
+    Conversions to and from poses go through the mission's cached projection (utils/projection.py).
     """
 
     def __init__(self, lat, lon):
@@ -60,7 +59,7 @@ class GPSCoordinate:
         self.lon = lon
 
     def to_pose(self) -> Pose:
-        easting, northing, _, _ = utm.from_latlon(self.lat, self.lon)
+        easting, northing = get_projection(self.lat, self.lon).to_xy(self.lat, self.lon)
         return Pose(easting, northing, None)
 
     def __str__(self) -> str:
@@ -68,7 +67,7 @@ class GPSCoordinate:
 
     @staticmethod
     def from_pose(pose) -> GPSCoordinate:
-        lat, lon = utm.to_latlon(pose.x, pose.y, 10, "S")
+        lat, lon = get_projection().to_latlon(pose.x, pose.y)
         return GPSCoordinate(lat, lon)
 
 
@@ -82,7 +81,7 @@ class GPSPose:
     """
 
     def __init__(self, pose: Pose):
-        lat, lon = utm.to_latlon(pose.x, pose.y, 10, "S")
+        lat, lon = get_projection().to_latlon(pose.x, pose.y)
         self.lat = lat
         self.lon = lon
 
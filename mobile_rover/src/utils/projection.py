@@ -0,0 +1,154 @@
+"""
+Fast conversion between GPS coordinates and the planar x, y frame used for poses.
+
+Poses live in UTM easting / northing. Calling utm.from_latlon / utm.to_latlon for every
+message, waypoint and path point is slow, and the inverse needs the UTM zone.
+
+LocalProjection fixes an origin once (the first mission waypoint, or the first fix), picks the
+UTM zone from it, and replaces UTM with its second order Taylor expansion around the origin:
+a handful of multiply-adds per point, for scalars and numpy arrays alike.
+
+- The result is still UTM: processes that picked different origins agree on the frame
+- Error vs utm is well under a millimetre within 1 km of the origin (see bench_projection.py)
+- Everything must stay in the origin's UTM zone, which a Magellan course always does
+
+Usage:
+    set_projection_origin(37.5712, -122.3006)
+    x, y = get_projection().to_xy(lat, lon)
+    xs, ys = get_projection().to_xy(lats, lons)  # numpy arrays
+"""
+
+import numpy as np
+import utm
+
+from custom_logger import get_logger
+
+
+logger = get_logger("projection")
+
+# Finite difference step used to expand UTM around the origin (degrees, about 10 m)
+DERIVATIVE_STEP = 1e-4
+
+
+class LocalProjection:
+    def __init__(self, origin_lat, origin_lon):
+        self.origin_lat = origin_lat
+        self.origin_lon = origin_lon
+        self.zone_number = utm.latlon_to_zone_number(origin_lat, origin_lon)
+        self.zone_letter = utm.latitude_to_zone_letter(origin_lat)
+
+        # UTM at the origin, and its first and second derivatives w.r.t. (lat, lon) in degrees
+        self.origin_x, self.origin_y = self._utm(origin_lat, origin_lon).tolist()
+        h = DERIVATIVE_STEP
+        f = {(i, j): self._utm(origin_lat + i * h, origin_lon + j * h) for i in (-1, 0, 1) for j in (-1, 0, 1)}
+        d_lat = (f[1, 0] - f[-1, 0]) / (2 * h)
+        d_lon = (f[0, 1] - f[0, -1]) / (2 * h)
+        d_lat_lat = (f[1, 0] - 2 * f[0, 0] + f[-1, 0]) / h**2
+        d_lon_lon = (f[0, 1] - 2 * f[0, 0] + f[0, -1]) / h**2
+        d_lat_lon = (f[1, 1] - f[1, -1] - f[-1, 1] + f[-1, -1]) / (4 * h**2)
+
+        # x = origin_x + a_lat * dlat + a_lon * dlon + a_lat_lat * dlat^2 + a_lat_lon * dlat * dlon + a_lon_lon * dlon^2
+        self.a_lat, self.b_lat = d_lat.tolist()
+        self.a_lon, self.b_lon = d_lon.tolist()
+        self.a_lat_lat, self.b_lat_lat = (d_lat_lat / 2).tolist()
+        self.a_lon_lon, self.b_lon_lon = (d_lon_lon / 2).tolist()
+        self.a_lat_lon, self.b_lat_lon = d_lat_lon.tolist()
+
+        # Inverse of the linear part, to start the inverse iteration
+        det = self.a_lat * self.b_lon - self.a_lon * self.b_lat
+        self.inv = (self.b_lon / det, -self.a_lon / det, -self.b_lat / det, self.a_lat / det)
+
+    def _utm(self, lat, lon):
+        easting, northing, _, _ = utm.from_latlon(
+            lat, lon, force_zone_number=self.zone_number, force_zone_letter=self.zone_letter
+        )
+        return np.array([easting, northing])
+
+    def _offsets(self, dlat, dlon):
+        """
+        Offsets from the origin's x, y. Works elementwise on numpy arrays.
+        """
+        dx = (
+            self.a_lat * dlat
+            + self.a_lon * dlon
+            + self.a_lat_lat * dlat * dlat
+            + self.a_lat_lon * dlat * dlon
+            + self.a_lon_lon * dlon * dlon
+        )
+        dy = (
+            self.b_lat * dlat
+            + self.b_lon * dlon
+            + self.b_lat_lat * dlat * dlat
+            + self.b_lat_lon * dlat * dlon
+            + self.b_lon_lon * dlon * dlon
+        )
+        return dx, dy
+
+    def to_xy(self, lat, lon):
+        """
+        GPS coordinates to x (easting), y (northing). Scalars or numpy arrays.
+        """
+        dx, dy = self._offsets(lat - self.origin_lat, lon - self.origin_lon)
+        return self.origin_x + dx, self.origin_y + dy
+
+    def to_latlon(self, x, y, iterations=2):
+        """
+        x, y back to GPS coordinates, by Newton iteration on the expansion. Scalars or numpy arrays.
+        """
+        target_dx = x - self.origin_x
+        target_dy = y - self.origin_y
+        i00, i01, i10, i11 = self.inv
+
+        dlat = i00 * target_dx + i01 * target_dy
+        dlon = i10 * target_dx + i11 * target_dy
+        for _ in range(iterations):
+            dx, dy = self._offsets(dlat, dlon)
+            err_x, err_y = target_dx - dx, target_dy - dy
+
+            # Jacobian of the expansion at the current estimate
+            j00 = self.a_lat + 2 * self.a_lat_lat * dlat + self.a_lat_lon * dlon
+            j01 = self.a_lon + 2 * self.a_lon_lon * dlon + self.a_lat_lon * dlat
+            j10 = self.b_lat + 2 * self.b_lat_lat * dlat + self.b_lat_lon * dlon
+            j11 = self.b_lon + 2 * self.b_lon_lon * dlon + self.b_lat_lon * dlat
+            det = j00 * j11 - j01 * j10
+            dlat = dlat + (j11 * err_x - j01 * err_y) / det
+            dlon = dlon + (-j10 * err_x + j00 * err_y) / det
+
+        return self.origin_lat + dlat, self.origin_lon + dlon
+
+    def to_xy_batch(self, lats, lons):
+        return self.to_xy(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+
+    def to_latlon_batch(self, xs, ys):
+        return self.to_latlon(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+
+    def __str__(self) -> str:
+        return (
+            f"LocalProjection(origin=({self.origin_lat:.6f}, {self.origin_lon:.6f}), "
+            f"zone={self.zone_number}{self.zone_letter})"
+        )
+
+
+_projection = None  # type: LocalProjection
+
+
+def set_projection_origin(lat, lon) -> LocalProjection:
+    """
+    Fix the origin for the mission. Call it once the first waypoint or fix is known.
+    """
+    global _projection
+
+    _projection = LocalProjection(lat, lon)
+    logger.info(f"Projection origin set: {_projection}")
+    return _projection
+
+
+def get_projection(lat=None, lon=None) -> LocalProjection:
+    """
+    The cached projection. If no origin was set yet, (lat, lon) becomes the origin.
+    """
+    if _projection is None:
+        if lat is None or lon is None:
+            raise RuntimeError("No projection origin. Call set_projection_origin() or convert a GPS coordinate first.")
+        return set_projection_origin(lat, lon)
+    return _projection
@@ -0,0 +1,131 @@
+"""
+Fixed-rate loops that do not drift.
+
+Sleeping 1 / rate after the work makes the period work time + sleep. RateScheduler instead sleeps
+until absolute deadlines on the monotonic clock (start + n * period), so the work time is absorbed
+and the loop holds its nominal rate on average. It records:
+
+- overruns: ticks whose work ran past the next deadline. Missed deadlines are skipped, not made up
+  for with a burst of back-to-back iterations
+- jitter: how late the loop woke up after each deadline
+- period: the actual time between ticks
+
+Usage:
+    scheduler = RateScheduler(10)
+    while running:
+        do_work()
+        scheduler.sleep()
+
+In a coroutine, `await scheduler.sleep_async()` paces the loop the same way without blocking the event loop.
+
+set_realtime() optionally gives the process a SCHED_FIFO priority and pins it to CPUs (Linux only).
+"""
+
+import asyncio
+import math
+import os
+import time
+
+from custom_logger import get_logger
+from utils.stats import SampleStats
+
+
+logger = get_logger("rate_scheduler")
+
+
+class RateScheduler:
+    def __init__(self, rate, name="loop"):
+        self.name = name
+        self.period = 1 / rate
+        self.reset()
+
+    def reset(self):
+        """
+        Start over from now: the first deadline one period away, and empty stats. Call it right before the loop
+        when setup (waiting for a pose, loading a mission) ran after the scheduler was created.
+        """
+        self.next_deadline = time.monotonic() + self.period
+        self.last_tick = None
+
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.jitter = SampleStats()
+        self.actual_period = SampleStats()
+
+    def remaining(self) -> float:
+        """
+        Seconds until the next deadline, 0 if it has passed.
+        """
+        return max(self.next_deadline - time.monotonic(), 0.0)
+
+    def sleep(self):
+        """
+        Sleep until the next deadline, then move the deadline one period on.
+        """
+        time.sleep(self._delay())
+        self._tick()
+
+    async def sleep_async(self):
+        await asyncio.sleep(self._delay())
+        self._tick()
+
+    def _delay(self) -> float:
+        now = time.monotonic()
+        if now > self.next_deadline:
+            # Overran: wake on the next deadline still ahead
+            self.overruns += 1
+            missed = math.floor((now - self.next_deadline) / self.period)
+            self.missed_ticks += missed
+            self.next_deadline += missed * self.period
+            return 0.0
+        return self.next_deadline - now
+
+    def _tick(self):
+        tick = time.monotonic()
+        self.jitter.add(max(tick - self.next_deadline, 0.0))
+        if self.last_tick is not None:
+            self.actual_period.add(tick - self.last_tick)
+        self.last_tick = tick
+        self.next_deadline += self.period
+
+    def stats(self) -> dict:
+        return {
+            "rate": 1 / self.period,
+            "overruns": self.overruns,
+            "missed_ticks": self.missed_ticks,
+            "jitter": self.jitter.summary(),
+            "period": self.actual_period.summary(),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"RateScheduler({self.name}, {1 / self.period:g} Hz, overruns={self.overruns}, "
+            f"missed_ticks={self.missed_ticks}, jitter={self.jitter})"
+        )
+
+
+def set_realtime(priority=None, cpus=None) -> bool:
+    """
+    Run this process with SCHED_FIFO at `priority` (1-99) and/or pin it to the `cpus` set.
+
+    Needs root or CAP_SYS_NICE for the priority. Returns False, with a warning, when something could not be applied.
+    """
+    applied = True
+
+    if priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            logger.info(f"Real-time priority set: SCHED_FIFO {priority}")
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not set real-time priority {priority}: {e}")
+            applied = False
+
+    if cpus:
+        try:
+            os.sched_setaffinity(0, set(cpus))
+            logger.info(f"CPU affinity set: {sorted(cpus)}")
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not set CPU affinity {sorted(cpus)}: {e}")
+            applied = False
+
+    return applied
@@ -0,0 +1,84 @@
+import bisect
+from collections import deque
+import math
+
+
+def percentile(ordered, p):
+    """
+    Nearest-rank percentile of an already sorted, non-empty sequence.
+    """
+    idx = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+class SampleStats:
+    """
+    Keeps the most recent samples of a measurement (latency, period, ...) and summarizes them.
+
+    count and max cover every sample ever added. Mean and percentiles cover the last `maxlen` samples.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+        self.max = None
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        return percentile(sorted(self.samples), p)
+
+    def mean(self):
+        if not self.samples:
+            return None
+        return sum(self.samples) / len(self.samples)
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"count": self.count}
+
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "mean": sum(ordered) / len(ordered),
+            "p50": percentile(ordered, 50),
+            "p90": percentile(ordered, 90),
+            "p99": percentile(ordered, 99),
+            "max": self.max,
+        }
+
+    def __str__(self) -> str:
+        summary = self.summary()
+        if "mean" not in summary:
+            return "SampleStats(count=0)"
+        return (
+            f"SampleStats(count={summary['count']}, mean={summary['mean']:.4f}, p50={summary['p50']:.4f}, "
+            f"p90={summary['p90']:.4f}, p99={summary['p99']:.4f}, max={summary['max']:.4f})"
+        )
+
+
+class Histogram:
+    """
+    Counts of samples per bucket. A sample goes in the first bucket whose upper edge is >= it,
+    or in the overflow bucket.
+    """
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+
+    def buckets(self) -> dict:
+        """
+        {"<=edge": count, ..., ">last edge": count}, for the non-empty buckets.
+        """
+        labels = [f"<={edge:g}" for edge in self.edges] + [f">{self.edges[-1]:g}"]
+        return {label: count for label, count in zip(labels, self.counts) if count}